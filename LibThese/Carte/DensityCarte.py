@@ -11,6 +11,11 @@ import numexpr           as ne
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from InitialCond.Gadget      import Gadget
 from ..Utils.Histo         import Histogram
+from ..Utils               import Binned as bn
+from .                     import Deposit as dp
+from ..Gadget              import Spatial as sp
+from ..Gadget              import Center as ce
+from ..Utils               import Derived as dv
 
 __all__ = [
     "Map",
@@ -63,6 +68,25 @@ class Map(Gadget):
         else:
             move_vel = None
 
+        if "method" in kwargs:
+            self.method = kwargs["method"]
+            del kwargs["method"]
+        else:
+            self.method = "ngp"
+
+        if "nb_neighbours" in kwargs:
+            self.nb_neighbours = kwargs["nb_neighbours"]
+            del kwargs["nb_neighbours"]
+        else:
+            self.nb_neighbours = 32
+
+        if "index" in kwargs:
+            self.use_index = kwargs["index"]
+            del kwargs["index"]
+        else:
+            self.use_index = False
+        self._index = None
+
         if "to_center" in kwargs:
             to_center = kwargs["to_center"]
             del kwargs["to_center"]
@@ -82,16 +106,42 @@ class Map(Gadget):
         else:
             raise ValueError("File format not recognized!")
 
-        if to_center:
+        # Translations appliquées aux particules, pour la clé partagée avec les autres analyses (cf. Utils.Derived) :
+        self._file = args[0] if args and isinstance(args[0], str) else None
+        shift      = [ np.zeros(3), np.zeros(3) ]
+
+        if to_center in ce.methods:
+            # Centre natif (cf. Gadget.Center), sans passer par Verif, réutilisé d'une carte à l'autre :
+            cen, vcen = ce.find_center(self.Part.NumpyPositions, self.Part.NumpyVelocities, method=to_center, key=self._particle_key())
+            self.Part.Translate(-cen)
+            self.Part.AddVelocity(-vcen)
+            shift[0] -= cen
+            shift[1] -= vcen
+        elif to_center:
             self.Part.Translate([-self.BoxSize/2.0]*3)
+            shift[0] -= self.BoxSize/2.0
 
         if move_pos is not None:
             self.Part.Translate(move_pos)
+            shift[0] += np.ravel(move_pos)
         if move_vel is not None:
             self.Part.AddVelocity(move_vel)
+            shift[1] += np.ravel(move_vel)
+
+        self._shift = tuple(shift)
 
         self.CreateMap()
 
+    def _particle_key(self, shift=(None, None)):
+        """Clé des particules lues (cf. Utils.Derived.particle_key), None si elles ne viennent pas d'un fichier.
+        """
+        if self._file is None:
+            return None
+        try:
+            return dv.particle_key(self._file, shift=shift)
+        except OSError:
+            return None
+
     @staticmethod
     def GetPermutation(liste):
         tlist = dict()
@@ -107,29 +157,93 @@ class Map(Gadget):
     def SelectFromRadius(x, y, z, r):
         return ne.evaluate("sqrt( x**2 + y**2 + z**2 ) <= r ")
 
-    def CreateMap(self):
+    @property
+    def index(self):
+        """Index spatial (cf. Gadget.Spatial) des positions, ou des vitesses avec use_vit, construit une seule fois.
+        """
+        if self._index is None:
+            tmp = self.Part.NumpyVelocities if self.use_vit else self.Part.NumpyPositions
+            # Partagé, par la clé des particules, avec les autres cartes du même snapshot :
+            key = self._particle_key(self._shift)
+            if key is not None and self.use_vit:
+                key += ("velocities",)
+            self._index = sp.spatial_index(tmp, key=key)
+        return self._index
+
+    def _coords(self):
         if self.use_vit:
-            if self._r_select is not None:
-                tmp = self.Part.NumpyVelocities
-                tmp = tmp[ self.SelectFromRadius( tmp[:, 0], tmp[:, 1], tmp[:, 2], self._r_select ) ]
-            else:
-                tmp = self.Part.NumpyVelocities
+            tmp = self.Part.NumpyVelocities
         else:
-            if self._r_select is not None:
-                tmp = self.Part.NumpyPositions
-                tmp = tmp[ self.SelectFromRadius( tmp[:, 0], tmp[:, 1], tmp[:, 2], self._r_select ) ]
-            else:
-                tmp = self.Part.NumpyPositions
+            tmp = self.Part.NumpyPositions
+
+        if self._r_select is not None and self.use_index:
+            self._select = np.sort(self.index.sphere([0., 0., 0.], self._r_select))
+            tmp = tmp[ self._select ]
+        elif self._r_select is not None and not self.use_vit:
+            # Rayons partagés avec les autres analyses des mêmes particules (cf. Utils.Derived) :
+            self._select = dv.derived(tmp, key=self._particle_key(self._shift)).r <= self._r_select
+            tmp = tmp[ self._select ]
+        elif self._r_select is not None:
+            self._select = self.SelectFromRadius( tmp[:, 0], tmp[:, 1], tmp[:, 2], self._r_select )
+            tmp = tmp[ self._select ]
+        else:
+            self._select = None
 
-        for k, t in self._tlist.items():
-            h, x, y = np.histogram2d(
-                        tmp[:,t[0]],
-                        tmp[:,t[1]],
-                        bins=self.nbbin
-            )
+        return tmp
 
+    def _smoothing_length(self, tmp):
+        if not self.use_index:
+            return dp.smoothing_length(tmp, k=self.nb_neighbours)
+        if self._select is None:
+            return dp.smoothing_length(tmp, k=self.nb_neighbours, index=self.index)
+        # Voisins cherchés parmi toutes les particules, la particule elle-même étant la première :
+        return 0.5 * self.index.kth_distance(self.nb_neighbours + 1, points=tmp)
+
+    def CreateMap(self):
+        tmp = self._coords()
+
+        if self.method == "ngp":
+            # Indices des bins calculés une seule fois par axe pour les trois plans :
+            hists = bn.projections(tmp, bins=self.nbbin, pairs=self._tlist.values())
+        else:
+            # Dépôt lissé (cf. Carte.Deposit), les longueurs de lissage étant calculées en 3D une seule fois :
+            h     = self._smoothing_length(tmp) if self.method == "sph" else None
+            hists = {
+                t: dp.deposit(tmp[:,t[0]], tmp[:,t[1]], bins=self.nbbin, method=self.method, h=h)
+                for t in self._tlist.values()
+            }
+
+        for k, t in self._tlist.items():
+            h, x, y       = hists[t]
             self._data[k] = (h.T, x, y)
 
+    def StatMap(self, name, values, statistic="mean", fill=0.):
+        """Carte d'une statistique de values par case dans la projection name (cf. Utils.Binned.binned_statistic),
+        avec la même sélection et les mêmes intervalles que la carte de densité.
+
+        :param values: one value per particle of the snapshot (before the RSelect selection).
+        :param statistic: "mean", "sum", "median", "std", "min", "max", a ufunc or a function.
+        :returns: (statistic, x edges, y edges) as :meth:`Get`.
+        """
+        if not name in self._tlist.keys():
+            raise ValueError(name + " not in allowed value: " + str([i for i in self._tlist.keys()]))
+
+        tmp = self._coords()
+        if self._select is not None:
+            values = np.asarray(values)[ self._select ]
+
+        t          = self._tlist[name]
+        _, x, y    = self._data[name]
+        h, _       = bn.binned_statistic(
+                        (tmp[:,t[0]], tmp[:,t[1]]),
+                        values,
+                        bins=(x, y),
+                        statistic=statistic,
+                        fill=fill
+        )
+
+        return h.T, x, y
+
     def Get(self, name):
         if not name in self._tlist.keys():
             raise ValueError(name + "not in allowed value: " + [i for i in self._tlist.keys()])
@@ -175,8 +289,9 @@ class DensityCarte(Histogram):
         for i in range(0, 3):
             super().Set_dim(i, fact)
 
-    def Plot(self, num=None, cmap=cm.jet, verbose=0, log=False):
+    def Plot(self, num=None, cmap=cm.jet, verbose=0, log=False, statistic=None, column=-1):
         """Trace les histogrammes.
+            statistic = None    :: Statistique de la colonne column par case ("mean", "median"...), au lieu du nombre de particules.
         """
         self.tlist = []
         for a in it.combinations(range(3), 2):
@@ -189,8 +304,10 @@ class DensityCarte(Histogram):
             self.fig, self.axs = plt.subplots(1, len(self.tlist), num=num, squeeze=True)
 
         for i, v in enumerate(self.tlist):
-            X, Y, Z = super().Create_Histo(ind=v)
-            #X, Y, Z = super().Create_FuncHisto(lambda f: f[-1], ind=v)
+            if statistic is None:
+                X, Y, Z = super().Create_Histo(ind=v)
+            else:
+                X, Y, Z = super().Create_StatHisto(self.don[:, column], statistic=statistic, ind=v)
             Z = np.ma.array(Z)
             Z = np.ma.masked_where(Z <= 0, Z)
             if log:
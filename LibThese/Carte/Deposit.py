@@ -0,0 +1,232 @@
+# -*- coding:Utf8 -*-
+
+"""Deposition of particles on a 2D grid.
+
+Methods:
+    "ngp" -- nearest grid point (same as np.histogram2d),
+    "cic" -- cloud in cell (bilinear, 2x2 pixels),
+    "tsc" -- triangular shaped cloud (3x3 pixels),
+    "sph" -- adaptive cubic spline kernel of smoothing length h (2h support), normalised over the pixels so
+             that the mass of each particle is conserved.
+
+The particles are processed by chunks in a thread pool, each worker accumulating on its own grid. For the
+SPH kernel the particles are grouped by footprint (radius in pixels), so that each chunk is a dense
+(n, 2R+1, 2R+1) array, and the large kernels are deposited on coarser grids, then interpolated.
+"""
+
+import numpy           as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ..Utils            import Binned as bn
+from ..Gadget           import Spatial as sp
+
+__all__ = [
+    "deposit",
+    "smoothing_length",
+    "methods",
+]
+
+methods = ("ngp", "cic", "tsc", "sph")
+
+def smoothing_length(pos, k=32, nb_proc=4, index=None):
+    """Return the smoothing length of each particle: half the distance to its k-th nearest neighbour, so that
+    the 2h support of the kernel holds about k neighbours.
+
+    :param pos: Positions, shape (N, d).
+    :param int k: Number of neighbours.
+    :param index: Spatial index of pos (see Gadget.Spatial), built if None.
+    """
+    if index is None:
+        index = sp.SpatialIndex(pos, nb_proc=nb_proc)
+    return 0.5 * index.kth_distance(k)
+
+def _kernel(q):
+    """2D cubic spline kernel, without the 1/h**2 factor (the weights are normalised per particle)."""
+    res  = np.zeros_like(q)
+    mid  = q < 1.
+    out  = (q >= 1.) & (q < 2.)
+    res[mid] = 1. - 1.5 * q[mid]**2 + 0.75 * q[mid]**3
+    res[out] = 0.25 * (2. - q[out])**3
+    return res * 10. / (7. * np.pi)
+
+def _axis_weights(u, order):
+    """Cells and weights along one axis, u being the position in cell units (cell i centered on i)."""
+    if order == 1:
+        i = np.floor(u).astype(np.int64)
+        f = u - i
+        return [ (i, 1. - f), (i + 1, f) ]
+
+    i = np.floor(u + 0.5).astype(np.int64)
+    d = u - i
+    return [ (i - 1, 0.5 * (0.5 - d)**2), (i, 0.75 - d * d), (i + 1, 0.5 * (0.5 + d)**2) ]
+
+def _mesh(ux, uy, w, nx, ny, order):
+    """Linear indices and weights of the cic (order 1) or tsc (order 2) deposition of a chunk."""
+    lin, wgt = [], []
+    for ix, wx in _axis_weights(ux, order):
+        for iy, wy in _axis_weights(uy, order):
+            ok = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+            lin.append(ix[ok] * ny + iy[ok])
+            wgt.append((wx * wy * w)[ok])
+    return np.concatenate(lin), np.concatenate(wgt)
+
+def _sph(ux, uy, w, hx, hy, rad, nx, ny):
+    """Linear indices and weights of the kernel deposition of a chunk of particles of footprint rad pixels.
+    hx, hy are the smoothing lengths in pixel units along each axis.
+    """
+    off      = np.arange(-rad, rad + 1)
+    ci, cj   = np.floor(ux + 0.5).astype(np.int64), np.floor(uy + 0.5).astype(np.int64)
+    ix       = ci[:, None, None] + off[None, :, None]
+    iy       = cj[:, None, None] + off[None, None, :]
+
+    q        = np.sqrt(
+                    ((ix - ux[:, None, None]) / hx[:, None, None])**2
+                    + ((iy - uy[:, None, None]) / hy[:, None, None])**2
+    )
+    wgt      = _kernel(q)
+
+    # Normalisation par particule (conservation de la masse), le pixel central pour les noyaux plus petits
+    # que les pixels :
+    norm     = wgt.sum(axis=(1, 2))
+    small    = norm <= 0.
+    wgt[small, rad, rad] = 1.
+    norm[small] = 1.
+    wgt     *= (w / norm)[:, None, None]
+
+    ok       = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    return (ix * ny + iy)[ok], wgt[ok]
+
+def _run(job, tasks, nx, ny, nb_proc):
+    """Run job (returning linear indices and weights) on every task in a thread pool, each worker
+    accumulating on its own grid.
+    """
+    def worker(part):
+        res = np.zeros(nx * ny)
+        for task in part:
+            lin, wgt = job(task)
+            res     += np.bincount(lin, weights=wgt, minlength=nx * ny)
+        return res
+
+    parts = [ tasks[i::nb_proc] for i in np.arange(nb_proc) ]
+    with ThreadPoolExecutor(max_workers=nb_proc) as pool:
+        return sum(pool.map(worker, parts))
+
+def _upsample(coarse, fact, nx, ny):
+    """Bilinear interpolation of a grid of pixels fact times larger on the (nx, ny) grid, keeping its sum."""
+    def axis(n, nc):
+        u  = np.clip((np.arange(n) + 0.5) / fact - 0.5, 0., nc - 1.)
+        i0 = np.floor(u).astype(np.int64)
+        i1 = np.minimum(i0 + 1, nc - 1)
+        return i0, i1, u - i0
+
+    i0, i1, f = axis(nx, coarse.shape[0])
+    tmp       = (1. - f)[:, None] * coarse[i0] + f[:, None] * coarse[i1]
+    i0, i1, f = axis(ny, coarse.shape[1])
+    res       = (1. - f)[None, :] * tmp[:, i0] + f[None, :] * tmp[:, i1]
+
+    tot = res.sum()
+    if tot > 0.:
+        res *= coarse.sum() / tot
+    return res
+
+def _sph_levels(ux, uy, w, hx, hy, nx, ny, nb_proc, chunk, max_radius):
+    """Kernel deposition. The particles whose footprint is larger than max_radius pixels are deposited on a
+    grid of pixels 2**level times larger (footprint of at most max_radius pixels), then interpolated on the
+    final grid: the cost per particle is bounded by (2 max_radius + 1)**2.
+    """
+    rad   = np.maximum(np.ceil(2. * hx), np.ceil(2. * hy))
+    level = np.zeros(len(ux), dtype=np.int64)
+    big   = rad > max_radius
+    level[big] = np.ceil(np.log2(rad[big] / max_radius)).astype(np.int64)
+
+    grid = np.zeros((nx, ny))
+    for lev in np.unique(level):
+        sel      = np.flatnonzero(level == lev)
+        fact     = 2**int(lev)
+        nxl, nyl = -(-nx // fact), -(-ny // fact)
+
+        # Position en unités des pixels du niveau :
+        uxl, uyl = (ux[sel] + 0.5) / fact - 0.5, (uy[sel] + 0.5) / fact - 0.5
+        hxl, hyl = hx[sel] / fact, hy[sel] / fact
+        radl     = np.maximum(np.maximum(np.ceil(2. * hxl), np.ceil(2. * hyl)).astype(np.int64), 1)
+        wl       = w[sel]
+
+        # Groupes de particules de même empreinte, découpés en morceaux d'environ chunk valeurs :
+        order        = np.argsort(radl, kind="stable")
+        radii, first = np.unique(radl[order], return_index=True)
+        last         = np.append(first[1:], len(order))
+        tasks        = []
+        for r, a, b in zip(radii, first, last):
+            step = max(1, chunk // (2 * int(r) + 1)**2)
+            for s in np.arange(a, b, step):
+                tasks.append((order[s:min(s + step, b)], int(r)))
+
+        def job(task):
+            ind, r = task
+            return _sph(uxl[ind], uyl[ind], wl[ind], hxl[ind], hyl[ind], r, nxl, nyl)
+
+        res = _run(job, tasks, nxl, nyl, nb_proc).reshape((nxl, nyl))
+        grid += res if fact == 1 else _upsample(res, fact, nx, ny)
+
+    return grid
+
+def deposit(x, y, bins=100, range=None, weights=None, method="cic", h=None, density=False, nb_proc=4, chunk=1<<18, max_radius=16):
+    """Deposit the particles (x, y) on a grid.
+
+    :param x, y: Coordinates.
+    :param bins: Number of pixels, or (nx, ny), or (x edges, y edges) (regular), as np.histogram2d.
+    :param range: ((xmin, xmax), (ymin, ymax)), default: minimum and maximum of the coordinates.
+    :param weights: Mass of each particle (default: 1).
+    :param str method: One of "ngp", "cic", "tsc", "sph".
+    :param h: Smoothing lengths (sph only, see :func:`smoothing_length`).
+    :param bool density: Divide by the pixel area.
+    :param int nb_proc: Number of threads.
+    :param int chunk: Number of particles (or of kernel values for "sph") per task.
+    :param int max_radius: Largest footprint (in pixels) of the "sph" kernel, larger kernels being deposited
+        on coarser grids. The relative L1 difference to full-resolution kernels falls by about 6 when
+        max_radius doubles: on a Plummer sphere of 5e5 particles (k=32) mapped on 1920x1080 pixels it is
+        6e-3 for 4, 1e-3 for 8 and 1.5e-4 for 16 (more concentrated snapshots give about twice these values).
+
+    :returns: grid of shape (nx, ny), x edges, y edges (as np.histogram2d).
+    :raises ValueError: for an unknown method, or "sph" without h.
+    """
+    if method not in methods:
+        raise ValueError("Unknown method " + str(method) + ", use one of " + str(methods))
+
+    x, y = np.asarray(x), np.asarray(y)
+    if range is not None:
+        edges = [ np.linspace(r[0], r[1], (b if np.isscalar(b) else len(b) - 1) + 1)
+                    for r, b in zip(range, [bins, bins] if np.isscalar(bins) else bins) ]
+    else:
+        edges = bn.make_edges((x, y), bins)
+    nx, ny = len(edges[0]) - 1, len(edges[1]) - 1
+    dx, dy = (edges[0][-1] - edges[0][0]) / nx, (edges[1][-1] - edges[1][0]) / ny
+
+    w      = np.ones(len(x)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    if method == "ngp":
+        grid = bn.histogramdd((x, y), edges, weights=weights)
+    else:
+        # Position en unités de pixels, le pixel i étant centré sur i :
+        ux = (x - edges[0][0]) / dx - 0.5
+        uy = (y - edges[1][0]) / dy - 0.5
+
+        if method == "sph":
+            if h is None:
+                raise ValueError("The sph method needs the smoothing lengths h.")
+            h    = np.broadcast_to(np.asarray(h, dtype=np.float64), x.shape)
+            grid = _sph_levels(ux, uy, w, h / dx, h / dy, nx, ny, nb_proc, chunk, max_radius)
+        else:
+            order = 1 if method == "cic" else 2
+            tasks = [ slice(s, s + chunk) for s in np.arange(0, len(x), chunk) ]
+
+            def job(task):
+                return _mesh(ux[task], uy[task], w[task], nx, ny, order)
+
+            grid = _run(job, tasks, nx, ny, nb_proc).reshape((nx, ny))
+
+    if density:
+        grid /= dx * dy
+
+    return grid, edges[0], edges[1]
@@ -4,9 +4,12 @@ import matplotlib.pyplot   as plt
 import matplotlib.cm       as cm
 import numpy           as np
 
+from collections             import OrderedDict
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from matplotlib.axes         import Subplot
 from ..Utils             import Histo as hs
+from ..Utils             import Derived as dv
+from ..Utils             import Binned as bn
 from ..Utils.Divers         import VConcate
 from ..Gadget.Filter         import Filter
 
@@ -14,6 +17,7 @@ __all__ = [
     "PhaseSpaceData",
     "PSPlot",
     "LoadEdge",
+    "DensityWeights",
 ]
 
 
@@ -24,6 +28,39 @@ def LoadEdge(file, **kwargs):
     res[:-1] = col1[:]
     res[1:] = col2[:]
 
+    return res
+
+_weights_cache      = OrderedDict()
+_weights_cache_size = 16
+
+def DensityWeights(X, Y, r2=False):
+    """Return the density normalization grid of a (r, v_r) histogram of shape (len(Y)-1, len(X)-1), as
+    returned by Histogram.Create_Histo:
+        1 / ( (Y[i+1] - Y[i]) * 4/3 pi (X[k+1]**3 - X[k]**3) ) [* X[k]**2 if r2]
+
+    The grid is read-only and cached, so it is computed once for all the frames sharing the same edges.
+
+    :param np.array X: Edges in radius.
+    :param np.array Y: Edges in radial velocity.
+    :param bool r2: Multiply by the square of the left edge in radius.
+    """
+    X, Y = np.asarray(X, dtype=np.float64), np.asarray(Y, dtype=np.float64)
+    key  = (X.tobytes(), Y.tobytes(), r2)
+
+    if key in _weights_cache:
+        _weights_cache.move_to_end(key)
+        return _weights_cache[key]
+
+    col = 1. / (4./3. * np.pi * np.diff(X**3))
+    if r2:
+        col *= X[:-1]**2
+    res = (1. / np.diff(Y))[:, np.newaxis] * col[np.newaxis, :]
+    res.flags.writeable = False
+
+    _weights_cache[key] = res
+    if len(_weights_cache) > _weights_cache_size:
+        _weights_cache.popitem(last=False)
+
     return res
 
         #""".. py:class:: PhaseSpaceData(file, [AngularBins=None, format=1, nb_file=1, nb_bin=100, r_min=None, r_max=None, v_min=None, v_max=None, j_min=None, j_max=None])
@@ -104,8 +141,10 @@ class PhaseSpaceData(Filter):
         self.Part.SortById()
         if select_ids is not None:
             self._ids = np.array(select_ids) - 1
+            self._derived_key = None
         else:
             self._ids = None
+            self._derived_key = dv.particle_key(file, shift=(move_pos, move_vel), order="id")
 
         if AngularBins is not None:
             try:
@@ -155,14 +194,15 @@ class PhaseSpaceData(Filter):
         ############
         # Calculs des quantités physiques voulues pour l'espace des phase :
         ###################################################################
+        pos, vel = self.Part.NumpyPositions, self.Part.NumpyVelocities
         if self._ids is not None:
-            self._r     = self.get_r(self.Part.NumpyPositions[self._ids, :])
-            self._v     = self.get_rv(self.Part.NumpyPositions[self._ids, :], self.Part.NumpyVelocities[self._ids, :]) / self._r
-            self._j     = self.get_j(self.Part.NumpyPositions[self._ids, :], self.Part.NumpyVelocities[self._ids, :])
-        else:
-            self._r     = self.get_r(self.Part.NumpyPositions)
-            self._v     = self.get_rv(self.Part.NumpyPositions, self.Part.NumpyVelocities) / self._r
-            self._j     = self.get_j(self.Part.NumpyPositions, self.Part.NumpyVelocities)
+            pos, vel = pos[self._ids, :], vel[self._ids, :]
+
+        # Colonnes partagées avec les autres analyses du même snapshot (cf. Utils.Derived) :
+        der         = dv.derived(pos, vel, key=self._derived_key).detach("r", "vr", "j")
+        self._r     = der.r
+        self._v     = der.vr
+        self._j     = der.j
 
         if r_min is None:
             r_min = self.r.min()
@@ -179,6 +219,13 @@ class PhaseSpaceData(Filter):
         if j_max is None:
             j_max = self.j.max()
 
+        # Conservés pour pouvoir changer le nombre de bins sans tout recalculer :
+        self._range_r = (r_min, r_max)
+        self._range_v = (v_min, v_max)
+        self._range_j = (j_min, j_max)
+        self._j_order = None
+        self._cube    = None
+
         ##################
         # Calculs des intervalles pour le comptage :
         ############################################
@@ -205,30 +252,40 @@ class PhaseSpaceData(Filter):
 
     def Create(self):
         ################
-        # Calculs de la position de chaque valeurs de r, v_r et j dans les intervalles :
-        ################################################################################
-        self._pos_j = np.digitize(self._j, self._bins_j)
-        self._pos_r = np.digitize(self._r, self._bins_r)
-        self._pos_v = np.digitize(self._v, self._bins_v)
+        # Tri unique des particules par j (les tranches en j sont alors contiguës) :
+        ############################################################################
+        if self._j_order is None:
+            self._j_order  = np.argsort(self._j, kind="stable")
+            self._sorted_r = self._r[self._j_order]
+            self._sorted_v = self._v[self._j_order]
+            self._sorted_j = self._j[self._j_order]
 
-        ##################
-        # Classement des tableaux de position :
-        #######################################
-        self._corres_ind = np.lexsort( (self._pos_r, self._pos_v, self._pos_j) )
+        self._do_j_offsets()
 
+    def _do_j_offsets(self):
         ##################
-        # Récupèration de l'indice auquel chaque bin se termine :
-        #########################################################
-        self._bin_end_in_corres = np.nonzero( self._pos_j[self._corres_ind[:-1]] - self._pos_j[self._corres_ind[1:]] )[0]
-
-        tmp                     = self._pos_j[ self._corres_ind[ self._bin_end_in_corres ] ]
-        self._dict_corres_value = dict()
-        prec                    = -1
+        # Indice de début de chaque bin en j (format CSR) : le bin i de np.digitize(j, j_bin) correspond aux
+        # particules triées [offsets[i], offsets[i+1]) :
+        ################################################
+        self._j_offsets = np.concatenate((
+            [0],
+            np.searchsorted(self._sorted_j, self._bins_j, side="left"),
+            [len(self._sorted_j)]
+        ))
+
+    def SliceJ(self, ang):
+        """
+        :param float ang: Angular momentum.
+        :returns: slice of the particles sorted by angular momentum in the bin of ang, and the bin index
+            (as given by np.digitize).
+        :raises ValueError: if the bin is empty.
+        """
+        pos_in_bin_j = np.digitize( [ang], self.j_bin)[0]
+        start, stop  = self._j_offsets[pos_in_bin_j], self._j_offsets[pos_in_bin_j+1]
+        if start == stop:
+            raise ValueError("Bad value, nothing in it's bin: j (=" + str(ang) + ") in [" + str(self.j.min()) + ", " + str(self.j.max()) + "]")
 
-        for i, pj in enumerate(tmp):
-            self._dict_corres_value[ pj ] = ( prec ,self._bin_end_in_corres[i])
-            prec                          = self._bin_end_in_corres[i]
-        self._dict_corres_value[ self._pos_j[self._corres_ind[-1]] ] = (prec, self.nb_bin)
+        return slice(start, stop), pos_in_bin_j
 
     def GetSliceJ(self, ang):
         """
@@ -242,10 +299,7 @@ class PhaseSpaceData(Filter):
         :returns: bin size
         :rtype: float
         """
-        pos_in_bin_j = np.digitize( [ang], self.j_bin)[0]
-        if not pos_in_bin_j in self._dict_corres_value:
-            raise ValueError("Bad value, nothing in it's bin: j (=" + str(ang) + ") in [" + str(self.j.min()) + ", " + str(self.j.max()) + "]")
-        indice = self._dict_corres_value[ pos_in_bin_j ]
+        sl, pos_in_bin_j = self.SliceJ(ang)
 
         ##########################################################################################################################
         # Solution dégueulasse. Trouver mieux.
@@ -256,11 +310,76 @@ class PhaseSpaceData(Filter):
             print("Solution dégueulasse !")
             dj = self.j_bin[1] - self.j_bin[0]
 
-        return        self._r[ self._corres_ind[ (indice[0]+1):(indice[1]+1) ] ], \
-                self._v[ self._corres_ind[ (indice[0]+1):(indice[1]+1) ] ], \
-                self._j[ self._corres_ind[ (indice[0]+1):(indice[1]+1) ] ], \
+        return  self._sorted_r[sl], \
+                self._sorted_v[sl], \
+                self._sorted_j[sl], \
                 dj
-                #self._j[ self._corres_ind[ (indice[0]+1):(indice[1]+1) ] + 1 ] - self._j[ self._corres_ind[ (indice[0]+1):(indice[1]+1) ] ]
+
+    def HistSliceJ(self, ang):
+        """Histogramme en (r, v_r) des particules du bin en j contenant ang, avec les intervalles r_bin et
+        v_r_bin courants. Le coût est proportionnel au nombre de particules du bin.
+
+        :param float ang: Angular momentum.
+        :returns: number of particles, shape (len(r_bin)-1, len(v_r_bin)-1)
+        :rtype: np.array
+        """
+        sl, _ = self.SliceJ(ang)
+        return np.histogram2d(self._sorted_r[sl], self._sorted_v[sl], bins=(self._bins_r, self._bins_v))[0]
+
+    def StatSliceJ(self, ang, values, statistic="mean", fill=0.):
+        """Statistique (cf. Utils.Binned.binned_statistic) de values, une valeur par particule, par case
+        (r, v_r) du bin en j contenant ang, avec les intervalles r_bin et v_r_bin courants.
+        """
+        sl, _ = self.SliceJ(ang)
+        rows  = self._j_order[sl]
+        return bn.binned_statistic(
+                (self._sorted_r[sl], self._sorted_v[sl]),
+                np.asarray(values)[rows],
+                bins=(self._bins_r, self._bins_v),
+                statistic=statistic,
+                fill=fill
+        )[0]
+
+    def CreateCube(self, dtype=np.float32):
+        """Histogramme 3D (j, r, v_r) de toutes les particules, en une seule passe (cf. Utils.Binned), avec
+        les intervalles j_bin, r_bin et v_r_bin courants.
+
+        :param dtype: dtype of the cube (float32 by default).
+        :returns: cube of shape (len(j_bin)-1, len(r_bin)-1, len(v_r_bin)-1)
+        :rtype: np.array
+        """
+        self._cube = bn.histogramdd(
+                (self._j, self._r, self._v),
+                (self._bins_j, self._bins_r, self._bins_v),
+                dtype=dtype
+        )
+        return self._cube
+
+    @property
+    def cube(self):
+        """Cube (j, r, v_r), calculé au premier accès et après chaque changement d'intervalles."""
+        if self._cube is None:
+            self.CreateCube()
+        return self._cube
+
+    def CubeSliceJ(self, ang):
+        """Histogramme (r, v_r) du bin en j contenant ang : vue sur le cube, sans copie.
+
+        :param float ang: Angular momentum.
+        :raises ValueError: if ang is not in the j bins.
+        """
+        k = bn.bin_index(np.array([ang]), self._bins_j)[0]
+        if k < 0:
+            raise ValueError("Bad value: j (=" + str(ang) + ") not in [" + str(self.j_bin[0]) + ", " + str(self.j_bin[-1]) + "]")
+        return self.cube[k]
+
+    def CubeRangeJ(self, j_min=None, j_max=None):
+        """Histogramme (r, v_r) des bins en j entre j_min et j_max (inclus) : somme sur une vue du cube.
+        """
+        nb = len(self._bins_j) - 1
+        k0 = 0  if j_min is None else int(np.clip(np.searchsorted(self._bins_j, j_min, side="right") - 1, 0, nb))
+        k1 = nb if j_max is None else int(np.clip(np.searchsorted(self._bins_j, j_max, side="right"), 0, nb))
+        return self.cube[k0:k1].sum(axis=0)
 
     @property
     def r(self):
@@ -278,6 +397,7 @@ class PhaseSpaceData(Filter):
     @r_bin.setter
     def r_bin(self, val):
         self._bins_r = np.asarray(val)
+        self._cube   = None
 
     @property
     def v_r_bin(self):
@@ -285,6 +405,7 @@ class PhaseSpaceData(Filter):
     @v_r_bin.setter
     def v_r_bin(self, val):
         self._bins_v = np.asarray(val)
+        self._cube   = None
 
     @property
     def j_bin(self):
@@ -292,25 +413,43 @@ class PhaseSpaceData(Filter):
     @j_bin.setter
     def j_bin(self, val):
         self._bins_j = np.asarray(val)
+        self._cube   = None
+        self._do_j_offsets()
+
+    @property
+    def nb_r_bin(self):
+        return len(self._bins_r) - 1
+    @nb_r_bin.setter
+    def nb_r_bin(self, val):
+        self._r_bin  = val
+        self.r_bin   = 10**np.linspace(np.log10(self._range_r[0]), np.log10(self._range_r[1]), val+1)
+
+    @property
+    def nb_v_bin(self):
+        return len(self._bins_v) - 1
+    @nb_v_bin.setter
+    def nb_v_bin(self, val):
+        self._v_bin  = val
+        self.v_r_bin = np.linspace(self._range_v[0], self._range_v[1], val+1)
+
+    @property
+    def nb_j_bin(self):
+        return len(self._bins_j) - 1
+    @nb_j_bin.setter
+    def nb_j_bin(self, val):
+        self._j_bin  = val
+        self.j_bin   = np.linspace(self._range_j[0], self._range_j[1], val+1)
 
 
     @staticmethod
     def get_r(pos):
-        return np.sqrt( np.sum( pos[:]**2, axis=1 ) )
+        return dv.Derived(pos).r
     @staticmethod
     def get_rv(pos, vit):
-        return np.sum(pos * vit, axis=1)
+        return dv.Derived(pos, vit).rv
     @staticmethod
     def get_j(pos, vit):
-        return  np.sqrt(
-                np.sum(
-                    np.cross(
-                        pos,
-                        vit
-                    )**2,
-                    axis=1
-                )
-            )
+        return dv.Derived(pos, vit).j
 
 
 class PSPlot(PhaseSpaceData):
@@ -411,15 +550,10 @@ class PSPlot(PhaseSpaceData):
                     )
         self.hist = self.hist.T * self.m
 
+        # Normalisation par la taille des bins, en place :
+        self.hist *= DensityWeights(self.X, self.Y, r2=True)
         if j_norm and j is not None:
-            l_dj = 2.0 * np.pi * j * dj
-
-        for i in range( len( self.hist ) ):
-            self.hist[i, :] = self.hist[i, :] / (self.Y[i+1] - self.Y[i])
-            self.hist[:, i] = self.hist[:, i] / (4./3.*np.pi * (self.X[i+1]**3 - self.X[i]**3))
-            self.hist[:, i] = self.hist[:, i] * self.X[i]**2
-            if j_norm and j is not None:
-                self.hist[:, i] = self.hist[:, i] / ( l_dj ) # * self.X[i]**2
+            self.hist /= 2.0 * np.pi * j * dj
 
     def GetSliceJ(self, binJ=None):
         if binJ is None:
@@ -513,31 +647,22 @@ class Map(hs.Histogram):
         # Initialisation de la classe mère :
         super(Map, self).__init__(*args, **kwargs)
 
+        key = None
         if isinstance(args[0], str):
             # Si c'est un fichier gadget :
-            tmp = hs.ReadGadget(args[0])
+            # Est-ce que l'on veut un type particulier ? Si oui, seul ce type est lu :
+            tmp = hs.ReadGadget(args[0], ptype=kwargs.get("dtype"))
             if tmp.border_block() == 256:
                 self.head = tmp.read_header()
                 # Lecture des positions :
                 tmp_pos = tmp.get_positions()
-                tmp_pos.shape = (len(tmp_pos)/3, 3)
+                tmp_pos.shape = (len(tmp_pos)//3, 3)
 
                 # Lecture des vitesses :
                 tmp_vit = tmp.get_velocities()
-                tmp_vit.shape = (len(tmp_vit)/3, 3)
-
-                # Est-ce que l'on veut un type particulier ?
-                if "dtype" in kwargs and kwargs["dtype"] is not None:
-                    dtype = kwargs["dtype"]
-                    self.head = tmp.read_header()
+                tmp_vit.shape = (len(tmp_vit)//3, 3)
 
-                    # Récupération du nombre de particule voulues :
-                    wanted = tmp.header["Npart"][dtype]
-                    before = sum(tmp.header["Npart"][0:dtype])
-
-                    # filtrage des positions-vitesses :
-                    tmp_pos    = tmp_pos[before:(before+wanted)]
-                    tmp_vit    = tmp_vit[before:(before+wanted)]
+                key = dv.particle_key(args[0], ptype=kwargs.get("dtype"), units=units)
         else:
             tmp_pos = self.don[:, 0:3].copy()
             tmp_vit = self.don[:, 3:6].copy()
@@ -545,23 +670,19 @@ class Map(hs.Histogram):
         tmp_pos = tmp_pos * units[0]
         tmp_vit = tmp_vit * units[1]
 
-        tmp_pos = tmp_pos - move
-
+        # La translation est faite dans les noyaux de calcul (cf. Utils.Derived) :
+        der = dv.derived(tmp_pos, tmp_vit, key=key, center=move).detach("r", "v" if mein else "vr")
         if mein:
             self.log.info("Using v vs r.")
-            don1 = np.sqrt( np.sum( tmp_pos[:]**2, axis=1 ) )
-            don2 = np.sqrt( np.sum( tmp_vit[:]**2, axis=1 ) )
-            self.don = VConcate(don1, don2)
+            self.don = VConcate(der.r, der.v)
         else:
             self.log.info(r"Using $\vec{v}.\vec{r} / |r|$ vs r")
-            self.don = self.rvr(tmp_pos, tmp_vit)
+            self.don = VConcate(der.r, der.vr)
 
     @staticmethod
     def rvr(tmp_pos, tmp_vit):
-        don2 = np.sum(tmp_pos * tmp_vit, axis=1) / np.sqrt( np.sum( tmp_pos[:]**2, axis=1 ) )
-        don1 = np.sqrt( np.sum( tmp_pos[:]**2, axis=1 ) )
-
-        return VConcate(don1, don2)
+        der = dv.Derived(tmp_pos, tmp_vit)
+        return VConcate(der.r, der.vr)
 
     def Set_AllDim(self, fact):
         """Multiplie chaque dimension par fact.
@@ -579,10 +700,7 @@ class Map(hs.Histogram):
         if log:
             masked = True
         if density:
-            #print(X); print(Y)
-            for i in range(len(Z)):
-                Z[i, :] = Z[i, :] / ((Y[i+1] - Y[i]))
-                Z[:, i] = Z[:, i] / (4./3. * np.pi * (X[i+1]**3 - X[i]**3))
+            Z *= DensityWeights(X, Y)
             print(Z[ Z > 0.07e7 ])
             x, y = np.unravel_index(np.argmax(Z), Z.shape)
             print( (x, y), Z[x, y], X[x], X[x+1], Y[y], Y[y+1])
@@ -1,5 +1,6 @@
 # -*- coding:Utf8 -*-
 
 from .DensityCarte import *
+from .Deposit      import *
 from .PhaseSpace   import *
 
@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""Centers of position and velocity of a snapshot, without the external Verif program.
+
+	>>> cen, vcen = find_center(pos, vel, key=particle_key("snap_010"))
+
+:func:`shrinking_sphere` iterates on the center of mass of the particles inside a sphere whose radius
+decreases at each step, keeping only the particles of the previous sphere, so that the cost is dominated by
+the first pass on the N particles. :func:`density_center` then weights the particles of the core (the
+nb_core particles closest to that center) by their local density (Casertano & Hut, 1985), estimated from
+their k nearest neighbours with a :class:`Spatial.SpatialIndex` of the core only.
+
+:func:`find_center` keeps the results of the last snapshots.
+"""
+
+import numpy as np
+
+from collections import OrderedDict
+
+from . import Spatial as sp
+
+__all__ = [
+	"shrinking_sphere",
+	"density_center",
+	"find_center",
+	"clear_cache",
+	"methods",
+]
+
+methods = ("shrink", "density")
+
+def _mean(val, mass):
+	if mass is None or np.isscalar(mass):
+		return val.mean(axis=0, dtype=np.float64)
+	return np.average(val, axis=0, weights=mass)
+
+def shrinking_sphere(pos, mass=None, center=None, radius=None, shrink=0.9, keep=0.75, nmin=1000, tol=0., max_iter=200, nb_core=None):
+	"""Shrinking sphere center of pos.
+
+	:param pos: Positions, shape (N, 3).
+	:param mass: Mass of the particles (scalar or array, default: equal masses).
+	:param center: Starting center (default: center of mass).
+	:param radius: Starting radius (default: distance of the farthest particle).
+	:param shrink: Largest ratio of two successive radii.
+	:param keep: Largest fraction of the particles of a sphere kept in the next one (the radius decreases
+		faster while the sphere holds most of the particles, the total cost being about N / (1 - keep)).
+	:param nmin: Stop when less than nmin particles are inside the sphere.
+	:param tol: Stop when the center moves by less than tol.
+	:param nb_core: Also return the indices of the first sphere holding at most nb_core particles.
+
+	:returns: center [, indices of the core]
+	"""
+	pos    = np.asarray(pos)
+	ind    = np.arange(len(pos))
+	center = _mean(pos, mass) if center is None else np.asarray(center, dtype=np.float64)
+	core   = None
+
+	sub    = pos
+	r2     = np.einsum("ij,ij->i", sub - center, sub - center)
+	radius = np.sqrt(r2.max()) if radius is None else radius
+
+	for _ in range(max_iter):
+		ok = r2 <= radius**2
+		if np.count_nonzero(ok) < nmin:
+			break
+
+		ind, sub = ind[ok], sub[ok]
+		if core is None and nb_core is not None and len(ind) <= nb_core:
+			core = ind
+
+		new    = _mean(sub, None if mass is None or np.isscalar(mass) else np.asarray(mass)[ind])
+		moved  = np.sqrt(np.sum((new - center)**2))
+		center = new
+		if moved < tol:
+			break
+
+		r2      = np.einsum("ij,ij->i", sub - center, sub - center)
+		kth     = int(keep * (len(r2) - 1))
+		radius  = min(radius * shrink, np.sqrt(np.partition(r2, kth)[kth]))
+
+	if nb_core is not None:
+		return center, ind if core is None else core
+	return center
+
+def density_center(pos, vel=None, mass=None, k=32, index=None, key=None):
+	"""Density weighted center of position (and of velocity) of pos, the density of each particle being
+	estimated from its k nearest neighbours.
+
+	:param index: Spatial index of pos (built if None).
+	:param key: Key of pos, to take the index from the cache of :func:`Spatial.spatial_index`.
+	:returns: center, velocity center (None without vel), densities
+	"""
+	pos   = np.asarray(pos)
+	if index is None:
+		index = sp.spatial_index(pos, key=key)
+
+	k     = min(k, len(pos) - 1)
+	rho   = index.density(k=k, mass=mass)
+	w     = rho / rho.sum()
+
+	cen   = np.einsum("i,ij->j", w, pos.astype(np.float64, copy=False))
+	vcen  = None if vel is None else np.einsum("i,ij->j", w, np.asarray(vel).astype(np.float64, copy=False))
+
+	return cen, vcen, rho
+
+_cache      = OrderedDict()
+cache_size  = 16
+
+def find_center(pos, vel=None, mass=None, method="density", key=None, k=32, nb_core=10000, nmin=1000, shrink=0.9):
+	"""Center of position and of velocity of a snapshot.
+
+	:param method: "shrink" (shrinking sphere, the velocity center being the mean velocity of the nmin
+		particles closest to the center) or "density" (density weighted center of the core of the shrinking sphere).
+	:param key: Key of the particles (see Utils.Derived.particle_key), to cache the result and the index of the core.
+	:param k: Number of neighbours for the densities.
+	:param nb_core: Number of particles of the core for the density weighting.
+
+	:returns: center, velocity center (None without vel)
+	:raises ValueError: for an unknown method.
+	"""
+	if method not in methods:
+		raise ValueError("Unknown method " + str(method) + ", use one of " + str(methods))
+
+	full = None
+	if key is not None:
+		full = (key, method, vel is not None, k, nb_core, nmin, shrink)
+		if full in _cache:
+			_cache.move_to_end(full)
+			return _cache[full]
+
+	pos       = np.asarray(pos)
+	cen, core = shrinking_sphere(pos, mass, nmin=min(nmin, nb_core), shrink=shrink, nb_core=nb_core)
+	if method == "shrink":
+		last = np.einsum("ij,ij->i", pos[core] - cen, pos[core] - cen)
+		last = core[ last <= np.sort(last)[min(nmin, len(last)) - 1] ]
+		m    = None if mass is None or np.isscalar(mass) else np.asarray(mass)[last]
+		vcen = None if vel is None else _mean(np.asarray(vel)[last], m)
+	else:
+		m            = mass if mass is None or np.isscalar(mass) else np.asarray(mass)[core]
+		ckey         = None if key is None else key + ("core", m is None or np.isscalar(m), nb_core, nmin, shrink)
+		cen, vcen, _ = density_center(pos[core], None if vel is None else np.asarray(vel)[core], m, k=k, key=ckey)
+
+	res = (cen, vcen)
+	if full is not None:
+		_cache[full] = res
+		while len(_cache) > cache_size:
+			_cache.popitem(last=False)
+
+	return res
+
+def clear_cache():
+	"""Empty the cache of :func:`find_center`."""
+	_cache.clear()
@@ -4,111 +4,91 @@
 import numpy as np
 
 from . import load_gadget as lg
+from . import Selection   as sl
+from . import Match       as mt
 from ..Utils import Divers as ud
+from ..Utils import Derived as dv
 
 from InitialCond.Gadget import Gadget
 
 class Filter(Gadget):
 	def FromR(cls, rmax=5.):
-		res = np.array( [] )
-		for p, v, i in zip(cls.Part.NumpyPositions, cls.Part.NumpyVelocities, cls.Part.NumpyIdentities):
-			if np.sum(p**2.) >= rmax**2.:
-				res = np.resize(res, (res.shape[0] + 1, p.shape[0] + v.shape[0] + 1))
-				res[res.shape[0]-1,:] = p.tolist() + v.tolist() + [i]
-
-		return res
+		return _rows(
+				sl.RadiusShell(rmin=rmax),
+				cls.Part.NumpyPositions,
+				cls.Part.NumpyVelocities,
+				cls.Part.NumpyIdentities
+		)
 
 	def FromI(cls, ind=1000):
-		for p, v, i in zip(cls.Part.NumpyPositions, cls.Part.NumpyVelocities, cls.Part.NumpyIdentities):
-			if i >= ind:
-				res = np.resize(res, (res.shape[0] + 1, p.shape[0] + v.shape[0] + 1))
-				res[res.shape[0]-1,:] = p.tolist() + v.tolist() + [i]
-
-		return res
+		return _rows(
+				sl.IdRange(imin=ind),
+				cls.Part.NumpyPositions,
+				cls.Part.NumpyVelocities,
+				cls.Part.NumpyIdentities
+		)
 
 	def FromAngularMomentum(cls, inter):
-		print(inter)
-		Angular = np.sqrt(
-				np.sum(
-					np.cross(
-						cls.Part.NumpyPositions,
-						cls.Part.NumpyVelocities
-					)**2,
-					axis=1
-				)
-			)
-		bobo = (Angular >= inter[0]) & (Angular <= inter[1])
+		# Shared with the phase space of the same snapshot, see Utils.Derived:
+		Angular = dv.derived(
+				cls.Part.NumpyPositions,
+				cls.Part.NumpyVelocities,
+				key=getattr(cls, "_derived_key", None)
+			).j
+		bobo = sl.in_range(Angular, inter[0], inter[1])
 		resp = cls.Part.NumpyPositions[ bobo ]
 		resv = cls.Part.NumpyVelocities[ bobo ]
 
 		return resp, resv, Angular[ bobo ]
 
-def filterfromr(*args, rmax=5.):
-	"""Return an array [positions, velocities, identities] construct from the passing array.
-	You can pass :
-		(x) 3 array : positions, velocities, identities,
-		(x) a 2D array : [positions, velocities, identities].
-	then the limit radius (default : 5 pc).
+def _split(args):
+	"""Return (positions, velocities, identities) from the arguments of filterfromr and filterfromi.
 	"""
 	if len(args) == 1:
-		var_iter = zip(args[0][:,0:3], args[0][:,3:6], args[0][:,6])
+		return args[0][:,0:3], args[0][:,3:6], args[0][:,6]
 	elif len(args) == 3:
-		var_iter = zip(args[0], args[1], args[2])
+		return args[0], args[1], args[2]
 	else:
 		raise ValueError("You must pass one or 3 arguments, see help function")
 
-	ind = 1
-	for p, v, i in var_iter:
-		if np.sum(p*p) >= rmax**2:
-			tmp = np.append(p, np.append(v, i))
-			try:
-				res = np.append(res, [tmp], axis=0)
-				#print(ind, "Added to res")
-				#ind+=1
-			except NameError:
-				res = np.array([tmp])
-				#print(ind, "Create res")
-				#ind+=1
+def _rows(sel, pos, vel, ids):
+	"""Return the array [positions, velocities, identities] of the particles selected by sel.
+	"""
+	ind = sel.mask(pos, vel, ids)
+	res = np.empty((np.count_nonzero(ind), 7), dtype=np.result_type(pos.dtype, vel.dtype, np.float64))
+
+	res[:, 0:3] = pos[ind]
+	res[:, 3:6] = vel[ind]
+	res[:, 6]   = ids[ind]
 
 	return res
 
-def filterfromi(*args, ind=1000):
+def filterfromr(*args, rmax=5.):
 	"""Return an array [positions, velocities, identities] construct from the passing array.
 	You can pass :
 		(x) 3 array : positions, velocities, identities,
 		(x) a 2D array : [positions, velocities, identities].
 	then the limit radius (default : 5 pc).
 	"""
-	if len(args) == 1:
-		var_iter = zip(args[0][:,0:3], args[0][:,3:6], args[0][:,6])
-	elif len(args) == 3:
-		var_iter = zip(args[0], args[1], args[2])
-	else:
-		raise ValueError("You must pass one or 3 arguments, see help function")
-
-	for p, v, i in var_iter:
-		if i >= ind:
-			tmp = np.append(p, np.append(v, i))
-			try:
-				res = np.append(res, [tmp], axis=0)
-				#print(ind, "Added to res")
-				#ind+=1
-			except NameError:
-				res = np.array([tmp])
-				#print(ind, "Create res")
-				#ind+=1
+	return _rows(sl.RadiusShell(rmin=rmax), *_split(args))
 
-	return res
+def filterfromi(*args, ind=1000):
+	"""Return an array [positions, velocities, identities] construct from the passing array.
+	You can pass :
+		(x) 3 array : positions, velocities, identities,
+		(x) a 2D array : [positions, velocities, identities].
+	then the limit radius (default : 5 pc).
+	"""
+	return _rows(sl.IdRange(imin=ind), *_split(args))
 
 def filterfromAngularMomentum(pos, vel, inter):
 	"""This function return all positions and velocities of particles having Angular Momentum
 	between inter[0] and inter[1].
 	"""
-	Angular = np.sqrt( np.sum( np.cross(pos, vel)**2, axis=1 ) )
-	#np.sqrt( np.sum( tmp_pos[:]**2, axis=1 ) )
-	#ind     = np.where()
-	resp = pos[ (Angular >= inter[0]) & (Angular <= inter[1]) ]
-	resv = vel[ (Angular >= inter[0]) & (Angular <= inter[1]) ]
+	Angular = sl.angular_momentum(pos, vel)
+	ind     = sl.in_range(Angular, inter[0], inter[1])
+	resp = pos[ ind ]
+	resv = vel[ ind ]
 
 	return resp, resv, Angular
 
@@ -139,14 +119,8 @@ def compare(gad1 : str, gad2 : str, rmax : float = None, ind : int = None):
 	elif ind != None:
 		res = filterfromi(p2, v2, i2, ind=ind)
 
-	# Getting their position from the begining snapshot:
+	# Getting their position from the begining snapshot (semi-join on identities):
 	buf  = ud.VConcate( ud.VConcate(p1, v1), i1)
-	for a in buf:
-		if a[6] in res[:,6]:
-			try:
-				ret = np.append(ret, [a], axis=0)
-			except NameError:
-				ret = np.array([a])
+	ret  = buf[ mt.IdLookup(res[:,6].astype(i1.dtype)).contains(i1) ]
 
 	return ret, res
-
@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""Identity matching between snapshots.
+
+:class:`IdLookup` maps particle identities to row numbers once per snapshot, either with a dense table
+(identities spanning a small range, O(N)) or with a sort and :func:`numpy.searchsorted` (O(N log N)).
+All queries are vectorised, so following a set of particles through hundreds of outputs never loops over
+particles in Python.
+"""
+
+import numpy as np
+
+from . import load_gadget as lg
+
+__all__ = [
+	"IdLookup",
+	"match",
+	"follow",
+]
+
+class IdLookup(object):
+	"""Identity -> row lookup table of a snapshot.
+
+	:param ids: Identities of the particles, in file order.
+	:type ids: np.array
+
+	:param dense: Use a dense table indexed by identity. By default, a dense table is used when the
+		identities span less than 4 times the number of particles.
+	:type dense: bool or None
+	"""
+	def __init__(self, ids, dense=None):
+		ids       = np.asarray(ids)
+		self.size = len(ids)
+
+		if self.size == 0:
+			self.imin, self.imax = 0, -1
+		else:
+			self.imin, self.imax = int(ids.min()), int(ids.max())
+
+		span = self.imax - self.imin + 1
+		if dense is None:
+			dense = span <= 4 * self.size + 1024
+		self.dense = dense
+
+		if self.dense:
+			self._table = np.full(span, -1, dtype=np.int64)
+			self._table[ids - self.imin] = np.arange(self.size)
+		else:
+			self._order  = np.argsort(ids, kind="stable")
+			self._sorted = ids[self._order]
+
+	def rows(self, ids):
+		"""Return the row of each identity in ids, -1 for the identities which are not in the snapshot.
+		"""
+		ids = np.asarray(ids)
+		res = np.full(ids.shape, -1, dtype=np.int64)
+
+		if self.size == 0:
+			return res
+
+		if self.dense:
+			ok      = (ids >= self.imin) & (ids <= self.imax)
+			res[ok] = self._table[ids[ok] - self.imin]
+		else:
+			pos        = np.searchsorted(self._sorted, ids)
+			pos[ pos == self.size ] = self.size - 1
+			ok         = self._sorted[pos] == ids
+			res[ok]    = self._order[pos[ok]]
+
+		return res
+
+	def contains(self, ids):
+		"""Boolean mask of the identities of ids present in the snapshot.
+		"""
+		return self.rows(ids) >= 0
+
+	def __len__(self):
+		return self.size
+
+def match(ids1, ids2):
+	"""Return the index arrays (ind1, ind2) such that ids1[ind1] == ids2[ind2], ordered as in ids1.
+	"""
+	rows = IdLookup(ids2).rows(ids1)
+	ind1 = np.flatnonzero(rows >= 0)
+
+	return ind1, rows[ind1]
+
+def follow(files, ids, fields=("pos", "vel"), ptype=None):
+	"""Generator following the particles of identities ids through a list of snapshots.
+
+	For each file, yield (file name, dictionary field -> array) where the rows are in the order of ids.
+
+	:raises KeyError: if one of the identities is missing from a snapshot.
+	"""
+	ids = np.asarray(ids)
+
+	for name in files:
+		rdg  = lg.open_gadget(name, ptype=ptype)
+		rows = IdLookup(rdg.get_identities()).rows(ids)
+
+		if np.any(rows < 0):
+			raise KeyError("%d identities missing from %s" % (np.count_nonzero(rows < 0), name))
+
+		res = dict()
+		for field in fields:
+			data = rdg.read_block(field)
+			if field in ("pos", "vel"):
+				data = data.reshape((-1, 3))
+			res[field] = data[rows]
+
+		rdg.close()
+		yield name, res
@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""Vectorised particle selections.
+
+A selection is a predicate on (positions, velocities, identities) which returns a boolean mask. Predicates
+are combined with ``&``, ``|`` and ``~``, and never loop over particles in Python:
+
+	>>> sel = RadiusShell(rmax=5.) & ~IdRange(imax=1000)
+	>>> ind = sel.indices(pos, vel, ids)
+
+Use :meth:`Predicate.indices` to get an index array, or :meth:`IdRange.slice` to get a view (no copy) on
+arrays sorted by identities.
+"""
+
+import numpy as np
+
+from ..Utils import Derived as dv
+
+__all__ = [
+	"Predicate",
+	"RadiusShell",
+	"IdRange",
+	"AngularMomentumRange",
+	"radius2",
+	"angular_momentum",
+	"in_range",
+]
+
+def radius2(pos, center=None):
+	"""Return the squared distance of each particle to center (default: origin), without (N, 3) temporaries.
+	"""
+	if center is None:
+		return np.einsum("ij,ij->i", pos, pos)
+
+	res = np.zeros(pos.shape[0], dtype=np.result_type(pos.dtype, np.float32))
+	for k in range(3):
+		tmp  = pos[:, k] - center[k]
+		res += tmp * tmp
+	return res
+
+def angular_momentum(pos, vel):
+	"""Return the norm of the specific angular momentum |r x v| of each particle.
+	"""
+	return dv.Derived(pos, vel).j
+
+def in_range(val, vmin, vmax):
+	"""Boolean mask of vmin <= val <= vmax, a None bound being ignored.
+	"""
+	if vmin is None and vmax is None:
+		return np.ones(val.shape[0], dtype=bool)
+	if vmin is None:
+		return val <= vmax
+	if vmax is None:
+		return val >= vmin
+
+	res  = val >= vmin
+	res &= val <= vmax
+	return res
+
+class Predicate(object):
+	"""Base class of the selections. Subclasses implement :meth:`mask`.
+	"""
+	def mask(self, pos=None, vel=None, ids=None):
+		"""Return the boolean mask of the selected particles.
+		"""
+		raise NotImplementedError("You MUST implement this method!")
+
+	def __call__(self, pos=None, vel=None, ids=None):
+		return self.mask(pos, vel, ids)
+
+	def indices(self, pos=None, vel=None, ids=None):
+		"""Return the indices of the selected particles.
+		"""
+		return np.flatnonzero(self.mask(pos, vel, ids))
+
+	def apply(self, pos=None, vel=None, ids=None):
+		"""Return the selected positions, velocities and identities (None for the arrays not given).
+		"""
+		ind = self.mask(pos, vel, ids)
+		return tuple( None if a is None else a[ind] for a in (pos, vel, ids) )
+
+	def __and__(self, other):
+		return _Combine(np.logical_and, self, other)
+
+	def __or__(self, other):
+		return _Combine(np.logical_or, self, other)
+
+	def __invert__(self):
+		return _Not(self)
+
+class _Combine(Predicate):
+	def __init__(self, op, left, right):
+		self._op    = op
+		self._left  = left
+		self._right = right
+
+	def mask(self, pos=None, vel=None, ids=None):
+		res = self._left.mask(pos, vel, ids)
+		return self._op(res, self._right.mask(pos, vel, ids), out=res)
+
+class _Not(Predicate):
+	def __init__(self, pred):
+		self._pred = pred
+
+	def mask(self, pos=None, vel=None, ids=None):
+		res = self._pred.mask(pos, vel, ids)
+		return np.logical_not(res, out=res)
+
+class RadiusShell(Predicate):
+	"""Particles with rmin <= |pos - center| <= rmax.
+
+	:param rmin: Inner radius (None: no inner bound).
+	:type rmin: float or None
+
+	:param rmax: Outer radius (None: no outer bound).
+	:type rmax: float or None
+
+	:param center: Center of the shell (default: origin).
+	:type center: iterable or None
+	"""
+	def __init__(self, rmin=None, rmax=None, center=None):
+		self.rmin   = rmin
+		self.rmax   = rmax
+		self.center = center
+
+	def mask(self, pos=None, vel=None, ids=None):
+		return in_range(
+			radius2(pos, self.center),
+			None if self.rmin is None else self.rmin**2,
+			None if self.rmax is None else self.rmax**2
+		)
+
+class IdRange(Predicate):
+	"""Particles with imin <= id <= imax.
+
+	:param imin: Smallest identity (None: no lower bound).
+	:type imin: int or None
+
+	:param imax: Largest identity (None: no upper bound).
+	:type imax: int or None
+	"""
+	def __init__(self, imin=None, imax=None):
+		self.imin = imin
+		self.imax = imax
+
+	def mask(self, pos=None, vel=None, ids=None):
+		return in_range(ids, self.imin, self.imax)
+
+	def slice(self, ids):
+		"""Return the slice of the selected particles in an array sorted by identities, so that
+		pos[sel.slice(ids)] is a view and not a copy.
+		"""
+		start = 0 if self.imin is None else np.searchsorted(ids, self.imin, side="left")
+		stop  = len(ids) if self.imax is None else np.searchsorted(ids, self.imax, side="right")
+		return slice(int(start), int(stop))
+
+class AngularMomentumRange(Predicate):
+	"""Particles with jmin <= |r x v| <= jmax.
+
+	:param jmin: Smallest angular momentum (None: no lower bound).
+	:type jmin: float or None
+
+	:param jmax: Largest angular momentum (None: no upper bound).
+	:type jmax: float or None
+	"""
+	def __init__(self, jmin=None, jmax=None):
+		self.jmin = jmin
+		self.jmax = jmax
+
+	def mask(self, pos=None, vel=None, ids=None):
+		return in_range(angular_momentum(pos, vel), self.jmin, self.jmax)
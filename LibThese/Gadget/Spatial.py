@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""KD-tree spatial index of a snapshot.
+
+	>>> idx = spatial_index(pos, key=particle_key("snap_010"))
+	>>> ind = idx.sphere([0., 0., 0.], 10.)
+	>>> rho = idx.density(k=32)
+
+The tree (scipy.spatial.cKDTree) is built once, in O(N log N), and then answers sphere, box, nearest
+neighbours and local density queries in sub-linear time. :func:`spatial_index` keeps the trees of the last
+snapshots, so that the maps, the phase space and the center finder share them.
+"""
+
+import numpy as np
+
+from collections   import OrderedDict
+from scipy.spatial import cKDTree
+
+__all__ = [
+	"SpatialIndex",
+	"spatial_index",
+	"clear_cache",
+]
+
+class SpatialIndex(object):
+	"""Spatial index of a set of particles.
+
+	:param pos: Positions, shape (N, 3).
+	:type pos: np.array
+
+	:param leafsize: Number of particles in the leaves of the tree.
+	:type leafsize: int
+
+	:param nb_proc: Number of threads for the neighbour queries.
+	:type nb_proc: int
+	"""
+	def __init__(self, pos, leafsize=16, nb_proc=4):
+		self.nb_proc = nb_proc
+		self.tree    = cKDTree(pos, leafsize=leafsize, balanced_tree=False, compact_nodes=False)
+		# tree.data is pos itself when pos is already a contiguous float64 array, a float64 copy otherwise: the
+		# index holds it as long as it lives, so pos must not be modified in place afterwards.
+		self.pos     = self.tree.data
+
+	def __len__(self):
+		return self.tree.n
+
+	def sphere(self, center, radius, sort=False):
+		"""Return the indices of the particles with |pos - center| <= radius.
+		"""
+		return np.asarray(self.tree.query_ball_point(center, radius, return_sorted=sort), dtype=np.int64)
+
+	def count(self, center, radius):
+		"""Return the number of particles with |pos - center| <= radius.
+		"""
+		return self.tree.query_ball_point(center, radius, return_length=True)
+
+	def box(self, lower, upper):
+		"""Return the sorted indices of the particles with lower <= pos <= upper (component by component).
+		"""
+		lower, upper = np.asarray(lower, dtype=np.float64), np.asarray(upper, dtype=np.float64)
+		ind = np.sort(self.sphere(0.5 * (lower + upper), 0.5 * np.sqrt(np.sum((upper - lower)**2))))
+		sub = self.pos[ind]
+		ok  = np.all((sub >= lower) & (sub <= upper), axis=1)
+		return ind[ok]
+
+	def knn(self, points, k=1):
+		"""Return the distances and the indices of the k nearest particles of each point, shape (M, k).
+		"""
+		dist, ind = self.tree.query(points, k=k, workers=self.nb_proc)
+		return dist.reshape((-1, k)), ind.reshape((-1, k))
+
+	def kth_distance(self, k, points=None):
+		"""Return the distance to the k-th nearest neighbour of each point (of each particle, itself excluded,
+		when points is None).
+		"""
+		if points is None:
+			points, k = self.pos, k + 1
+		return self.tree.query(points, k=[k], workers=self.nb_proc)[0][:, 0]
+
+	def density(self, k=32, mass=None, points=None):
+		"""Return the local density around each point (each particle when points is None) from its k nearest
+		neighbours: the mass of the k neighbours over the volume of the sphere reaching the k-th.
+
+		:param mass: Mass of the particles (scalar or array, default: 1).
+		"""
+		if points is None:
+			dist, ind = self.tree.query(self.pos, k=k+1, workers=self.nb_proc)
+			dist, ind = dist[:, 1:], ind[:, 1:]
+		else:
+			dist, ind = self.tree.query(points, k=k, workers=self.nb_proc)
+			dist, ind = dist.reshape((-1, k)), ind.reshape((-1, k))
+
+		if mass is None or np.isscalar(mass):
+			mtot = k * (1. if mass is None else mass)
+		else:
+			mtot = np.asarray(mass)[ind].sum(axis=1)
+
+		return mtot / (4. / 3. * np.pi * dist[:, -1]**3)
+
+_cache      = OrderedDict()
+cache_size  = 4
+
+def spatial_index(pos, key=None, **kwargs):
+	"""Return the :class:`SpatialIndex` of pos. When key is given (see :func:`Utils.Derived.particle_key`), the
+	index is kept in a cache of the cache_size last keys, and pos is not read again on a cache hit.
+	"""
+	if key is None:
+		return SpatialIndex(pos, **kwargs)
+
+	if key in _cache:
+		_cache.move_to_end(key)
+		return _cache[key]
+
+	res         = SpatialIndex(pos, **kwargs)
+	_cache[key] = res
+	while len(_cache) > cache_size:
+		_cache.popitem(last=False)
+
+	return res
+
+def clear_cache():
+	"""Empty the cache of :func:`spatial_index`."""
+	_cache.clear()
@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""Lagrangian tracking of a fixed set of particles through a sequence of snapshots.
+
+	>>> trk = Tracker(ids)
+	>>> trk.to_hdf5(sorted(glob("out/snap_*")), "track.hdf5")
+
+Snapshots may be single files or split (filename.0 ... filename.N, see :func:`load_gadget.snapshot_files`).
+The rows of the tracked identities are computed once per snapshot (see :class:`Match.IdLookup`) and kept
+in memory, so that reading the same snapshot again (other fields, other analysis) does not rebuild them.
+"""
+
+import os
+import numpy as np
+
+from collections import OrderedDict
+
+from . import load_gadget as lg
+from . import Match       as mt
+
+__all__ = [
+	"Tracker",
+]
+
+class Tracker(object):
+	"""Follow the particles of identities ids through snapshots.
+
+	:param ids: Identities of the tracked particles. The output rows are in this order.
+	:type ids: iterable
+
+	:param ptype: Particle type to read (None: all types).
+	:type ptype: int or None
+
+	:param cache_size: Number of snapshots whose rows are kept in memory (None: no limit).
+	:type cache_size: int or None
+	"""
+	def __init__(self, ids, ptype=None, cache_size=None):
+		self.ids        = np.asarray(ids)
+		self.ptype      = ptype
+		self.cache_size = cache_size
+		self._rows      = OrderedDict()
+
+	def __len__(self):
+		return len(self.ids)
+
+	@staticmethod
+	def _key(filename):
+		st = os.stat(lg.snapshot_files(filename)[0])
+		return os.path.abspath(filename), st.st_size, st.st_mtime_ns
+
+	def _fields(self, filename, fields):
+		"""Return the time and the arrays of fields (positions and velocities as (N, 3)) of the particles of type
+		ptype, from a single file or a split snapshot (filename.0 ... filename.N, see load_gadget.snapshot_files).
+		"""
+		files = lg.snapshot_files(filename)
+		if len(files) == 1:
+			rdg = lg.open_gadget(files[0], ptype=self.ptype)
+			try:
+				time = rdg.read_header()["Time"]
+				res  = [ rdg.read_block(f) for f in fields ]
+			finally:
+				rdg.close()
+		else:
+			header, data = lg.read_snapshot(files, fields=fields)
+			time = header["Time"]
+			sel  = range(6) if self.ptype is None else [self.ptype]
+			res  = [ np.concatenate([ data[f][t] for t in sel ]) for f in fields ]
+
+		return time, [ a.reshape((-1, 3)) if f in ("pos", "vel") else a for f, a in zip(fields, res) ]
+
+	def rows(self, filename):
+		"""Return the rows of the tracked particles in filename.
+		"""
+		key = self._key(filename)
+		if key in self._rows:
+			self._rows.move_to_end(key)
+			return self._rows[key]
+
+		ids  = self._fields(filename, ("id",))[1][0]
+		rows = mt.IdLookup(ids).rows(self.ids)
+		if np.any(rows < 0):
+			raise KeyError("%d identities missing from %s" % (np.count_nonzero(rows < 0), filename))
+
+		self._rows[key] = rows
+		if self.cache_size is not None and len(self._rows) > self.cache_size:
+			self._rows.popitem(last=False)
+
+		return rows
+
+	def read(self, filename, out=None):
+		"""Return the time and the (n, 6) array (x, y, z, vx, vy, vz) of the tracked particles in filename.
+		"""
+		rows             = self.rows(filename)
+		time, (pos, vel) = self._fields(filename, ("pos", "vel"))
+
+		if out is None:
+			out = np.empty((len(self.ids), 6), dtype=np.float32)
+
+		out[:, :3] = pos[rows]
+		out[:, 3:] = vel[rows]
+
+		return time, out
+
+	def track(self, files):
+		"""Generator yielding (file name, time, (n, 6) array) for each snapshot of files.
+		"""
+		for name in files:
+			time, res = self.read(name)
+			yield name, time, res
+
+	def to_array(self, files):
+		"""Return the times (T,) and the (T, n, 6) array of the tracked particles.
+		"""
+		files = list(files)
+		times = np.empty(len(files))
+		res   = np.empty((len(files), len(self.ids), 6), dtype=np.float32)
+
+		for i, name in enumerate(files):
+			times[i], _ = self.read(name, out=res[i])
+
+		return times, res
+
+	def to_hdf5(self, files, output, dataset="track", chunk=16, compression=None):
+		"""Write the (T, n, 6) array of the tracked particles in the HDF5 file output.
+
+		Snapshots are read by groups of chunk and each group is written at once, so that the whole array
+		never has to fit in memory. The file also holds the datasets "ids" and "time", and the file names
+		in the attribute "files" of dataset.
+		"""
+		import h5py
+
+		files = list(files)
+		nt, n = len(files), len(self.ids)
+
+		with h5py.File(output, "w") as f:
+			dset = f.create_dataset(
+				dataset,
+				shape=(nt, n, 6),
+				dtype=np.float32,
+				chunks=(max(1, min(chunk, nt)), max(1, min(n, 1 << 16)), 6),
+				compression=compression,
+			)
+			f.create_dataset("ids", data=self.ids)
+			time = f.create_dataset("time", shape=(nt,), dtype=np.float64)
+			dset.attrs["files"] = np.array([ os.path.basename(a) for a in files ], dtype=h5py.string_dtype())
+
+			buf   = np.empty((chunk, n, 6), dtype=np.float32)
+			tbuf  = np.empty(chunk)
+			for start in range(0, nt, chunk):
+				stop = min(start + chunk, nt)
+				for i, name in enumerate(files[start:stop]):
+					tbuf[i], _ = self.read(name, out=buf[i])
+
+				dset[start:stop] = buf[:stop - start]
+				time[start:stop] = tbuf[:stop - start]
+
+		return output
@@ -0,0 +1,308 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""Barnes-Hut tree code: potential and acceleration of a snapshot with Plummer softening.
+
+	>>> phi, acc = potential(pos, mass, G=1., rsoft=0.01, opang=0.5)
+
+The octree is built without any loop on the particles: the particles are sorted by Morton key, the nodes
+of each level are the runs of equal key prefixes, and their mass and center of mass come from prefix sums.
+The walk is done for groups of group particles (contiguous in the Morton order) rather than particle by
+particle (Barnes, 1990): a node is accepted as a monopole for the whole group when its size over its
+distance to the bounding box of the group is below opang, the leaves that are not accepted being summed
+directly. Each group then evaluates its interaction list as a dense (group, list) block, the groups being
+spread over a thread pool.
+
+:func:`direct` is the O(N^2) reference (exact summation), equal to the tree code for opang = 0, and
+:func:`benchmark` (or ``python -m LibThese.Gadget.TreeCode``) prints the timings and errors of both.
+"""
+
+import time
+import numpy   as np
+import numexpr as ne
+
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = [
+	"Octree",
+	"potential",
+	"direct",
+	"benchmark",
+]
+
+_bits = 21
+
+def _spread(x):
+	"""Insert two zero bits between the bits of x (21 bits, uint64)."""
+	x = x & np.uint64(0x1fffff)
+	x = (x | (x << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+	x = (x | (x << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+	x = (x | (x << np.uint64(8)))  & np.uint64(0x100f00f00f00f00f)
+	x = (x | (x << np.uint64(4)))  & np.uint64(0x10c30c30c30c30c3)
+	x = (x | (x << np.uint64(2)))  & np.uint64(0x1249249249249249)
+	return x
+
+def morton(pos, lower, size):
+	"""Morton key (3 x 21 bits) of each position in the cube [lower, lower + size]."""
+	q = np.floor((pos - lower) / size * (1 << _bits)).astype(np.int64)
+	q = np.clip(q, 0, (1 << _bits) - 1).astype(np.uint64)
+	return (_spread(q[:, 0]) << np.uint64(2)) | (_spread(q[:, 1]) << np.uint64(1)) | _spread(q[:, 2])
+
+def _interact(tgt, src, msrc, G, eps2, skip, acc):
+	"""Potential and acceleration on tgt of the point masses (src, msrc), the pairs skip = (rows, columns)
+	being excluded. The kernel is a single numexpr expression, the sums on the sources are matrix products.
+	"""
+	inv = ne.evaluate(
+			"1. / sqrt((sx - tx)**2 + (sy - ty)**2 + (sz - tz)**2 + eps2)",
+			local_dict=dict(
+				sx=src[None, :, 0], sy=src[None, :, 1], sz=src[None, :, 2],
+				tx=tgt[:, 0, None], ty=tgt[:, 1, None], tz=tgt[:, 2, None],
+				eps2=eps2,
+			),
+	)
+	inv[skip] = 0.
+
+	phi = -G * inv.dot(msrc)
+	if not acc:
+		return phi, None
+
+	w   = ne.evaluate("inv**3 * m", local_dict=dict(inv=inv, m=msrc[None, :]))
+	return phi, G * (w.dot(src) - tgt * w.sum(axis=1)[:, None])
+
+class Octree(object):
+	"""Octree of a set of particles.
+
+	:param pos: Positions, shape (N, 3).
+	:type pos: np.array
+
+	:param mass: Mass of the particles (scalar or array).
+	:type mass: float or np.array
+
+	:param leafsize: Largest number of particles of a leaf.
+	:type leafsize: int
+
+	The particles are stored in the Morton order (self.order gives their original index). Each level l
+	holds the arrays start, end (range of particles), mass, com (center of mass), leaf and the range of
+	its children in the level l+1 (first, last).
+	"""
+	def __init__(self, pos, mass=1., leafsize=8):
+		pos          = np.asarray(pos, dtype=np.float64)
+		self.size_n  = len(pos)
+		self.lower   = pos.min(axis=0)
+		self.size    = max(float((pos.max(axis=0) - self.lower).max()), np.finfo(np.float64).tiny) * (1. + 1e-9)
+
+		keys         = morton(pos, self.lower, self.size)
+		self.order   = np.argsort(keys, kind="stable")
+		keys         = keys[self.order]
+		self.pos     = pos[self.order]
+		self.mass    = np.broadcast_to(np.asarray(mass, dtype=np.float64), (self.size_n,))[self.order].copy()
+
+		cm           = np.concatenate(([0.], np.cumsum(self.mass)))
+		cmx          = np.concatenate((np.zeros((1, 3)), np.cumsum(self.mass[:, None] * self.pos, axis=0)))
+
+		self.levels  = list()
+		for lev in range(_bits + 1):
+			pre     = keys >> np.uint64(3 * (_bits - lev))
+			start   = np.flatnonzero(np.concatenate(([True], pre[1:] != pre[:-1])))
+			end     = np.append(start[1:], self.size_n)
+			m       = cm[end] - cm[start]
+			with np.errstate(divide="ignore", invalid="ignore"):
+				com = np.where(m[:, None] > 0., (cmx[end] - cmx[start]) / m[:, None], self.pos[start])
+
+			node = dict(
+				start  = start,
+				end    = end,
+				mass   = m,
+				com    = com,
+				key    = pre[start],
+				leaf   = (end - start <= leafsize) | (lev == _bits),
+				size   = self.size / 2**lev,
+			)
+
+			if self.levels:
+				# Enfants de chaque noeud du niveau précédent :
+				up            = self.levels[-1]
+				up["first"]   = np.searchsorted(node["key"] >> np.uint64(3), up["key"], side="left")
+				up["last"]    = np.searchsorted(node["key"] >> np.uint64(3), up["key"], side="right")
+
+			self.levels.append(node)
+			if node["leaf"].all():
+				break
+
+	def walk(self, opang, group=32):
+		"""Interaction lists of the groups of group particles (Morton order).
+
+		:returns: group bounds, and for each group the (level, node) of its monopoles and of its leaves
+			summed directly, as arrays sorted by group (group, level, node).
+		"""
+		gstart = np.arange(0, self.size_n, group)
+		gend   = np.minimum(gstart + group, self.size_n)
+		ng     = len(gstart)
+
+		# Boîte englobante de chaque groupe :
+		lo     = np.minimum.reduceat(self.pos, gstart, axis=0)
+		hi     = np.maximum.reduceat(self.pos, gstart, axis=0)
+
+		g      = np.arange(ng)
+		nod    = np.zeros(ng, dtype=np.int64)
+		mono, leaves = [], []
+		for lev, node in enumerate(self.levels):
+			if len(g) == 0:
+				break
+
+			c      = node["com"][nod]
+			d      = np.maximum(np.maximum(lo[g] - c, c - hi[g]), 0.)
+			dist   = np.sqrt(np.einsum("ij,ij->i", d, d))
+			accept = node["size"] < opang * dist
+
+			mono.append((g[accept], np.full(np.count_nonzero(accept), lev), nod[accept]))
+			rest   = ~accept
+			isleaf = rest & node["leaf"][nod]
+			leaves.append((g[isleaf], np.full(np.count_nonzero(isleaf), lev), nod[isleaf]))
+
+			# Ouverture des autres noeuds :
+			op     = rest & ~node["leaf"][nod]
+			g, nod = g[op], nod[op]
+			if len(g) == 0:
+				break
+			first  = node["first"][nod]
+			count  = node["last"][nod] - first
+			g      = np.repeat(g, count)
+			nod    = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+
+		def gather(lst):
+			gg, ll, nn = (np.concatenate(a) for a in zip(*lst)) if lst else (np.zeros(0, dtype=np.int64),) * 3
+			o          = np.argsort(gg, kind="stable")
+			return gg[o], ll[o], nn[o]
+
+		return (gstart, gend), gather(mono), gather(leaves)
+
+	def potential(self, G=1., rsoft=0., opang=0.5, group=32, nb_proc=4, acc=True):
+		"""Potential (per unit mass) and acceleration of every particle.
+
+		:param G: Gravitational constant in the units of the snapshot.
+		:param rsoft: Plummer softening length.
+		:param opang: Opening angle (0: exact direct summation).
+		:param group: Number of particles sharing an interaction list.
+		:param nb_proc: Number of threads.
+		:param acc: Also compute the accelerations.
+
+		:returns: potential, acceleration (None without acc), in the original order of the particles.
+		"""
+		(gstart, gend), mono, leaves = self.walk(opang, group)
+		ng      = len(gstart)
+		eps2    = rsoft**2
+
+		# Listes de chaque groupe, sous forme de tranches des tableaux triés par groupe :
+		mbound  = np.searchsorted(mono[0], np.arange(ng + 1))
+		lbound  = np.searchsorted(leaves[0], np.arange(ng + 1))
+		mcom    = np.zeros((len(mono[0]), 3))
+		mmass   = np.zeros(len(mono[0]))
+		lstart  = np.zeros(len(leaves[0]), dtype=np.int64)
+		lend    = np.zeros(len(leaves[0]), dtype=np.int64)
+		for lev, node in enumerate(self.levels):
+			sel        = mono[1] == lev
+			mcom[sel]  = node["com"][mono[2][sel]]
+			mmass[sel] = node["mass"][mono[2][sel]]
+			sel        = leaves[1] == lev
+			lstart[sel] = node["start"][leaves[2][sel]]
+			lend[sel]   = node["end"][leaves[2][sel]]
+
+		phi     = np.zeros(self.size_n)
+		accel   = np.zeros((self.size_n, 3)) if acc else None
+
+		def job(gr):
+			for k in gr:
+				a, b  = gstart[k], gend[k]
+				tgt   = self.pos[a:b]
+
+				s, e  = lstart[lbound[k]:lbound[k+1]], lend[lbound[k]:lbound[k+1]]
+				cnt   = e - s
+				ind   = np.repeat(s - np.cumsum(cnt) + cnt, cnt) + np.arange(cnt.sum())
+				src   = np.concatenate((mcom[mbound[k]:mbound[k+1]], self.pos[ind]))
+				msrc  = np.concatenate((mmass[mbound[k]:mbound[k+1]], self.mass[ind]))
+
+				# Pas d'auto-interaction :
+				own   = np.flatnonzero((ind >= a) & (ind < b))
+				p, f  = _interact(tgt, src, msrc, G, eps2, (ind[own] - a, (mbound[k+1] - mbound[k]) + own), acc)
+
+				phi[a:b] = p
+				if acc:
+					accel[a:b] = f
+
+		parts = [ np.arange(i, ng, nb_proc) for i in range(nb_proc) ]
+		with ThreadPoolExecutor(max_workers=nb_proc) as pool:
+			for res in [ pool.submit(job, p) for p in parts ]:
+				res.result()
+
+		res        = np.empty_like(phi)
+		res[self.order] = phi
+		if acc:
+			tmp              = np.empty_like(accel)
+			tmp[self.order]  = accel
+			accel            = tmp
+		return res, accel
+
+def potential(pos, mass=1., G=1., rsoft=0., opang=0.5, leafsize=8, group=32, nb_proc=4, acc=True):
+	"""Potential (per unit mass) and acceleration of every particle with the tree code (see
+	:meth:`Octree.potential`).
+	"""
+	return Octree(pos, mass, leafsize=leafsize).potential(G=G, rsoft=rsoft, opang=opang, group=group, nb_proc=nb_proc, acc=acc)
+
+def direct(pos, mass=1., G=1., rsoft=0., index=None, chunk=None, nb_proc=4, acc=True):
+	"""Direct summation reference: potential (per unit mass) and acceleration of the particles index
+	(default: all), without self interaction, by blocks of chunk targets (default: blocks of about 2**22
+	pairs).
+	"""
+	pos    = np.asarray(pos, dtype=np.float64)
+	mass   = np.broadcast_to(np.asarray(mass, dtype=np.float64), (len(pos),))
+	index  = np.arange(len(pos)) if index is None else np.asarray(index)
+	tgt    = pos[index]
+	chunk  = max(1, (1 << 22) // max(len(pos), 1)) if chunk is None else chunk
+
+	phi    = np.zeros(len(tgt))
+	accel  = np.zeros((len(tgt), 3)) if acc else None
+
+	def job(a):
+		b    = min(a + chunk, len(tgt))
+		p, f = _interact(tgt[a:b], pos, mass, G, rsoft**2, (np.arange(b - a), index[a:b]), acc)
+		phi[a:b] = p
+		if acc:
+			accel[a:b] = f
+
+	with ThreadPoolExecutor(max_workers=nb_proc) as pool:
+		for res in [ pool.submit(job, a) for a in range(0, len(tgt), chunk) ]:
+			res.result()
+
+	return phi, accel
+
+def _plummer(n, seed=0):
+	rng = np.random.default_rng(seed)
+	r   = 1. / np.sqrt(rng.random(n)**(-2./3.) - 1.)
+	u   = rng.normal(size=(n, 3))
+	return r[:, None] * u / np.linalg.norm(u, axis=1)[:, None]
+
+def benchmark(sizes=(1000, 4000, 16000, 64000, 256000), opang=0.5, rsoft=0.01, nb_proc=4, nref=1000, out=print):
+	"""Time the tree code on Plummer spheres of increasing sizes, and compare it to the direct summation
+	(timed up to 16000 particles, then on nref particles only, the error being measured on them).
+	"""
+	out("%9s %12s %12s %12s %12s" % ("N", "tree (s)", "direct (s)", "err phi", "err acc"))
+	for n in sizes:
+		pos  = _plummer(n)
+		m    = 1. / n
+
+		t0   = time.time()
+		phi, acc = potential(pos, m, rsoft=rsoft, opang=opang, nb_proc=nb_proc)
+		ttree = time.time() - t0
+
+		sub  = np.arange(n) if n <= 16000 else np.linspace(0, n - 1, nref).astype(np.int64)
+		t0   = time.time()
+		rphi, racc = direct(pos, m, rsoft=rsoft, index=sub, nb_proc=nb_proc)
+		tdir = time.time() - t0
+
+		ephi = np.max(np.abs(phi[sub] - rphi) / np.abs(rphi))
+		eacc = np.median(np.linalg.norm(acc[sub] - racc, axis=1) / np.linalg.norm(racc, axis=1))
+		out("%9d %12.3f %12.3f %12.2e %12.2e%s" % (n, ttree, tdir, ephi, eacc, "" if n <= 16000 else " (direct on %d)" % nref))
+
+if __name__ == "__main__":
+	benchmark()
@@ -1,75 +1,173 @@
 #! /usr/bin/env python3
 # -*- coding:Utf8 -*-
 
+import os
 import sys
+import json
 import numpy as np
 
+from concurrent.futures import ThreadPoolExecutor
+
+# structure du header d'un fichier Gadget (format 1), marqueurs Fortran compris
+header_dtype = np.dtype([
+	("head",          np.int32),
+	("Npart",         np.int32,   6),
+	("Massarr",       np.float64, 6),
+	("Time",          np.float64),
+	("Redshift",      np.float64),
+	("FlagSfr",       np.int32),
+	("FlagFeedBack",  np.int32),
+	("Nall",          np.int32,   6),
+	("FlagCooling",   np.int32),
+	("NumFiles",      np.int32),
+	("BoxSize",       np.float64),
+	("Omega0",        np.float64),
+	("OmegaLambda",   np.float64),
+	("HubbleParam",   np.float64),
+	("FlagAge",       np.int32),
+	("FlagMetals",    np.int32),
+	("NallHW",        np.int32,   6),
+	("flag_entr_ics", np.int32),
+	("null",          np.int32,   15),
+	("tail",          np.int32),
+])
+
+# type et nombre de composantes des blocs qui peuvent manquer dans un fichier
+block_types = {
+	"pos":  (np.float32, 3),
+	"vel":  (np.float32, 3),
+	"id":   (np.int32,   1),
+	"mass": (np.float32, 1),
+	"u":    (np.float32, 1),
+	"rho":  (np.float32, 1),
+}
+
+# nom des blocs à partir des étiquettes du format 2
+block_labels = {
+	"POS ": "pos",
+	"VEL ": "vel",
+	"ID  ": "id",
+	"MASS": "mass",
+	"U   ": "u",
+	"RHO ": "rho",
+}
+
+def snapshot_files( filename ):
+
+	""" Liste des fichiers composant le snapshot : filename lui-même, ou filename.0 ... filename.(NumFiles-1)
+	(filename.0.hdf5 ... pour les snapshots HDF5 splittés).
+	"""
+
+	if os.path.exists( filename ):
+		return [ filename ]
+
+	# fichiers splittés, éventuellement au format HDF5 (filename.0.hdf5, ...)
+	for ext in ("", ".hdf5"):
+		if os.path.exists( filename + ".0" + ext ):
+			break
+	else:
+		raise IOError("\033[31;1mThe file " + filename + " doesn't exist !\nCheck the file name !\033[0m")
+
+	rdg = open_gadget( filename + ".0" + ext )
+	nb  = int( rdg.read_header()["NumFiles"] )
+	rdg.close()
+
+	return [ filename + "." + str(i) + ext for i in range( max(nb, 1) ) ]
+
+def read_snapshot( filename, fields = ("pos", "vel", "id"), nb_proc = 4 ):
+
+	""" Lit un snapshot Gadget (format 1, 2 ou HDF5), en un seul fichier ou splitté (filename.0 ... filename.N), en parallèle.
+
+	Les headers de tous les fichiers sont lus d'abord : ils donnent la taille finale des tableaux de chaque
+	type, qui sont alloués une seule fois. Chaque fichier est ensuite lu par un thread qui écrit directement
+	dans sa tranche des tableaux finaux (sans copie intermédiaire ni np.append).
+
+	filename           :: nom du snapshot, ou liste explicite des fichiers à lire.
+	fields             :: blocs à lire parmi "pos", "vel", "id", "mass", "u" et "rho".
+	nb_proc = 4        :: nombre de threads de lecture.
+
+	Valeur de retour :
+		le header du premier fichier, où Npart est remplacé par le nombre total de particules de chaque type,
+		un dictionnaire champ -> liste de 6 tableaux (un par type de particule, de longueur nulle pour les types
+		que le bloc ne contient pas).
+	"""
+
+	if isinstance( filename, str ):
+		files = snapshot_files( filename )
+	else:
+		files = list( filename )
+
+	# on lit tous les headers avant toute donnée
+	readers = [ open_gadget( name ) for name in files ]
+	headers = [ rdg.read_header() for rdg in readers ]
+
+	# nombre de particules par fichier et par type, et début de chaque fichier dans les tableaux finaux
+	Npart = np.array( [ h["Npart"] for h in headers ], dtype = np.int64 )
+	Nall  = Npart.sum( axis = 0 )
+	first = np.cumsum( Npart, axis = 0 ) - Npart
+
+	# allocation des tableaux finaux
+	Massarr = headers[0]["Massarr"]
+	data    = dict()
+	for field in fields:
+
+		typ, ncomp = block_types[field]
+		if field in readers[0].index :
+			typ = readers[0].index[field][2]
+
+		data[field] = list()
+		for t in range(6):
+			# les types absents du bloc ("u" et "rho" n'existent que pour le gaz) ont un tableau vide
+			present = any( rdg.type_range( field, t ) is not None for rdg in readers )
+			nb      = Nall[t] if present or field == "mass" else 0
+			shape   = (nb, ncomp) if ncomp != 1 else (nb,)
+			if field == "mass" and Massarr[t] != 0.0 :
+				data[field].append( np.full( shape, Massarr[t], dtype = typ ) )
+			else:
+				data[field].append( np.empty( shape, dtype = typ ) )
+
+	# lecture d'un fichier dans sa tranche
+	def worker( i ):
+		rdg = readers[i]
+		for field in fields:
+			for t in range(6):
+				rng = rdg.type_range( field, t )
+				if rng is None or rng[1] == 0 :
+					continue
+				rdg.read_range( field, rng[0], rng[1], out = data[field][t][ first[i,t]:(first[i,t] + rng[1]) ] )
+
+	with ThreadPoolExecutor( max_workers = nb_proc ) as pool:
+		for res in [ pool.submit( worker, i ) for i in range( len(readers) ) ]:
+			res.result()
+
+	for rdg in readers:
+		rdg.close()
+
+	header          = dict( headers[0] )
+	header["Npart"] = Nall
+
+	return header, data
+
 def get_gadget( self, filename ):
 
 	""" Pour la lecture des fichiers Gadget en un seul fichier ou plusieurs splittés """
 
-	# on trouve le nombre de fichiers avec le préfixe donné en argument
-	nmax = self.get_number_files( filename )
-
-	# si pas de fichier splittés
-	if nmax == 0 :
-
-		# vérification de l'existence
-		if not os.path.exists( filename ):
-			print("\033[31;1mThe file " + filename + " doesn't exist !\nCheck the file name !\033[0m")
-			sys.exit()
-
-		# on lit les données Gadget
-		rdg = ReadGadget( filename )
-		header = rdg.read_header()
-		positions = rdg.get_positions()
-
-		# on renvoie le header et les positions
-		self.show_header( header )
-		return positions, header
-
-	else :
-
-		# on initialise le tableau des positions
-		positions = list()
-
-		for i in range( nmax ):
+	# on lit le ou les fichiers en parallèle
+	header, data = read_snapshot( filename, fields = ("pos",) )
 
-			# le nom du fichier splitté
-			name = filename + "." + str( i+1 )
-
-			# on lit le fichier splitté
-			rdg = ReadGadget( name )
-			header = rdg.read_header()
-			positions.append( rdg.get_positions() )
-
-		# on renvoie le header et les positions
-		self.show_header( header )
-		return np.array( positions, dtype="float32" ).flatten(), header
+	# on renvoie le header et les positions
+	self.show_header( header )
+	return np.concatenate( data["pos"] ).flatten(), header
 
 def get_allpos(lst):
-	pos1 = []
-	pos2 = []
-	pos3 = []
-
-	for file in lst:
-		Gadget  = ReadGadget(file)
-		Hea     = Gadget.read_header()
-		pos_tmp = Gadget.get_positions()
-		pos_tmp.shape = (len(pos_tmp)/3, 3)
-
-		Id      = Gadget.get_identities()
+	header, data = read_snapshot( lst, fields = ("pos", "id") )
 
-		#pos = np.append(pos, [pos_tmp[i:i+3] for i in range(0, len(pos_tmp), 3)], axis=0)
-		pos1    = np.append(pos1, pos_tmp[ (Id-1) == (1-1)])
-		pos2    = np.append(pos2, pos_tmp[ (Id-1) == (2-1)])
-		pos3    = np.append(pos3, pos_tmp[ (Id-1) == (3-1)])
+	pos = np.concatenate( data["pos"] )
+	Id  = np.concatenate( data["id"] )
 
-		Gadget.close()
-
-	pos1.shape = (len(pos1)/3, 3)
-	pos2.shape = (len(pos2)/3, 3)
-	pos3.shape = (len(pos3)/3, 3)
+	pos1 = pos[ (Id-1) == (1-1) ]
+	pos2 = pos[ (Id-1) == (2-1) ]
+	pos3 = pos[ (Id-1) == (3-1) ]
 
 	return pos1, pos2, pos3
 
@@ -166,22 +264,356 @@ class ReadBinaryBlock :
 
                 self.f.close()
 
+# table des blocs d'un fichier Gadget
+class BlockIndex( dict ) :
+
+        """ Table des blocs d'un fichier Gadget : nom -> (début des données, taille en octets, type, nombre de composantes).
+
+        La table est construite en parcourant une seule fois les marqueurs Fortran du fichier, puis enregistrée
+        dans un fichier annexe (nom du snapshot + suffix) identifié par la taille et la date de modification du
+        snapshot. Rouvrir le même snapshot ne coûte alors que la lecture de ce fichier annexe, et lire un bloc
+        quelconque ne demande qu'un seul déplacement dans le fichier.
+        """
+
+        # extension du fichier annexe
+        suffix = ".idx"
+
+        # initialisation
+        def __init__( self, filename, cache = True ) :
+
+                """ Initialisation : lecture du fichier annexe s'il est à jour, sinon parcours du fichier """
+
+                super().__init__()
+
+                self.filename = filename
+
+                # clé identifiant la version du fichier
+                stat     = os.stat( filename )
+                self.key = [ stat.st_size, stat.st_mtime_ns ]
+
+                if cache and self.load() :
+                        return
+
+                self.scan()
+
+                if cache :
+                        self.save()
+
+        # nom du fichier annexe
+        @property
+        def sidecar( self ) :
+                return self.filename + self.suffix
+
+        # pour lire la table depuis le fichier annexe
+        def load( self ) :
+
+                """ Charge la table depuis le fichier annexe. Renvoie False s'il est absent ou périmé """
+
+                try:
+                        with open( self.sidecar, "r" ) as fich:
+                                tmp = json.load( fich )
+                except (OSError, ValueError):
+                        return False
+
+                if tmp.get("key") != self.key :
+                        return False
+
+                for name, (off, noctet, typ, ncomp) in tmp["blocks"].items():
+                        self[name] = (off, noctet, np.dtype(typ), ncomp)
+
+                return True
+
+        # pour écrire la table dans le fichier annexe
+        def save( self ) :
+
+                """ Écrit la table dans le fichier annexe. Un dossier en lecture seule n'est pas une erreur """
+
+                blocks = { name: [off, noctet, typ.str, ncomp] for name, (off, noctet, typ, ncomp) in self.items() }
+                try:
+                        with open( self.sidecar, "w" ) as fich:
+                                json.dump( { "key": self.key, "blocks": blocks }, fich )
+                except OSError:
+                        pass
+
+        # format du fichier (1 ou 2) déduit de la position du header
+        @property
+        def format( self ) :
+                return 2 if self["head"][0] != 4 else 1
+
+        # pour parcourir le fichier
+        def scan( self ) :
+
+                """ Parcourt les marqueurs Fortran du fichier et remplit la table.
+
+                Les fichiers au format 2 sont reconnus à leur premier marqueur (8 octets) : le nom de chaque bloc
+                est alors lu dans son étiquette, au lieu d'être déduit de l'ordre des blocs du format 1.
+                """
+
+                self.clear()
+
+                with open( self.filename, "rb" ) as f:
+
+                        first = np.fromfile( f, dtype = np.int32, count = 1 )
+                        if len(first) != 1 :
+
+                                raise IOError ("\033[31;1mError reading Gadget file " + self.filename + "\033[0m")
+
+                        # au format 2, l'étiquette "HEAD" (16 octets) précède le header
+                        off = 16 if first[0] == 8 else 0
+
+                        # le header
+                        f.seek( off )
+                        head = np.fromfile( f, dtype = header_dtype, count = 1 )
+                        if len(head) != 1 or head["head"][0] != head["tail"][0] or head["head"][0] != header_dtype.itemsize - 8 :
+
+                                raise IOError ("\033[31;1mError reading Gadget file " + self.filename + "\033[0m")
+
+                        self["head"] = (off + 4, header_dtype.itemsize - 8, np.dtype(np.uint8), 1)
+
+                        Npart = head["Npart"][0].astype(np.int64)
+                        Ntot  = int( Npart.sum() )
+                        Nm    = int( sum( np.where( head["Massarr"][0] == 0.0, Npart, 0 ) ) )
+
+                        # nombre d'éléments de chaque bloc
+                        count = { "pos": Ntot, "vel": Ntot, "id": Ntot, "mass": Nm }
+
+                        # les blocs attendus, dans l'ordre du format 1
+                        names = [ "pos", "vel", "id" ]
+                        if Nm != 0 :
+                                names.append( "mass" )
+                        if Npart[0] != 0 :
+                                names += [ "u", "rho" ]
+
+                        off  += header_dtype.itemsize
+                        size  = self.key[0]
+                        while off + 8 <= size and ( first[0] == 8 or names ):
+
+                                # au format 2, on lit l'étiquette du bloc
+                                if first[0] == 8 :
+                                        f.seek( off + 4 )
+                                        label = f.read(4).decode("ascii", "replace")
+                                        name  = block_labels.get( label, label.strip().lower() )
+                                        off  += 16
+                                else:
+                                        name  = names.pop(0)
+
+                                f.seek( off )
+                                noctet = int( np.fromfile( f, dtype = np.int32, count = 1 )[0] )
+                                f.seek( off + 4 + noctet )
+                                noctet_fin = np.fromfile( f, dtype = np.int32, count = 1 )
+
+                                if len(noctet_fin) != 1 or noctet != noctet_fin[0] :
+
+                                        raise IOError ("\033[31;1mLes extrémités des blocs ne correspondent pas dans " + self.filename + " !\033[0m")
+
+                                # type des données : simple ou double précision, identités sur 32 ou 64 bits
+                                typ, ncomp = block_types.get( name, (np.float32, 1) )
+                                N          = count.get( name, int(Npart[0]) )
+                                if N != 0 and noctet == 8 * ncomp * N :
+                                        typ = np.int64 if name == "id" else np.float64
+
+                                self[name] = (off + 4, noctet, np.dtype(typ), ncomp)
+                                off       += noctet + 8
+
 # pour la lecture des fichiers Gadget
 class ReadGadget( ReadBinaryBlock ) :
 
         """ Une classe pour la lecture des fichiers Gadget """
 
         # initialisation
-        def __init__(self, nomsnap):
+        def __init__(self, nomsnap, cache_index=True, ptype=None):
+
+                """ Initialisation.
+
+                nomsnap            :: nom du fichier Gadget.
+                cache_index = True :: enregistrer la table des blocs dans un fichier annexe (cf BlockIndex).
+                ptype = None       :: si donné, les méthodes get_* ne lisent que les particules de ce type.
+                """
 
                 # on permet la lecture du fichier binaire avec la classe à cet effet
                 super().__init__(nomsnap)
 
+                # la table des blocs n'est construite qu'à la première lecture d'un bloc
+                self.cache_index = cache_index
+                self.ptype       = ptype
+
+        # table des blocs du fichier
+        @property
+        def index(self):
+
+                """ Table des blocs du fichier (BlockIndex), construite à la demande """
+
+                try:
+                        return self._index
+                except AttributeError:
+                        self._index = BlockIndex(self.filename, cache=self.cache_index)
+                        return self._index
+
+        # pour lire un bloc par son nom
+        def read_block(self, name):
+
+                """ Pour lire le bloc name ("pos", "vel", "id", "mass", "u" ou "rho") en un seul déplacement """
+
+                # un seul type de particule : on ne lit que sa tranche du bloc (ou la masse constante de Massarr,
+                # même sans bloc de masse)
+                if self.ptype is not None :
+                        return self._type_block(name, lambda start, count: self.read_range(name, start, count).ravel())
+
+                if name not in self.index :
+
+                        raise IOError ("\033[33;1mNo block '" + name + "' in " + self.filename + " !\033[0m")
+
+                off, noctet, typ, ncomp = self.index[name]
+
+                # on se place au début des données
+                self.f.seek(off)
+
+                # on lit le bloc
+                return self.get_data(typ, noctet // typ.itemsize)
+
+        # header lu à la demande
+        def _header(self):
+
+                """ Renvoie le header, lu à la première demande """
+
+                try:
+                        return self.header
+                except AttributeError:
+                        return self.read_header()
+
+        # pour lire la tranche d'un bloc correspondant au type self.ptype
+        def _type_block(self, name, read):
+
+                """ Appelle read(début, nombre) sur la tranche du type self.ptype dans le bloc name """
+
+                rng    = self.type_range(name, self.ptype)
+                header = self._header()
+
+                # les particules de ce type ont une masse constante
+                if rng is None and name == "mass" :
+                        return np.full( int(header["Npart"][self.ptype]), header["Massarr"][self.ptype], dtype=np.float32 )
+
+                if rng is None :
+
+                        raise IOError ("\033[33;1mNo particles of type " + str(self.ptype) + " in block '" + name + "' !\033[0m")
+
+                return read(*rng)
+
+        # pour situer un type de particule dans un bloc
+        def type_range(self, name, ptype):
+
+                """ Renvoie (premier élément, nombre d'éléments) du type ptype dans le bloc name, None si le type n'y est pas """
+
+                self._header()
+
+                # les types présents dans le bloc
+                if name == "mass":
+                        inblock = self.header["Massarr"] == 0.0
+                elif name in ("u", "rho"):
+                        inblock = np.arange(6) == 0
+                else:
+                        inblock = np.ones(6, dtype=bool)
+
+                if not inblock[ptype] :
+                        return None
+
+                Npart = np.where( inblock, self.header["Npart"], 0 ).astype(np.int64)
+
+                return int( Npart[:ptype].sum() ), int( Npart[ptype] )
+
+        # pour lire une partie d'un bloc
+        def read_range(self, name, start, count, out=None):
+
+                """ Pour lire count éléments du bloc name à partir de l'élément start (un élément = une particule).
+
+                Si out est donné, les données y sont écrites directement ; out doit avoir la bonne taille.
+                """
+
+                if name not in self.index :
+
+                        raise IOError ("\033[33;1mNo block '" + name + "' in " + self.filename + " !\033[0m")
+
+                off, noctet, typ, ncomp = self.index[name]
+                size                    = typ.itemsize * ncomp
+
+                if start < 0 or count < 0 or (start + count) * size > noctet :
+
+                        raise IndexError ("\033[31;1mElements " + str(start) + ":" + str(start + count) + " out of block '" + name + "' !\033[0m")
+
+                if out is None:
+                        out = np.empty( (count, ncomp) if ncomp != 1 else (count,), dtype=typ )
+
+                # rien à lire (type absent du snapshot) : memoryview ne sait pas convertir un tableau vide
+                if count == 0 :
+                        return out
+
+                # on se place au début de la tranche
+                self.f.seek( off + start * size )
+
+                # lecture directe dans out si possible, sinon conversion
+                if out.dtype == typ and out.flags["C_CONTIGUOUS"] :
+                        if self.f.readinto( memoryview(out).cast("B") ) != count * size :
+
+                                raise IOError ("\033[31;1mUnexpected end of file in " + self.filename + " !\033[0m")
+                else:
+                        out[...] = self.get_data( typ, count * ncomp ).reshape( out.shape )
+
+                return out
+
+        # pour parcourir le fichier par morceaux
+        def iter_chunks(self, fields=("pos", "vel", "id"), chunk=1_000_000):
+
+                """ Générateur parcourant les particules par morceaux de chunk particules.
+
+                Chaque itération renvoie un dictionnaire champ -> tableau, les tableaux de tous les champs
+                correspondant aux mêmes particules. Seul un morceau est en mémoire à la fois, ce qui permet de
+                traiter des snapshots plus gros que la mémoire disponible.
+
+                fields          :: blocs à lire parmi "pos", "vel", "id" et "mass" (les masses constantes
+                                   de Massarr sont recopiées pour les types qui n'ont pas de bloc de masse).
+                chunk = 1000000 :: nombre de particules par morceau.
+                """
+
+                for field in fields:
+                        if field not in ("pos", "vel", "id", "mass") :
+
+                                raise ValueError ("\033[31;1mField '" + field + "' does not cover every particle, it cannot be read by chunks !\033[0m")
+
+                Npart = self._header()["Npart"].astype(np.int64)
+                first = np.cumsum(Npart) - Npart
+                Ntot  = int( Npart.sum() )
+
+                for a in range(0, Ntot, chunk):
+                        b   = min(a + chunk, Ntot)
+                        res = dict()
+
+                        for field in fields:
+
+                                if field != "mass" :
+                                        res[field] = self.read_range(field, a, b - a)
+                                        continue
+
+                                # les masses : bloc de masse ou masse constante suivant le type
+                                res[field] = np.empty(b - a, dtype=np.float32)
+                                for t in range(6):
+                                        lo, hi = max(a, first[t]), min(b, first[t] + Npart[t])
+                                        if lo >= hi :
+                                                continue
+
+                                        rng = self.type_range("mass", t)
+                                        if rng is None :
+                                                res[field][lo-a:hi-a] = self.header["Massarr"][t]
+                                        else:
+                                                self.read_range("mass", rng[0] + lo - first[t], hi - lo, out=res[field][lo-a:hi-a])
+
+                        yield res
+
         # pour lire le header
         def read_header(self):
-
                 """ Pour la lecture des données dans le header du fichier Gadget """
-                self.f.seek(0)
+
+                # on se place au début du header (après l'étiquette au format 2)
+                self.f.seek(self.index["head"][0] - 4)
 
                 # le nombre d'octet dans le bloc du header
                 noctet = self.border_block()
@@ -223,140 +655,347 @@ class ReadGadget( ReadBinaryBlock ) :
 
                 """ Pour lire les positions des particules dans le fichier de Gadget """
 
-                # on se ramène en position 0
-                self.f.seek(0)
-
-                # on se déplace après le header
-                self.f.seek(264)
-
-                # on renvoie les positions
-                return self.get_block("float32")
+                return self.read_block("pos")
 
         # on lit les vitesses
         def get_velocities(self):
 
                 """ Pour lire les vitesses des particules dans le fichier Gadget """
 
-                try:
-                        self.header
-                except AttributeError:
-                        self.read_header()
-
-                # on se ramène en position 0
-                self.f.seek(0)
-
-                # on se déplace après le header
-                self.f.seek(264 + 4 + 3 * sum(self.header["Npart"]) * np.dtype("float32").itemsize + 4)
-
-                #print(264 + 3 * sum(self.header["Npart"]) * np.dtype("float32").itemsize + 8)
-
-                # on lit les vitesses et les renvoie
-                return self.get_block("float32")
+                return self.read_block("vel")
 
         # on lit les identités des galaxies
         def get_identities(self):
 
                 """ Pour lire les identités des particules dans le fichier Gadget """
 
-                try:
-                        self.header
-                except NameError:
-                        self.read_header()
-
-                # on se ramène en position 0
-                self.f.seek(0)
-
-                # on se déplace après le header
-                self.f.seek( 264 + 6 * sum(self.header["Npart"]) * np.dtype("float32").itemsize + 16 )
-
-                # on lit les identités
-                return self.get_block("int32")
+                return self.read_block("id")
 
         # on lit les masses si elles sont présentes
         def get_masses(self):
 
                 """ Pour lire les masses dans le fichier Gadget si elles sont présentes """
 
-                try:
-                        self.header
-                except NameError:
-                        self.read_header()
-
                 # on vérifie si on a des données à lire
-                Nm = sum( np.where( self.header["Massarr"] == 0.0, self.header["Npart"], 0 ) )
-                if Nm == 0 :
+                if "mass" not in self.index and ( self.ptype is None or self._header()["Massarr"][self.ptype] == 0.0 ) :
 
                         raise IOError ("\033[33;1mNo data for particles masses to be read !\033[0m")
 
-                # on se ramène en position 0
-                self.f.seek(0)
-
-                # on se déplace après le header
-                self.f.seek( 264 + 6 * sum(self.header["Npart"]) * np.dtype("float32").itemsize + 24 +
-                        sum(self.header["Npart"]) * np.dtype("int32").itemsize )
-
-                # on lit les masses
-                return self.get_block("float32")
+                return self.read_block("mass")
 
         # pour récupérer les énergies
         def get_energies(self):
 
                 """ Pour lire les énergies des particules dans le fichier Gadget """
 
-                try:
-                        self.header
-                except NameError:
-                        self.read_header()
-
                 # on vérifie que l'on a des particules à lire
-                if self.header["Npart"][0] == 0 :
+                if "u" not in self.index :
 
                         raise IOError ("\033[33;1mNo particles for energies to be read !\033[0m")
 
-                # nombre de particules de masses
-                Nm = sum( np.where( self.header["Massarr"] == 0.0, self.header["Npart"], 0 ) ) * np.dtype("float32").itemsize
-                if Nm != 0 :
-                        Nm += 8
+                return self.read_block("u")
 
-                # on se ramène en position 0
-                self.f.seek(0)
+        # pour récupérer les densités
+        def get_densities(self):
+
+                """ Pour lire les densités des particules si elles sont présentes """
+
+                # on vérifie que l'on a des particules à lire
+                if "rho" not in self.index :
+
+                        raise IOError ("\033[33;1mNo particles for densities to be read !\033[0m")
+
+                return self.read_block("rho")
 
-                # on se déplace après le header
-                self.f.seek( 264 + 6 * sum(self.header["Npart"]) * np.dtype("float32").itemsize + 24 +
-                        sum(self.header["Npart"]) * np.dtype("int32").itemsize + Nm)
+# pour la lecture des fichiers Gadget sans copie, par projection en mémoire
+class MapGadget( ReadGadget ) :
 
-                # on renvoie les énergies
-                return self.get_block("float32")
+        """ Une classe pour la lecture des fichiers Gadget (format 1) par projection en mémoire (np.memmap).
+
+        Le fichier est projeté une seule fois, et les méthodes get_* renvoient des vues np.memmap sur les blocs,
+        de forme (N, 3) pour les positions et les vitesses. Par défaut (mode="c"), la projection est en
+        copie sur écriture : rien n'est copié tant que l'appelant ne modifie pas les données, et le fichier
+        n'est jamais modifié.
+        """
+
+        # initialisation
+        def __init__(self, nomsnap, mode="c", cache_index=True, ptype=None):
+
+                # on garde l'interface de ReadGadget (border_block, get_block, index, ...)
+                super().__init__(nomsnap, cache_index=cache_index, ptype=ptype)
+
+                # on projette le fichier en mémoire une bonne fois pour toutes
+                self.mm = np.memmap(nomsnap, dtype=np.uint8, mode=mode)
+
+                # lecture du header
+                self.read_header()
+
+        # pour lire le header
+        def read_header(self):
+
+                """ Pour la lecture du header à travers le type structuré header_dtype """
+
+                off  = self.index["head"][0] - 4
+                head = self.mm[off:off+header_dtype.itemsize].view(header_dtype)[0]
+
+                # vérification des erreurs
+                if head["head"] != head["tail"] or head["head"] != header_dtype.itemsize - 8 :
+
+                        raise IOError ("\033[31;1mError reading Gadget file " + self.filename + "\033[0m")
+
+                self.header = { name: head[name] for name in header_dtype.names if name not in ("head", "tail") }
+
+                # on renvoie le header
+                return self.header
+
+        # pour obtenir une vue sur un bloc
+        def _view(self, name):
+
+                """ Renvoie une vue np.memmap du bloc name, avec le type et le nombre de composantes de la table des blocs """
+
+                if name not in self.index :
+
+                        raise IOError ("\033[33;1mNo block '" + name + "' in " + self.filename + " !\033[0m")
+
+                off, noctet, typ, ncomp = self.index[name]
+
+                # un seul type de particule : vue sur sa tranche du bloc
+                if self.ptype is not None :
+                        off, noctet = self._type_block(name, lambda start, count: (off + start * typ.itemsize * ncomp, count * typ.itemsize * ncomp))
+
+                data = self.mm[off:off+noctet].view(typ)
+
+                if ncomp != 1 :
+                        data = data.reshape( (-1, ncomp) )
+
+                return data
+
+        # on lit les positions
+        def get_positions(self):
+
+                """ Vue (N, 3) sur les positions des particules """
+
+                return self._view("pos")
+
+        # on lit les vitesses
+        def get_velocities(self):
+
+                """ Vue (N, 3) sur les vitesses des particules """
+
+                return self._view("vel")
+
+        # on lit les identités
+        def get_identities(self):
+
+                """ Vue sur les identités des particules (entiers 32 ou 64 bits suivant la taille du bloc) """
+
+                return self._view("id")
+
+        # on lit les masses
+        def get_masses(self):
+
+                """ Vue sur les masses des particules si elles sont présentes """
+
+                # masse constante pour le type demandé
+                if self.ptype is not None and self._header()["Massarr"][self.ptype] != 0.0 :
+                        return self._type_block("mass", None)
+
+                if "mass" not in self.index :
+
+                        raise IOError ("\033[33;1mNo data for particles masses to be read !\033[0m")
+
+                return self._view("mass")
+
+        # pour récupérer les énergies
+        def get_energies(self):
+
+                """ Vue sur les énergies des particules de gaz """
+
+                if "u" not in self.index :
+
+                        raise IOError ("\033[33;1mNo particles for energies to be read !\033[0m")
+
+                return self._view("u")
 
         # pour récupérer les densités
         def get_densities(self):
 
-                """ Pour lire les densités des particules si elles sont présentes """
+                """ Vue sur les densités des particules de gaz """
+
+                if "rho" not in self.index :
+
+                        raise IOError ("\033[33;1mNo particles for densities to be read !\033[0m")
+
+                return self._view("rho")
+
+        # pour fermer le fichier
+        def close(self):
+
+                """ Pour fermer le fichier et libérer la projection """
+
+                super().close()
+                self.mm = None
+
+# pour la lecture des snapshots Gadget au format HDF5 (format 3)
+class ReadGadgetHDF5( ReadGadget ) :
+
+        """ Une classe pour la lecture des snapshots Gadget au format HDF5, avec la même interface que ReadGadget.
+
+        Les tableaux renvoyés sont ceux de ReadGadget (concaténation des types dans l'ordre 0 à 5). Les
+        lectures partielles (ptype, read_range, iter_chunks) passent par des hyperslabs HDF5 : seules les
+        lignes demandées sont lues sur le disque.
+        """
+
+        # nom des datasets de chaque bloc
+        datasets = {
+                "pos":  "Coordinates",
+                "vel":  "Velocities",
+                "id":   "ParticleIDs",
+                "mass": "Masses",
+                "u":    "InternalEnergy",
+                "rho":  "Density",
+        }
+
+        # correspondance entre les attributs HDF5 et les champs du header
+        attributes = {
+                "Npart":         "NumPart_ThisFile",
+                "Massarr":       "MassTable",
+                "Time":          "Time",
+                "Redshift":      "Redshift",
+                "FlagSfr":       "Flag_Sfr",
+                "FlagFeedBack":  "Flag_Feedback",
+                "Nall":          "NumPart_Total",
+                "FlagCooling":   "Flag_Cooling",
+                "NumFiles":      "NumFilesPerSnapshot",
+                "BoxSize":       "BoxSize",
+                "Omega0":        "Omega0",
+                "OmegaLambda":   "OmegaLambda",
+                "HubbleParam":   "HubbleParam",
+                "FlagAge":       "Flag_StellarAge",
+                "FlagMetals":    "Flag_Metals",
+                "NallHW":        "NumPart_Total_HighWord",
+                "flag_entr_ics": "Flag_Entropy_ICs",
+        }
+
+        # initialisation
+        def __init__(self, nomsnap, cache_index=True, ptype=None):
+
+                import h5py
+
+                self.filename    = nomsnap
+                self.f           = h5py.File(nomsnap, "r")
+                self.cache_index = cache_index
+                self.ptype       = ptype
+
+                self.read_header()
+
+        # table des blocs présents dans le fichier
+        @property
+        def index(self):
+
+                """ Table des blocs présents : nom -> (None, taille en octets, type, nombre de composantes) """
 
                 try:
-                        self.header
-                except NameError:
-                        self.read_header()
+                        return self._index
+                except AttributeError:
+                        pass
 
-                # on vérifie que l'on a des particules à lire
-                if self.header["Npart"][0] == 0 :
+                self._index = dict()
+                for name, dset in self.datasets.items():
+                        parts = [ self.f["PartType%d/%s" % (t, dset)] for t in range(6) if "PartType%d/%s" % (t, dset) in self.f ]
+                        if len(parts) == 0 :
+                                continue
 
-                        raise IOError ("\033[33;1mNo particles for energies to be read !\033[0m")
+                        ncomp = parts[0].shape[1] if len(parts[0].shape) == 2 else 1
+                        self._index[name] = (None, sum( d.size for d in parts ) * parts[0].dtype.itemsize, parts[0].dtype, ncomp)
+
+                return self._index
+
+        # pour lire le header
+        def read_header(self):
+
+                """ Pour la lecture des attributs du groupe Header """
+
+                attrs       = self.f["Header"].attrs
+                self.header = dict()
+                for key, name in self.attributes.items():
+                        if name in attrs :
+                                self.header[key] = attrs[name]
+
+                # les tableaux par type sont dans le même type que pour ReadGadget
+                for key in ("Npart", "Nall", "NallHW"):
+                        if key in self.header :
+                                self.header[key] = np.asarray(self.header[key], dtype=np.int32)
+
+                # on renvoie le header
+                return self.header
+
+        # pour situer un type de particule dans un bloc
+        def type_range(self, name, ptype):
+
+                """ Comme ReadGadget.type_range, d'après les datasets présents dans le fichier """
+
+                present = np.array( [ "PartType%d/%s" % (t, self.datasets[name]) in self.f for t in range(6) ] )
+                if not present[ptype] :
+                        return None
+
+                Npart = np.where( present, self.header["Npart"], 0 ).astype(np.int64)
+
+                return int( Npart[:ptype].sum() ), int( Npart[ptype] )
+
+        # pour lire une partie d'un bloc
+        def read_range(self, name, start, count, out=None):
+
+                """ Pour lire count éléments du bloc name à partir de l'élément start, type par type, par hyperslab """
+
+                if name not in self.index :
+
+                        raise IOError ("\033[33;1mNo block '" + name + "' in " + self.filename + " !\033[0m")
+
+                _, _, typ, ncomp = self.index[name]
+
+                if out is None:
+                        out = np.empty( (count, ncomp) if ncomp != 1 else (count,), dtype=typ )
+
+                for t in range(6):
+                        rng = self.type_range(name, t)
+                        if rng is None :
+                                continue
+
+                        lo, hi = max(start, rng[0]), min(start + count, rng[0] + rng[1])
+                        if lo >= hi :
+                                continue
+
+                        out[lo-start:hi-start] = self.f["PartType%d/%s" % (t, self.datasets[name])][lo-rng[0]:hi-rng[0]]
+
+                return out
+
+        # pour lire un bloc par son nom
+        def read_block(self, name):
+
+                """ Pour lire le bloc name, éventuellement restreint au type self.ptype """
+
+                if self.ptype is not None :
+                        return self._type_block(name, lambda start, count: self.read_range(name, start, count).ravel())
+
+                if name not in self.index :
+
+                        raise IOError ("\033[33;1mNo block '" + name + "' in " + self.filename + " !\033[0m")
+
+                _, noctet, typ, ncomp = self.index[name]
 
-                # nombre de particules de masses
-                Nm = sum( np.where( self.header["Massarr"] == 0.0, self.header["Npart"], 0 ) ) * np.dtype("float32").itemsize
-                if Nm != 0 :
-                        Nm += 8
+                return self.read_range(name, 0, noctet // (typ.itemsize * ncomp)).ravel()
 
-                # on se ramène en position 0
-                self.f.seek(0)
+def open_gadget( filename, **kwargs ):
 
-                # on se déplace après le header
-                self.f.seek( 264 + 6 * sum(self.header["Npart"]) * np.dtype("float32").itemsize + 24 +
-                        sum(self.header["Npart"]) * np.dtype("int32").itemsize + Nm + 8 + self.header["Npart"][0] *
-                        np.dtype("float32").itemsize )
+	""" Ouvre un snapshot Gadget avec le lecteur adapté à son format : ReadGadget (formats 1 et 2) ou ReadGadgetHDF5.
+	Les paramètres optionnels sont passés au constructeur du lecteur.
+	"""
 
-                # on renvoie les densités
-                return self.get_block("float32")
+	with open( filename, "rb" ) as f:
+		magic = f.read(8)
 
+	if magic == b"\x89HDF\r\n\x1a\n" :
+		return ReadGadgetHDF5( filename, **kwargs )
 
+	return ReadGadget( filename, **kwargs )
@@ -2,6 +2,7 @@
 
 import numpy as np
 from ..Utils import Ode as o
+from .SIB    import milne
 
 """Package contenant méthodes et classes travaillant autour du modèle de
 sphère auto-gravitante, isotherme et tronquée.
@@ -31,8 +32,8 @@ class Henon(o.Ode):
 	package Outils et implémente la résolution des équations pour la
 	sphère de Hénon.
 	"""
-	def __init__(self, M, R, N=1e4, beta=1.0, t=100, ti = 0):
-		super(Henon, self).__init__(t, ti)
+	def __init__(self, M, R, N=1e4, beta=1.0, t=100, ti = 0, solver="odeint"):
+		super(Henon, self).__init__(t, ti, solver=solver)
 		self._X0  = np.array([3.0, 0.0], dtype=np.float64)
 		self.beta = beta
 		self.R    = R
@@ -48,14 +49,7 @@ class Henon(o.Ode):
 		self._X0 = newval
 
 	def func(self, v, x=0):
-		y = np.zeros(2)
-		if x/2.0 >= 1.0e-3:
-			y[0] = v[0]*(3.0 - v[0] - v[1])/x	# u(x)
-			y[1] = v[1]*(v[0] - 1.0)/x		# v(x)
-		else:
-			y[0] = -2.0/5.0*x + 19.0*4.0/1050.0*x**3.0 - 823.0*6.0/189000.0*x**5.0
-			y[1] = 2.0/3.0*x - 4.0/30.0*x**3.0 + 6.0/315.0*x**5.0
-		return y
+		return milne(v, x)
 
 	def Solve(self):
 		"""Calcul le potentiel pour la sphère de Hénon.
@@ -1,25 +1,132 @@
 # -*- encoding: utf-8 -*-
 
+import os
+import hashlib
 import numpy	         as np
 import scipy.special     as ss
 import scipy.integrate   as ig
 import scipy.interpolate as ip
 
 from ..Utils import Ode  as o
+from ..Utils import Jacobian as jb
+
+from collections import OrderedDict
 
 """Package contenant des classes et méthodes permettant de travailler
 sur la sphére de King.
+
+Les solutions adimensionnées (ADimKing.Solve) sont gardées en mémoire (les cache_size dernières) et sur disque
+dans cache_dir (fichiers .npz compressés, répertoire donné par la variable d'environnement LIBTHESE_KING_CACHE, None
+pour désactiver le disque), indexées par W0, la condition initiale et les paramètres d'intégration : DimKing redimensionne
+la solution sans refaire l'intégration. Seules les lignes finies de la solution sont gardées (la grille est reconstruite),
+et les fichiers les moins récemment utilisés sont effacés au-delà de cache_disk_size octets.
 """
 
+_cache          = OrderedDict()
+cache_size      = 8
+cache_disk_size = 256 * 2**20
+cache_dir       = os.environ.get("LIBTHESE_KING_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "LibThese", "King"))
+
+def solution_key(W0, ti=0, tmax=100, dt=1e-4, solver="odeint", X0=None):
+	"""Clé d'une solution adimensionnée : W0, bornes et pas de la grille, intégrateur, condition initiale (par défaut
+	(W0, 0)).
+	"""
+	X0 = (W0, 0.0) if X0 is None else np.ravel(X0)
+	return (float(W0), float(ti), float(tmax), float(dt), str(solver), tuple( float(a) for a in X0 ))
+
+def _disk_name(key):
+	return os.path.join(cache_dir, "king_" + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + ".npz")
+
+def cached_solution(key, solve):
+	"""Retourne la solution (x, X) de clé key, depuis la mémoire, le disque, ou en appelant solve() (qui retourne
+	(x, X), ou tout autre tuple de tableaux). Les tableaux retournés sont partagés et en lecture seule.
+	"""
+	if key in _cache:
+		_cache.move_to_end(key)
+		return _cache[key]
+
+	res = None
+	if cache_dir is not None and os.path.isfile(_disk_name(key)):
+		try:
+			with np.load(_disk_name(key)) as fich:
+				res = tuple( fich["arr_%d" % i] for i in range(len(fich.files)) )
+			os.utime(_disk_name(key))
+		except (OSError, ValueError, KeyError):
+			res = None
+
+	if res is None:
+		res = tuple(np.array(a, dtype=np.float64) for a in solve())
+		if cache_dir is not None:
+			try:
+				os.makedirs(cache_dir, exist_ok=True)
+				tmp = _disk_name(key) + ".%d.tmp.npz" % os.getpid()
+				np.savez_compressed(tmp, *res)
+				os.replace(tmp, _disk_name(key))
+				_evict_disk()
+			except OSError:
+				pass
+
+	for a in res:
+		a.flags.writeable = False
+
+	_cache[key] = res
+	while len(_cache) > cache_size:
+		_cache.popitem(last=False)
+
+	return res
+
+def _evict_disk():
+	"""Efface les fichiers du cache disque les moins récemment utilisés au-delà de cache_disk_size octets."""
+	files = [ os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.startswith("king_") and name.endswith(".npz") ]
+	stats = sorted( (os.stat(name).st_mtime, os.stat(name).st_size, name) for name in files )
+	total = sum( st[1] for st in stats )
+	for _, size, name in stats[:-1]:
+		if total <= cache_disk_size:
+			break
+		os.remove(name)
+		total -= size
+
+def clear_cache(disk=False):
+	"""Vide le cache mémoire des solutions (et les fichiers de cache_dir avec disk=True)."""
+	_cache.clear()
+	if disk and cache_dir is not None and os.path.isdir(cache_dir):
+		for name in os.listdir(cache_dir):
+			if name.startswith("king_") and name.endswith(".npz"):
+				os.remove(os.path.join(cache_dir, name))
+
+def density(W):
+	"""Densité adimensionnée et normalisée du King au potentiel W (scalaire ou tableau), nulle pour W <= 0 (cf. ADimKing.rho,
+	qui donne NaN au-delà du rayon de marée).
+	"""
+	W = np.maximum(W, 0.0)
+	return np.exp(W)*ss.erf(np.sqrt(W)) - np.sqrt(4.0*W/np.pi)*(1.0+2.0*W/3.0)
+
+def series_coefficients(W0):
+	"""Coefficients (g2, g4) du développement au centre W(x) = W0 + g2 x^2/2 + g4 x^4/24 (W0 scalaire ou tableau)."""
+	W0  = np.asarray(W0, dtype=np.float64)
+	rho = density(W0)
+	return -rho/3.0, 2.0 * rho * (np.sqrt(W0/np.pi) - np.exp(W0) * ss.erf(np.sqrt(W0))/2.0)/5.0
+
 class ADimKing(o.Ode):
 	"""Cette classe permet de gérer un Modèle de King Adimensionné,
 	et d'en tirer les différentes quantités intéressantes.
 	"""
-	def __init__(self, W0, t=100, ti=0, dt=1e-4, N=None):
-		super(ADimKing, self).__init__(t, ti, dt, N)
+	def __init__(self, W0, t=100, ti=0, dt=1e-4, N=None, solver="odeint"):
+		super(ADimKing, self).__init__(t, ti, dt, N, solver=solver)
 		self.W0 = W0
 		self._X0 = np.array( [ W0, 0.0 ], dtype=np.float64 )
 
+	@property
+	def W0(self):
+		return self._W0
+
+	@W0.setter
+	def W0(self, newval):
+		# Les coefficients du développement au centre ne dépendent que de W0 : calculés une fois ici plutôt qu'à chaque
+		# appel de func.
+		self._W0            = newval
+		self._g2, self._g4 = (float(g) for g in series_coefficients(newval))
+
 	@property
 	def X0(self):
 		return self._X0
@@ -31,16 +138,51 @@ class ADimKing(o.Ode):
 	def __call__(self, x, t=0):
 		return self.func(x, t)
 
+	def Solve(self):
+		"""Résout l'équation de King, ou relit la solution de même W0, même condition initiale et même grille dans le cache.
+		Le résultat est placé dans l'attribut X, l'axe "temporelle" dans x (copies modifiables), le rayon de marée dans
+		x_trunc avec solver = "ivp" (cf. Ode.Solve). Si la solution vient du cache, nfev est nul et infodict vaut None
+		(ils ne sont pas gardés).
+		"""
+		def solve():
+			super(ADimKing, self).Solve()
+			# Seules les lignes jusqu'à la dernière finie sont gardées (au-delà, odeint ne donne que des NaN) :
+			fin = np.flatnonzero(np.all(np.isfinite(self.X), axis=1))
+			nb  = fin[-1] + 1 if len(fin) else 0
+			return self.X[:nb], np.array([ len(self.x), np.nan if self.x_trunc is None else self.x_trunc ])
+
+		solver = self.solver if self.solver == "odeint" else "%s:%s:%g:%g" % (self.solver, self.method, self.rtol, self.atol)
+		self.infodict, self.nfev = None, 0
+		X, info                  = cached_solution(solution_key(self.W0, self._ti, self._tmax, self._dt, solver, self.X0), solve)
+
+		self.Generate_x()
+		self.x            = self.x[:int(info[0])]
+		self.X            = np.full((len(self.x), X.shape[1]), np.nan)
+		self.X[:len(X)]   = X
+		self.x_trunc      = info[1] if np.isfinite(info[1]) else None
+
+	def Events(self):
+		"""Arrêt de l'intégration au rayon de marée, où le potentiel W s'annule (solver = "ivp")."""
+		def tidal(t, X):
+			return X[0]
+		tidal.terminal  = True
+		tidal.direction = -1
+		return [tidal]
+
+	def ivp_func(self, t, X):
+		"""Second membre de solve_ivp, prolongé par une densité nulle au-delà du rayon de marée (W < 0) pour les pas d'essai
+		qui franchissent l'événement.
+		"""
+		if t > 1e-6:
+			return np.array( [ X[1], -density(X[0]) - 2.0*X[1]/t ], dtype="float64" )
+		return self.func(X, t)
+
 	def func(self, x, t=0):
 		if t > 1e-6:
 			return np.array( [ x[1], -self.rho(x[0]) - 2.0*x[1]/t ], dtype="float64" )
 
-		g0 = self.W0
-		g2 = -self.rho(g0)/3.0
-		g4 = 2.0 * self.rho(g0) * (np.sqrt(g0/np.pi) - np.exp(g0) * ss.erf(np.sqrt(g0))/2.0)/5.0
-
-		return np.array( [ g2 * t + g4 * (t**3.0) / 6.0,
-				   g2     + g4 * (t**2.0) / 2.0 ], dtype="float64" )
+		return np.array( [ self._g2 * t + self._g4 * (t**3.0) / 6.0,
+				   self._g2     + self._g4 * (t**2.0) / 2.0 ], dtype="float64" )
 
 	def rho(self, phi):
 		"""Retourne la densité volumique de masse adimensionnée
@@ -96,7 +238,7 @@ def FromConfig(conf_file, **kwargs):
 class DimKing(ADimKing):
 	"""Cette classe gére un modèle de King dimensionné.
 	"""
-	def __init__(self, W0, rc, sig_v, G=6.67e-11, N=10000, t=100, ti=0, dt=1e-4, Npas=None):
+	def __init__(self, W0, rc, sig_v, G=6.67e-11, N=10000, t=100, ti=0, dt=1e-4, Npas=None, solver="odeint"):
 		"""Construit un objet King avec toutes les quantités nécessaire pour le dimensionnement.
 		Attention à être cohérent avec vos unités.
 		W0           :: Condition initiale du King,
@@ -108,7 +250,7 @@ class DimKing(ADimKing):
 		Attention, hormis pour W0, les unités des autres paramètres doivent être cohérents entre eux :
 		si rc est donnée en parsec, il faudra adapter les unités de sig_v et G.
 		"""
-		super(DimKing, self).__init__(W0, t=t, ti=ti, dt=dt, N=Npas)
+		super(DimKing, self).__init__(W0, t=t, ti=ti, dt=dt, N=Npas, solver=solver)
 		self.rc    = rc
 		self.sig_v = sig_v
 		self.G     = G
@@ -128,15 +270,7 @@ class DimKing(ADimKing):
 		Valeur de retour :
 		np.array contenant le jacobien, de même taille que E.
 		"""
-		from scipy.integrate import trapz
-		tmp = nbE - m*pot[:]
-		i = 0
-		for j in tmp:
-			i += 1
-			if j < 0.0:
-				break
-		tmp_psi = (4.0 * np.pi)**(2.0) * m * (r[0:i-1])**(2.0) * np.sqrt( 2.0*m * tmp[0:i-1])
-		return trapz(tmp_psi, x=r[0:i-1])
+		return jb.jacobian(nbE, r, pot, m)
 
 	def __call__(self, r, v, jac = False):
 		E = 0.5*self.m*v**2 + self.m*self.Potentiel(r)
@@ -153,8 +287,7 @@ class DimKing(ADimKing):
 		"""Résoud et redimensionne le problème.
 		"""
 		super(DimKing, self).Solve()
-		self.X   = self.X[np.isfinite(self.X)]
-		self.X.shape = len(self.X) / 2, 2
+		self.X   = self.X[np.all(np.isfinite(self.X), axis=1)]
 		self.x   = self.x[0:len(self.X)]
 
 	def CalcRho(self):
@@ -164,9 +297,9 @@ class DimKing(ADimKing):
 
 	def CalcMtot(self):
 		if self._XAxis_transform:
-			self.Mtot = ig.trapz(4.0*np.pi*(self.x**2.0)*self.Rho, self.x)
+			self.Mtot = ig.trapezoid(4.0*np.pi*(self.x**2.0)*self.Rho, self.x)
 		else:
-			self.Mtot = 4.0*np.pi*self.rho0 * (self.rc**3) * ig.trapz((self.x**2.0) * ( -np.sqrt(4.0 * self.X[:,0]/np.pi) * (1.0 + 2./3.0 * self.X[:,0]) + np.exp(self.X[:,0]) * ss.erf(np.sqrt(self.X[:,0])) ), self.x)
+			self.Mtot = 4.0*np.pi*self.rho0 * (self.rc**3) * ig.trapezoid((self.x**2.0) * ( -np.sqrt(4.0 * self.X[:,0]/np.pi) * (1.0 + 2./3.0 * self.X[:,0]) + np.exp(self.X[:,0]) * ss.erf(np.sqrt(self.X[:,0])) ), self.x)
 
 	def DimXAxis(self):
 		self._XAxis_transform = True
@@ -178,9 +311,8 @@ class DimKing(ADimKing):
 		self.El   = -self.m * self.G * self.Mtot / self.x[-1]
 
 	def CalcOther(self):
-		for i, _ in enumerate(self.X):
-			self.X[i,0]  = (self.El - self.X[i,0]*self.sig2) / self.m
-			self.X[i,1] *= -self.sig2 / self.m
+		self.X[:,0]  = (self.El - self.X[:,0]*self.sig2) / self.m
+		self.X[:,1] *= -self.sig2 / self.m
 
 		#Calcul de la température (éq 3.21) :
 		#	-> Variable intermédiaire de Calcul :
@@ -202,23 +334,18 @@ class DimKing(ADimKing):
 		"""Résoud et redimensionne le problème.
 		"""
 		super(DimKing, self).Solve()
-		self.X   = self.X[np.isfinite(self.X)]
-		self.X.shape = len(self.X) / 2, 2
+		self.X   = self.X[np.all(np.isfinite(self.X), axis=1)]
 		self.x   = self.x[0:len(self.X)]
-		self.Rho = np.zeros(len(self.x))
-
-		for i, _ in enumerate(self.x):
-			self.x[i]   *= self.rc
-			self.Rho[i]  = self.rho(self.X[i,0]) * self.rho0
+		self.x   = self.x * self.rc
+		self.Rho = self.rho(self.X[:,0]) * self.rho0
 
-		self.Mtot = ig.trapz(4.0*np.pi*(self.x**2.0)*self.Rho, self.x)#, even='avg')
+		self.Mtot = ig.trapezoid(4.0*np.pi*(self.x**2.0)*self.Rho, self.x)#, even='avg')
 		self.m    = self.Mtot / self.N
 		self.sig2 = self.m * self.sig_v / 2.0
 		self.El   = -self.m * self.G * self.Mtot / self.x[-1]
 
-		for i, _ in enumerate(self.X):
-			self.X[i,0]  = (self.El - self.X[i,0]*self.sig2) / self.m
-			self.X[i,1] *= -self.sig2 / self.m
+		self.X[:,0]  = (self.El - self.X[:,0]*self.sig2) / self.m
+		self.X[:,1] *= -self.sig2 / self.m
 
 		#Calcul de la température (éq 3.21) :
 		#	-> Variable intermédiaire de Calcul :
@@ -255,7 +382,7 @@ class DimKing(ADimKing):
 
 @np.vectorize
 def FromKing(w0, rc, sig, N=2e5, withDimXAxis=False):
-	tmp = kg.DimKing(w0, rc, sig, N=N)
+	tmp = DimKing(w0, rc, sig, N=N)
 	tmp.DimSolve2()
 	tmp.CalcRho()
 	if withDimXAxis:
@@ -264,3 +391,139 @@ def FromKing(w0, rc, sig, N=2e5, withDimXAxis=False):
 
 	return tmp.Mtot
 
+class KingBatch(o.Ode):
+	"""Solutions adimensionnées de plusieurs W0 intégrées ensemble, comme un seul système (W_1..W_n, W'_1..W'_n) : un appel
+	du second membre évalue tous les modèles d'un coup, et une variation de W0 se fait en une intégration (solve_ivp, cf.
+	Ode.Solve) au lieu d'une par modèle.
+
+	W0    :: tableau des W0.
+	xgrid = None :: grille de sortie (croissante, depuis 0), par défaut 6000 points logarithmiques jusqu'à 1e7.
+	rtol  = 1e-10 :: tolérance relative (la norme de l'erreur de solve_ivp est une moyenne quadratique sur les 2n composantes).
+
+	Au-delà de son rayon de marée, la densité d'un modèle est prolongée par 0 (cf. density) : W y est képlérien et reste
+	fini. Après Solve, x est la grille, X de forme (len(x), 2n), W et dW les profils (n, len(x)) de chaque modèle, et rt,
+	mu le rayon de marée et la masse adimensionnée de chaque modèle (cf. KingTable).
+	"""
+	def __init__(self, W0, xgrid=None, rtol=1e-10, method="DOP853"):
+		self._xgrid = np.concatenate(([0.], np.logspace(-4., 7., 6000))) if xgrid is None else np.asarray(xgrid, dtype=np.float64)
+		super(KingBatch, self).__init__(self._xgrid[-1], self._xgrid[0], solver="ivp")
+		self.W0                = np.atleast_1d(np.asarray(W0, dtype=np.float64))
+		self._g2, self._g4     = series_coefficients(self.W0)
+		self._X0               = np.concatenate((self.W0, np.zeros(len(self.W0))))
+		self.rtol, self.method = rtol, method
+
+	@property
+	def X0(self):
+		return self._X0
+
+	@X0.setter
+	def X0(self, newval):
+		self._X0 = newval
+
+	def Generate_x(self):
+		self.x = self._xgrid
+
+	def func(self, x, t=0):
+		n   = len(self.W0)
+		res = np.empty_like(x)
+		if t > 1e-6:
+			res[:n] = x[n:]
+			res[n:] = -density(x[:n]) - 2.0*x[n:]/t
+		else:
+			res[:n] = self._g2 * t + self._g4 * (t**3.0) / 6.0
+			res[n:] = self._g2     + self._g4 * (t**2.0) / 2.0
+		return res
+
+	def Solve(self):
+		"""Intègre les n modèles, puis calcule rt et mu : au-delà du dernier point x_l où W > 0, x^2 W' est constant (= -mu)
+		et W(x) = W_l + x_l^2 W'_l (1/x_l - 1/x) s'annule en x_t.
+		"""
+		super(KingBatch, self).Solve()
+		n       = len(self.W0)
+		self.W  = self.X[:, :n].T
+		self.dW = self.X[:, n:].T
+
+		idx     = np.arange(n)
+		last    = len(self.x) - 1 - np.argmax((self.W > 0.)[:, ::-1], axis=1)
+		xl      = self.x[last]
+		self.mu = -xl**2 * self.dW[idx, last]
+		self.rt = 1. / (1. / xl - self.W[idx, last] / self.mu)
+
+class KingTable(object):
+	"""Famille de solutions adimensionnées tabulée sur une grille dense de W0, pour obtenir le potentiel W(x), la
+	densité, le rayon de marée et la masse totale de n'importe quel W0 par interpolation, sans intégration.
+
+	W0       = np.arange(0.05, 20.0001, 0.05) :: grille de W0.
+	nx       = 512                            :: nombre de points des profils, en rayon normalisé s = x / x_t.
+	xgrid    = None                           :: grille (croissante, depuis 0) de l'intégration, par défaut 6000 points
+	                                             logarithmiques jusqu'à 1e7 (au-delà du rayon de marée des grands W0).
+
+	La masse adimensionnée est mu(W0) = int_0^x_t x^2 rho(W) dx = -x^2 W'(x) au bord (équation de Poisson), de sorte que
+	la masse totale du modèle dimensionné est 4 pi rho0 rc^3 mu(W0). Tous les W0 sont intégrés ensemble (KingBatch). La
+	table est gardée dans le cache des solutions (mémoire et disque, cf. cached_solution).
+	"""
+	def __init__(self, W0=None, nx=512, xgrid=None):
+		self.W0    = np.arange(0.05, 20.0001, 0.05) if W0 is None else np.asarray(W0, dtype=np.float64)
+		self.xgrid = np.concatenate(([0.], np.logspace(-4., 7., 6000))) if xgrid is None else np.asarray(xgrid, dtype=np.float64)
+		self.s     = np.concatenate(([0.], np.logspace(-5., 0., nx - 1)))
+
+		key = ("table", "batch", tuple(self.W0), len(self.s), hashlib.sha1(self.xgrid.tobytes()).hexdigest())
+		self.xt, self.mu, self.W = cached_solution(key, self._build)
+
+		self._lxt = ip.CubicSpline(self.W0, np.log(self.xt))
+		self._lmu = ip.CubicSpline(self.W0, np.log(self.mu))
+
+	def _build(self):
+		batch = KingBatch(self.W0, xgrid=self.xgrid)
+		batch.Solve()
+
+		W = np.zeros((len(self.W0), len(self.s)))
+		for i in range(len(self.W0)):
+			ok   = batch.W[i] > 0.
+			W[i] = np.interp(self.s * batch.rt[i], np.append(self.xgrid[ok], batch.rt[i]), np.append(batch.W[i, ok], 0.))
+
+		return batch.rt, batch.mu, W
+
+	def _check(self, W0):
+		if np.any(np.asarray(W0) < self.W0[0]) or np.any(np.asarray(W0) > self.W0[-1]):
+			raise ValueError("W0 out of the table: [%g, %g]" % (self.W0[0], self.W0[-1]))
+
+	def rt(self, W0):
+		"""Rayon de marée adimensionné x_t (en unités de rc)."""
+		self._check(W0)
+		return np.exp(self._lxt(W0))
+
+	def mass(self, W0):
+		"""Masse adimensionnée mu(W0) = int_0^x_t x^2 rho(W) dx."""
+		self._check(W0)
+		return np.exp(self._lmu(W0))
+
+	def Mtot(self, W0, rc, sig_v, G=6.67e-11):
+		"""Masse totale du modèle dimensionné (W0, rc, sig_v et G pouvant être des tableaux), comme DimKing.CalcMtot."""
+		rho0 = sig_v*sig_v / (8.0*np.pi*G*rc**2.0)
+		return 4.0*np.pi*rho0 * rc**3 * self.mass(W0)
+
+	def psi(self, x, W0):
+		"""Potentiel adimensionné W(x) du modèle W0 (scalaire), nul au-delà du rayon de marée."""
+		self._check(W0)
+		i = int(np.clip(np.searchsorted(self.W0, W0, side="right") - 1, 0, len(self.W0) - 2))
+		t = (W0 - self.W0[i]) / (self.W0[i+1] - self.W0[i])
+		# Interpolation à rayon normalisé fixé, W / W0 variant lentement avec W0 :
+		prof = ((1. - t) * self.W[i] / self.W0[i] + t * self.W[i+1] / self.W0[i+1]) * W0
+		return np.interp(np.asarray(x, dtype=np.float64) / self.rt(W0), self.s, prof, right=0.)
+
+	def rho(self, x, W0):
+		"""Densité adimensionnée rho(W(x)) du modèle W0 (cf. ADimKing.rho), nulle au-delà du rayon de marée."""
+		W = self.psi(x, W0)
+		return density(W)
+
+_table = None
+
+def king_table(**kwargs):
+	"""Retourne la KingTable par défaut (construite une fois par processus, puis relue dans le cache disque)."""
+	global _table
+	if kwargs:
+		return KingTable(**kwargs)
+	if _table is None:
+		_table = KingTable()
+	return _table
@@ -7,14 +7,32 @@ from ..Utils import Ode as o
 sphère auto-gravitante, isotherme et tronquée.
 """
 
+# Développements en série de u' et v' au centre (x/2 < 1e-3), en puissances impaires de x :
+_SERIE_U = (-2.0/5.0, 19.0*4.0/1050.0, -823.0*6.0/189000.0)
+_SERIE_V = (2.0/3.0, -4.0/30.0, 6.0/315.0)
+
+def milne(v, x=0):
+	"""Second membre des équations de Milne (u, v) de la sphère isotherme, au point x.
+	v peut être de forme (2,) ou (2, n) : n modèles sont alors évalués en un seul appel (cf. SIBBatch).
+	"""
+	y = np.empty(np.shape(v))
+	if x/2.0 >= 1.0e-3:
+		y[0] = v[0]*(3.0 - v[0] - v[1])/x	# u(x)
+		y[1] = v[1]*(v[0] - 1.0)/x		# v(x)
+	else:
+		x2   = x*x
+		y[0] = x*(_SERIE_U[0] + x2*(_SERIE_U[1] + x2*_SERIE_U[2]))
+		y[1] = x*(_SERIE_V[0] + x2*(_SERIE_V[1] + x2*_SERIE_V[2]))
+	return y
+
 class SIB(o.Ode):
 	"""Cette classe dérive de la classe de résolution des ODE du
 	package Outils et implémente la résolution des équations pour la
 	sphère isotherme et tronquée, en utilisant le changement de
 	variable de Milne.
 	"""
-	def __init__(self, t=100, ti = 0, dt=1e-4, N=None):
-		super(SIB, self).__init__(t, ti, dt, N)
+	def __init__(self, t=100, ti = 0, dt=1e-4, N=None, solver="odeint"):
+		super(SIB, self).__init__(t, ti, dt, N, solver=solver)
 		self._X0 = np.array([3.0, 0.0], dtype=np.float64)
 
 	@property
@@ -26,14 +44,7 @@ class SIB(o.Ode):
 		self._X0 = newval
 
 	def func(self, v, x=0):
-		y = np.zeros(2)
-		if x/2.0 >= 1.0e-3:
-			y[0] = v[0]*(3.0 - v[0] - v[1])/x	# u(x)
-			y[1] = v[1]*(v[0] - 1.0)/x		# v(x)
-		else:
-			y[0] = -2.0/5.0*x + 19.0*4.0/1050.0*x**3.0 - 823.0*6.0/189000.0*x**5.0
-			y[1] = 2.0/3.0*x - 4.0/30.0*x**3.0 + 6.0/315.0*x**5.0
-		return y
+		return milne(v, x)
 
 	def Solve(self):
 		"""Calcul les u, v, $\mu$, $\lambda$ pour la SIB.
@@ -42,3 +53,39 @@ class SIB(o.Ode):
 		self.Mu     = self.X[self.X[:,1]!=0.0,1]
 		self.Lambda = (1.5 - self.X[self.X[:,1]!=0.0,0]) / self.Mu
 
+class SIBBatch(o.Ode):
+	"""n modèles (u, v) intégrés ensemble comme un seul système (u_1..u_n, v_1..v_n) : un appel du second membre (milne)
+	les évalue tous d'un coup. Henon intègre le même système, ses paramètres n'intervenant qu'après la résolution.
+
+	u0, v0 :: conditions initiales en ti (scalaires ou tableaux de même longueur). Près du centre (x/2 < 1e-3), le
+	          développement en série ne dépend que de x et suppose la solution régulière (u, v) = (3, 0) : pour d'autres
+	          conditions initiales, ti doit être au-delà.
+
+	Après Solve, U et V sont de forme (n, len(x)), Mu et Lambda aussi (NaN là où v = 0, au lieu d'être retirés comme
+	dans SIB.Solve).
+	"""
+	def __init__(self, u0=3.0, v0=0.0, t=100, ti = 0, dt=1e-4, N=None, solver="odeint"):
+		super(SIBBatch, self).__init__(t, ti, dt, N, solver=solver)
+		u0, v0   = np.broadcast_arrays(np.atleast_1d(np.asarray(u0, dtype=np.float64)), np.asarray(v0, dtype=np.float64))
+		self._X0 = np.concatenate((u0, v0))
+
+	@property
+	def X0(self):
+		return self._X0
+
+	@X0.setter
+	def X0(self, newval):
+		self._X0 = newval
+
+	def func(self, v, x=0):
+		return milne(np.reshape(v, (2, -1)), x).ravel()
+
+	def Solve(self):
+		"""Calcul les u, v, $\mu$, $\lambda$ de chaque modèle.
+		"""
+		super(SIBBatch, self).Solve()
+		n           = len(self._X0) // 2
+		self.U      = self.X[:, :n].T
+		self.V      = self.X[:, n:].T
+		self.Mu     = np.where(self.V != 0.0, self.V, np.nan)
+		self.Lambda = (1.5 - self.U) / self.Mu
@@ -4,8 +4,7 @@
 import numpy         as np
 
 from ..dir.rw        import File
-
-from scipy.integrate import trapz
+from ..Utils         import Jacobian as jb
 
 def f_distribtheo(E, jac=None, El=None, rc=None, m=None, sig2=None, W0=None, rho0=None, fileparam="ci_param.dat"):
 	"""Retourne la fonction de distribution du modèle de King, 1966. Se sert des paramètres donné dans le fichier fileparam.
@@ -62,19 +61,7 @@ def f_jacobien(E, Pot, m):
 	Valeur de retour :
 	np.array contenant le jacobien, de même taille que E.
 	"""
-	from scipy.integrate import trapz
-	JAC = []
-	for nbE in E[:]:
-		tmp = nbE - m*Pot[:,1]
-		i = 0
-		for j in tmp:
-			i += 1
-			if j < 0.0:
-				break
-		tmp_psi = (4.0 * np.pi)**(2.0) * m * (Pot[0:i-1,0])**(2.0) * np.sqrt( 2.0*m * tmp[0:i-1])
-		JAC.append(trapz(tmp_psi, x=Pot[0:i-1,0]))
-
-	return np.array(JAC)
+	return jb.jacobian(E, Pot[:,0], Pot[:,1], m)
 
 #@np.vectorize(excluded=['r', 'Pot', 'm'])
 
@@ -97,13 +84,7 @@ def CalcJac(E, r, Pot, m):
 	Valeur de retour :
 	Le jacobien à l'énergie E.
 	"""
-	res = list()
-	for Et in E:
-		tmp = Et - m*Pot
-		ind = np.where( tmp >= 0.0 )
-		tmp = tmp[ ind ]
-		res.append(trapz( (4.0 * np.pi)**(2.0) * m * (r[ind])**(2.0) * np.sqrt( 2.0*m * tmp), x=r[ind]))
-	return res
+	return jb.jacobian(E, r, Pot, m)
 
 def CalcJac2(Et, r, Pot, m):
 	"""Calcule le jacobien permettant de passer de f(x, p) à f(E) à partir du potentiel issu de la simulation/du snapshot.
@@ -116,12 +97,9 @@ def CalcJac2(Et, r, Pot, m):
 	Valeur de retour :
 	Le jacobien à l'énergie E.
 	"""
-	tmp = Et - m*Pot
-	ind = np.where( tmp >= 0.0 )
-	tmp = tmp[ ind ]
-	return trapz( (4.0 * np.pi)**(2.0) * m * (r[ind])**(2.0) * np.sqrt( 2.0*m * tmp), x=r[ind])
+	return jb.jacobian(Et, r, Pot, m)
 
-vCalcJac = np.vectorize(CalcJac2, excluded=['r', 'Pot', 'm'])
+vCalcJac = CalcJac
 
 def plotDistrib(Distrib, Pot, m, prefix="", fileparam="ci_param.dat", suppose = False, info=""):
 	"""Calcul la distribution d'énergie théorique et la distribution de la simulation,
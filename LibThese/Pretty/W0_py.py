@@ -5,15 +5,26 @@ from matplotlib import pyplot    as plt
 from matplotlib import widgets   as w
 from astropy    import constants as const
 
-from LibThese.Models.King import DimKing as King
+from LibThese.Models.King import KingBatch
+from LibThese.Models.King import king_table
 
 def CalcMtot(w0, rc, sig_v):
-	test = King(w0, rc, sig_v, G=const.G.value)
-	test.DimSolve2()
-	test.DimXAxis()
-	test.CalcRho()
-	test.CalcMtot()
-	return test.Mtot
+	"""Masse totale du modèle de King (w0, rc, sig_v), interpolée dans la table des solutions (cf. King.KingTable) :
+	rc et sig_v peuvent être des grilles, sans aucune intégration. Hors de la table (w0 < 0.05 ou w0 > 20), la masse
+	adimensionnée est intégrée pour ce seul w0 (cf. King.KingBatch), et elle est nulle pour w0 <= 0.
+	"""
+	table = king_table()
+	if table.W0[0] <= w0 <= table.W0[-1]:
+		return table.Mtot(w0, rc, sig_v, G=const.G.value)
+
+	mu = 0.0
+	if w0 > 0.0:
+		batch = KingBatch([w0])
+		batch.Solve()
+		mu    = batch.mu[0]
+
+	rho0 = sig_v*sig_v / (8.0*np.pi*const.G.value*rc**2.0)
+	return 4.0*np.pi*rho0 * rc**3 * mu
 
 pCalcMtot = np.vectorize(CalcMtot)
 
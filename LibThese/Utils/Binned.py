@@ -0,0 +1,214 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""Histograms and binned statistics on a linearised bin index.
+
+The bin of each particle along each axis is computed once (:func:`bin_index`, same convention as
+:func:`numpy.histogram`: half-open bins, the last one closed), the indices are linearised in C order and
+a single :func:`numpy.bincount` fills the whole N-dimensional histogram.
+
+:func:`binned_statistic` reduces values per bin the same way: sums, means and dispersions with bincount,
+medians, minima, maxima and numpy ufuncs by sorting the values by bin and reducing the contiguous groups.
+"""
+
+import numpy         as np
+
+__all__ = [
+	"bin_index",
+	"linear_index",
+	"make_edges",
+	"histogramdd",
+	"projections",
+	"binned_statistic",
+]
+
+def bin_index(x, edges):
+	"""Return the bin of each value of x in edges (increasing), -1 for the values out of [edges[0], edges[-1]].
+	"""
+	edges = np.asarray(edges)
+	nb    = len(edges) - 1
+
+	ind                    = np.searchsorted(edges, x, side="right") - 1
+	ind[ x == edges[-1] ]  = nb - 1
+	ind[ ind >= nb ]       = -1
+
+	return ind
+
+def linear_index(indices, shape):
+	"""Return the C-order linear index of the per-axis bin indices, and the mask of the values inside
+	every axis. Only the linear indices of the values inside the histogram are returned.
+	"""
+	ok = np.ones(len(indices[0]), dtype=bool)
+	for ind in indices:
+		ok &= ind >= 0
+
+	lin = np.zeros(np.count_nonzero(ok), dtype=np.int64)
+	for ind, n in zip(indices, shape):
+		lin *= n
+		lin += ind[ok]
+
+	return lin, ok
+
+def make_edges(columns, bins):
+	"""Return the edges along each axis from bins, as the bins parameter of :func:`numpy.histogram2d`: a number
+	of bins for all the axes, a sequence of numbers of bins or a sequence of edges.
+	"""
+	if np.isscalar(bins):
+		bins = [bins] * len(columns)
+
+	res = []
+	for c, b in zip(columns, bins):
+		if np.ndim(b) == 0:
+			vmin, vmax = (c.min(), c.max()) if len(c) else (0., 1.)
+			if vmin == vmax:
+				vmin, vmax = vmin - 0.5, vmax + 0.5
+			res.append(np.linspace(vmin, vmax, int(b) + 1))
+		else:
+			res.append(np.asarray(b))
+	return res
+
+def histogramdd(columns, edges, weights=None, dtype=np.float64):
+	"""N-dimensional histogram of the columns with a single bincount.
+
+	:param columns: Values along each axis.
+	:type columns: sequence of np.array
+
+	:param edges: Edges along each axis.
+	:type edges: sequence of np.array
+
+	:param weights: Weight of each value (None: counts).
+	:type weights: np.array or None
+
+	:param dtype: dtype of the result (float32 for a compact cube).
+
+	:returns: histogram of shape (len(edges[0])-1, len(edges[1])-1, ...)
+	"""
+	shape    = tuple( len(e) - 1 for e in edges )
+	lin, ok  = linear_index([ bin_index(c, e) for c, e in zip(columns, edges) ], shape)
+
+	if weights is not None:
+		weights = np.asarray(weights)[ok]
+
+	res = np.bincount(lin, weights=weights, minlength=int(np.prod(shape)))
+	return res.astype(dtype, copy=False).reshape(shape)
+
+def projections(pos, bins=100, pairs=((0, 1), (0, 2), (1, 2)), grid=False, dtype=np.float64):
+	"""2D histograms of every pair of axes of pos (xy, xz, yz by default) with the bin index of each axis
+	computed once. Each plane is the same as np.histogram2d(pos[:,i], pos[:,j], bins).
+
+	:param pos: Coordinates, shape (N, d).
+	:param bins: Number of bins, or one number of bins or edges per axis. As in np.histogram2d, a pair
+		(first axis, second axis) is applied to every plane (the indices are then computed per plane).
+	:param pairs: Pairs of axes to histogram.
+	:param grid: Also return the d-dimensional histogram, the planes being its marginals (bins per axis only).
+
+	:returns: dictionary pair -> (histogram, edges of the first axis, edges of the second axis)
+		[, the d-dimensional histogram].
+	"""
+	columns = [ pos[:, k] for k in range(pos.shape[1]) ]
+
+	res = dict()
+	if not np.isscalar(bins) and len(bins) != len(columns):
+		if grid:
+			raise ValueError("The grid needs the bins of every axis.")
+		for i, j in pairs:
+			edges       = make_edges((columns[i], columns[j]), bins)
+			res[(i, j)] = (histogramdd((columns[i], columns[j]), edges, dtype=dtype), edges[0], edges[1])
+		return res
+
+	edges   = make_edges(columns, bins)
+	shape   = tuple( len(e) - 1 for e in edges )
+	index   = [ bin_index(c, e) for c, e in zip(columns, edges) ]
+
+	if grid:
+		lin, _ = linear_index(index, shape)
+		cube   = np.bincount(lin, minlength=int(np.prod(shape))).astype(dtype, copy=False).reshape(shape)
+		for i, j in pairs:
+			other = tuple( k for k in range(len(shape)) if k not in (i, j) )
+			hist  = cube.sum(axis=other)
+			res[(i, j)] = (hist if i < j else hist.T, edges[i], edges[j])
+		return res, cube
+
+	for i, j in pairs:
+		lin, _      = linear_index((index[i], index[j]), (shape[i], shape[j]))
+		hist        = np.bincount(lin, minlength=shape[i] * shape[j]).astype(dtype, copy=False)
+		res[(i, j)] = (hist.reshape((shape[i], shape[j])), edges[i], edges[j])
+
+	return res
+
+def _reduce_sorted(lin, values, size, statistic, fill):
+	"""Reduce values grouped by lin (both sorted by lin, values sorted in each group for the median) with the
+	median, a ufunc or a function.
+	"""
+	res = np.full(size, fill, dtype=np.float64)
+	if len(lin) == 0:
+		return res
+
+	starts = np.flatnonzero(np.concatenate(([True], lin[1:] != lin[:-1])))
+	counts = np.diff(np.concatenate((starts, [len(lin)])))
+	cells  = lin[starts]
+
+	if isinstance(statistic, str):
+		res[cells] = 0.5 * (values[starts + (counts - 1)//2] + values[starts + counts//2])
+	elif isinstance(statistic, np.ufunc):
+		res[cells] = statistic.reduceat(values, starts)
+	else:
+		res[cells] = [ statistic(a) for a in np.split(values, starts[1:]) ]
+
+	return res
+
+def binned_statistic(columns, values, bins=10, statistic="mean", fill=0., dtype=np.float64):
+	"""Statistic of values in the bins of the columns, without any loop on the particles.
+
+	:param columns: Values along each axis.
+	:type columns: sequence of np.array
+
+	:param values: Values to reduce, shape (N,) or (N, k) (each column is reduced).
+	:type values: np.array
+
+	:param bins: Bins along each axis (see :func:`make_edges`).
+
+	:param statistic: "count", "sum", "mean", "std", "var", "median", "min", "max", a numpy ufunc
+		(reduced with ufunc.reduceat, np.maximum for instance) or a function of the array of values of a bin.
+
+	:param fill: Value of the empty bins.
+
+	:returns: statistic of shape (len(edges[0])-1, len(edges[1])-1, ... [, k]), and the edges.
+	"""
+	edges   = make_edges(columns, bins)
+	shape   = tuple( len(e) - 1 for e in edges )
+	size    = int(np.prod(shape))
+	lin, ok = linear_index([ bin_index(c, e) for c, e in zip(columns, edges) ], shape)
+
+	values  = np.asarray(values)
+	if values.ndim == 2:
+		res = np.stack([ _statistic(lin, values[ok, k], size, statistic, fill) for k in range(values.shape[1]) ], axis=-1)
+		return res.astype(dtype, copy=False).reshape(shape + (values.shape[1],)), edges
+
+	return _statistic(lin, values[ok], size, statistic, fill).astype(dtype, copy=False).reshape(shape), edges
+
+def _statistic(lin, values, size, statistic, fill):
+	count  = np.bincount(lin, minlength=size)
+	empty  = count == 0
+
+	if isinstance(statistic, str) and statistic == "count":
+		res = count.astype(np.float64)
+	elif isinstance(statistic, str) and statistic in ("sum", "mean", "std", "var"):
+		res = np.bincount(lin, weights=values, minlength=size)
+		if statistic != "sum":
+			np.divide(res, count, out=res, where=~empty)
+		if statistic in ("std", "var"):
+			res = np.bincount(lin, weights=(values - res[lin])**2, minlength=size)
+			np.divide(res, count, out=res, where=~empty)
+			if statistic == "std":
+				np.sqrt(res, out=res)
+		res[empty] = fill
+	else:
+		if isinstance(statistic, str) and statistic in ("min", "max"):
+			statistic = np.minimum if statistic == "min" else np.maximum
+		elif isinstance(statistic, str) and statistic != "median":
+			raise ValueError("Unknown statistic: " + statistic)
+		order = np.lexsort((values, lin)) if isinstance(statistic, str) else np.argsort(lin, kind="stable")
+		res   = _reduce_sorted(lin[order], values[order], size, statistic, fill)
+
+	return res
@@ -0,0 +1,199 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""Derived per-particle quantities: radius, radial velocity, angular momentum.
+
+Each column is computed once, by a single numexpr kernel (no (N, 3) temporaries) written in a preallocated
+buffer. The :func:`derived` function keeps the results of the last snapshots, keyed by a particle key (see
+:func:`particle_key`), the center and the velocity shift, so that the maps, the phase space and the
+anisotropy code share them:
+
+	>>> d = derived(pos, vel, key=particle_key("snap_010", ptype=1), center=cg)
+	>>> d.r, d.vr, d.j
+"""
+
+import os
+import numpy         as np
+import numexpr       as ne
+
+from collections import OrderedDict
+
+from ..Gadget.load_gadget import snapshot_files
+
+__all__ = [
+	"Derived",
+	"derived",
+	"snapshot_key",
+	"particle_key",
+	"clear_cache",
+]
+
+_exprs = {
+	"r2": "(x - cx)**2 + (y - cy)**2 + (z - cz)**2",
+	"v2": "(vx - wx)**2 + (vy - wy)**2 + (vz - wz)**2",
+	"rv": "(x - cx)*(vx - wx) + (y - cy)*(vy - wy) + (z - cz)*(vz - wz)",
+	"j":  "sqrt( ((y - cy)*(vz - wz) - (z - cz)*(vy - wy))**2"
+			" + ((z - cz)*(vx - wx) - (x - cx)*(vz - wz))**2"
+			" + ((x - cx)*(vy - wy) - (y - cy)*(vx - wx))**2 )",
+}
+
+class Derived(object):
+	"""Lazily computed derived quantities of a set of particles.
+
+	:param pos: Positions, shape (N, 3).
+	:type pos: np.array
+
+	:param vel: Velocities, shape (N, 3) (None if only the radius is needed).
+	:type vel: np.array or None
+
+	:param center: Position subtracted to pos (default: origin).
+	:type center: iterable or None
+
+	:param vshift: Velocity subtracted to vel (default: 0).
+	:type vshift: iterable or None
+
+	The columns have the dtype of the positions (float32 for Gadget snapshots).
+	"""
+	def __init__(self, pos, vel=None, center=None, vshift=None):
+		self.dtype  = np.result_type(pos.dtype, np.float32)
+		self.size   = pos.shape[0]
+		self._cols  = dict()
+
+		center = np.zeros(3) if center is None else np.asarray(center)
+		vshift = np.zeros(3) if vshift is None else np.asarray(vshift)
+
+		self._vars  = dict(
+			x  = pos[:, 0], y  = pos[:, 1], z  = pos[:, 2],
+			cx = self.dtype.type(center[0]), cy = self.dtype.type(center[1]), cz = self.dtype.type(center[2]),
+		)
+		if vel is not None:
+			self._vars.update(
+				vx = vel[:, 0], vy = vel[:, 1], vz = vel[:, 2],
+				wx = self.dtype.type(vshift[0]), wy = self.dtype.type(vshift[1]), wz = self.dtype.type(vshift[2]),
+			)
+
+	def _eval(self, name, expr, local):
+		if name not in self._cols:
+			if self._vars is None:
+				raise ValueError("Column " + name + " was not computed before detach()")
+			out = np.empty(self.size, dtype=self.dtype)
+			ne.evaluate(expr, local_dict=local, out=out, casting="same_kind")
+			self._cols[name] = out
+		return self._cols[name]
+
+	def _column(self, name):
+		return self._eval(name, _exprs[name], self._vars)
+
+	def detach(self, *names):
+		"""Compute the columns names, then drop the references to the positions and velocities (for
+		particles whose memory is released, InitialCond.Gadget for instance).
+		"""
+		for name in names:
+			getattr(self, name)
+		self._vars = None
+		return self
+
+	@property
+	def r2(self):
+		"""Squared radius."""
+		return self._column("r2")
+
+	@property
+	def r(self):
+		"""Radius."""
+		return self._eval("r", "sqrt(r2)", dict(r2=self.r2))
+
+	@property
+	def v2(self):
+		"""Squared velocity."""
+		return self._column("v2")
+
+	@property
+	def v(self):
+		"""Norm of the velocity."""
+		return self._eval("v", "sqrt(v2)", dict(v2=self.v2))
+
+	@property
+	def rv(self):
+		"""Scalar product r.v."""
+		return self._column("rv")
+
+	@property
+	def vr(self):
+		"""Radial velocity r.v / |r|."""
+		return self._eval("vr", "rv / r", dict(rv=self.rv, r=self.r))
+
+	@property
+	def vt2(self):
+		"""Squared tangential velocity v**2 - v_r**2."""
+		return self._eval("vt2", "v2 - vr**2", dict(v2=self.v2, vr=self.vr))
+
+	@property
+	def j(self):
+		"""Norm of the specific angular momentum |r x v|."""
+		return self._column("j")
+
+	def release(self):
+		"""Free the computed columns."""
+		self._cols.clear()
+
+_cache      = OrderedDict()
+cache_size  = 8
+
+def snapshot_key(filename, *args):
+	"""Return a key identifying the snapshot filename (path, size and modification time of its first file),
+	followed by args (particle type, selection, units...).
+	"""
+	st = os.stat(snapshot_files(filename)[0])
+	return (os.path.abspath(filename), st.st_size, st.st_mtime_ns) + tuple(args)
+
+def _as_key(val):
+	return None if val is None else tuple( float(a) for a in np.ravel(val) )
+
+def _shift_key(val):
+	val = _as_key(val)
+	return None if val is None or not any(val) else val
+
+def particle_key(filename, ptype=None, units=(1., 1.), shift=(None, None), order="file"):
+	"""Return the key of a set of particles read from the snapshot filename, the one key shared by the maps, the
+	phase space, the center finder and the spatial indexes (two readers of the same particles get the same key).
+
+	:param ptype: Particle type (None: all the types).
+	:param units: Factors applied to the positions and the velocities.
+	:param shift: Translations (position, velocity) applied to the particles after the units (None: none),
+		including any centring of the arrays themselves. A center only given to :func:`derived` is not part of it.
+	:param str order: Order of the rows: "file" (types in order, files of a split snapshot in order) or "id"
+		(sorted by identity).
+	"""
+	units = (1., 1.) if units is None else units
+	return snapshot_key(filename) + (
+		"particles",
+		None if ptype is None else int(ptype),
+		_as_key(units),
+		_shift_key(shift[0]),
+		_shift_key(shift[1]),
+		str(order),
+	)
+
+def derived(pos, vel=None, key=None, center=None, vshift=None):
+	"""Return the :class:`Derived` of the particles. When key is given, the object is kept in a cache of
+	the cache_size last (key, center, vshift), and pos and vel are not read again on a cache hit.
+	"""
+	if key is None:
+		return Derived(pos, vel, center, vshift)
+
+	full = (key, _as_key(center), _as_key(vshift))
+	if full in _cache:
+		_cache.move_to_end(full)
+		return _cache[full]
+
+	res          = Derived(pos, vel, center, vshift)
+	_cache[full] = res
+	while len(_cache) > cache_size:
+		_cache.popitem(last=False)
+
+	return res
+
+def clear_cache():
+	"""Empty the cache of :func:`derived`."""
+	_cache.clear()
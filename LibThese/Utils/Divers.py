@@ -170,19 +170,15 @@ def OldLoadGadget(filename : str, dtype : int = None):
 	from ..dir.rw		  import File
 	from ..Gadget.load_gadget import ReadGadget
 
-	tmp = ReadGadget(filename)
+	tmp = ReadGadget(filename, ptype=dtype)
 	if tmp.border_block() == 256:
 		print("Lecture d'un fichier gadget")
 		#tmp.get_positions()
 		don = tmp.get_velocities()
 		#np  = np.sum(tmp.read_header()["Nall"])
-		don.shape = (len(don)/3, 3)
+		don.shape = (len(don)//3, 3)
 		if dtype is not None:
-			tmp.read_header()
-			wanted = tmp.header["Npart"][dtype]
-			print("type is : ", dtype, " for : ", wanted, " Particules.")
-			before = sum(tmp.header["Npart"][0:dtype])
-			don    = don[before:(before+wanted)]
+			print("type is : ", dtype, " for : ", len(don), " Particules.")
 	else:
 		print("Lecture d'un fichier texte")
 		don = np.array(File.Read_File(filename, beval=True))
@@ -3,6 +3,7 @@ import logging		   as log
 
 from   ..dir.rw		  import File
 from   ..Gadget.load_gadget import ReadGadget
+from   .                    import Binned as bn
 
 class Histogram:
 	"""Classe créant et gérant une carte de densité de point, crée à partir d'un numpy.array.
@@ -31,18 +32,15 @@ class Histogram:
 			self.log.setLevel(log_level)
 
 		if isinstance(filename, str):
-			tmp = ReadGadget(filename)
+			# Seules les particules du type dtype sont lues si dtype est donné :
+			tmp = ReadGadget(filename, ptype=dtype)
 			if tmp.border_block() == 256:
 				self.log.info("Lecture d'un fichier gadget")
 				don = tmp.get_positions()
 				#np  = np.sum(tmp.read_header()["Nall"])
-				don.shape = (len(don)/3, 3)
+				don.shape = (len(don)//3, 3)
 				if dtype is not None:
-					tmp.read_header()
-					wanted = tmp.header["Npart"][dtype]
-					self.log.info("type is : ", dtype, " for : ", wanted, " Particules.")
-					before = sum(tmp.header["Npart"][0:dtype])
-					don    = don[before:(before+wanted)]
+					self.log.info("type is : %d for : %d Particules.", dtype, len(don))
 			else:
 				self.log.info("Lecture d'un fichier texte")
 				don = np.array(File.Read_File(filename, beval=True))
@@ -88,46 +86,51 @@ class Histogram:
 		"""
 		pass
 
-	def Create_FuncHisto(self, func, ind=None): #(0, 1)):
-		"""Créé l'histogramme des valeurs de la fonction z = f(x, y).
+	def Create_StatHisto(self, values, statistic="mean", ind=None, fill=0.):
+		"""Créé l'histogramme 2D d'une statistique (cf. Utils.Binned.binned_statistic : "mean", "sum", "median",
+		"std", "min", "max"...) des valeurs values par case, sans boucle sur les particules.
+		Les intervalles sont ceux de Create_Histo (self.nbbin).
+		"""
+		if ind is None: ind = self.ind
+		self.hist, (self.X, self.Y) = bn.binned_statistic(
+						(self.don[:,ind[0]], self.don[:,ind[1]]),
+						values,
+						bins=self.nbbin,
+						statistic=statistic,
+						fill=fill
+					)
+		return self.X, self.Y, self.hist.T
+
+	def Create_FuncHisto(self, func, ind=None, vectorized=False): #(0, 1)):
+		"""Créé l'histogramme des valeurs moyennes de la fonction z = f(x, y) par case.
+			vectorized = False	:: f(ligne) pour chaque particule,
+			vectorized = True	:: un seul appel f(don.T), chaque ligne de don.T étant une colonne de don ; f doit alors
+						   travailler élément par élément et retourner une valeur par particule.
 		"""
 		if ind is None:
 			ind = self.ind
 
-		self.X, self.Y, self.hist, cmpt = np.zeros(self.nbbin, dtype=np.float64), \
-							np.zeros(self.nbbin, dtype=np.float64), \
-							np.zeros((self.nbbin, self.nbbin), dtype=np.float64), \
-							np.zeros((self.nbbin, self.nbbin), dtype=np.float64)
-		self.X[0], self.Y[0]            = self.don[:,ind[0]].min(), self.don[:,ind[1]].min()
-		dx, dy                          = ( self.don[:,ind[0]].max() - self.don[:,ind[0]].min() ) / self.nbbin, \
-							( self.don[:,ind[1]].max() - self.don[:,ind[1]].min() ) / self.nbbin
-
-		print(dx, dy, self.nbbin)
-
-		for i in range(1, len(self.X)):
-			self.X[i] = self.X[i-1] + dx
-			self.Y[i] = self.Y[i-1] + dy
-
-		for var in self.don:
-			i, j             = int((var[ind[0]] - self.X[0])/dx), int((var[ind[1]] - self.Y[0])/dy)
-			if i >= self.nbbin:
-				i = self.nbbin - 1
-			if j >= self.nbbin:
-				j = self.nbbin - 1
-			self.hist[i, j] += func(var)
-			cmpt[i, j]      += 1
-
-		for i in range(self.nbbin):
-			for j in range(self.nbbin):
-				if cmpt[i,j] != 0:
-					self.hist[i, j] /= cmpt[i, j]
-
-#		self.hist = self.hist.T
-#		for i, tmp in enumerate(self.hist):
-#			for j, tmp2 in enumerate(tmp):
-#				if tmp2 <= 0:
-#					del self.hist[i,j]
-#
+		if vectorized:
+			vals = np.asarray(func(self.don.T), dtype=np.float64)
+			if vals.shape != (len(self.don),):
+				raise ValueError("func(don.T) must return one value per particle.")
+		else:
+			vals = np.fromiter( (func(var) for var in self.don), dtype=np.float64, count=len(self.don) )
+
+		edges = [
+			np.linspace(self.don[:,ind[0]].min(), self.don[:,ind[0]].max(), self.nbbin + 1),
+			np.linspace(self.don[:,ind[1]].min(), self.don[:,ind[1]].max(), self.nbbin + 1),
+		]
+
+		self.hist, _ = bn.binned_statistic(
+					(self.don[:,ind[0]], self.don[:,ind[1]]),
+					vals,
+					bins=edges,
+					statistic="mean"
+				)
+		# Bords gauches des cases, comme auparavant :
+		self.X, self.Y = edges[0][:-1], edges[1][:-1]
+
 		return self.X, self.Y, self.hist.T
 
 class NHisto:
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding:Utf8 -*-
+
+"""Jacobian of the change of variables from f(x, p) to f(E) in a spherical potential:
+
+	g(E) = integral of (4 pi)**2 m r**2 sqrt(2 m (E - m pot(r))) dr,   over the r where E >= m pot(r).
+
+The potential table is given at the radii r (sorted). All the energies are evaluated at once, by chunks
+of energies: the integrand is a single numexpr (energy, radius) kernel. For a non-decreasing potential
+(the usual spherical case), the cutoff radius of every energy is found with a single searchsorted, the
+energies being sorted so that each chunk only reads the table up to its last cutoff, and the trapezoids
+are a matrix-vector product corrected at the cutoff. Otherwise the segments are masked.
+
+	>>> jac = jacobian(Distrib[:,0], Pot[:,0], Pot[:,1], m)
+
+:func:`benchmark` compares it to the previous per-energy loop.
+"""
+
+import time
+import numpy         as np
+import numexpr       as ne
+
+__all__ = [
+	"jacobian",
+	"benchmark",
+]
+
+def jacobian(E, r, pot, m, chunk=None):
+	"""Jacobian g(E) of each energy.
+
+	:param E: Energies (scalar or array).
+	:param r: Radii of the potential table (increasing).
+	:param pot: Potential per unit mass at r.
+	:param m: Mass of a particle.
+	:param chunk: Number of energies per block (default: blocks of about 2**22 values).
+
+	:returns: g(E), of the shape of E. A segment [r_i, r_i+1] is counted when E >= m pot at both ends, so
+		that for a non-decreasing potential the integral runs from r[0] to the last radius where E >= m pot.
+	"""
+	scalar = np.ndim(E) == 0
+	E      = np.atleast_1d(np.asarray(E, dtype=np.float64))
+	r      = np.asarray(r, dtype=np.float64)
+	mp     = m * np.asarray(pot, dtype=np.float64)
+	n      = len(r)
+
+	res    = np.zeros(len(E))
+	if n < 2:
+		return res[0] if scalar else res
+
+	order  = np.argsort(E, kind="stable")
+	Es     = E[order]
+	mono   = np.all(np.diff(mp) >= 0.)
+	cut    = np.searchsorted(mp, Es, side="right") if mono else np.full(len(Es), n)
+
+	dr     = 0.5 * np.diff(r)
+	coef   = (4. * np.pi)**2 * m * r**2
+	chunk  = max(1, (1 << 22) // n) if chunk is None else chunk
+
+	out    = np.zeros(len(Es))
+	for a in range(0, len(Es), chunk):
+		b   = min(a + chunk, len(Es))
+		k   = int(cut[a:b].max())
+		if k < 2:
+			continue
+
+		g   = ne.evaluate("c * sqrt(2. * m * where(e - p > 0., e - p, 0.))",
+					local_dict=dict(c=coef[None, :k], m=float(m), e=Es[a:b, None], p=mp[None, :k]))
+
+		if mono:
+			# Le potentiel étant croissant, g est nul au-delà de la coupure de chaque énergie : trapèzes
+			# complets (un produit matrice-vecteur), moins le segment [cut-1, cut] qui franchit la coupure.
+			w         = np.zeros(k)
+			w[:-1]   += dr[:k-1]
+			w[1:]    += dr[:k-1]
+			c         = cut[a:b]
+			inner     = np.flatnonzero((c < k) & (c > 0))
+			out[a:b]  = g.dot(w)
+			out[a + inner] -= dr[c[inner] - 1] * g[inner, c[inner] - 1]
+			out[a:b][c < 2] = 0.
+		else:
+			ok  = Es[a:b, None] >= mp[None, :k]
+			seg = ok[:, :-1] & ok[:, 1:]
+			out[a:b] = np.sum(np.where(seg, dr[None, :k-1] * (g[:, :-1] + g[:, 1:]), 0.), axis=1)
+
+	res[order] = out
+	return res[0] if scalar else res
+
+def _jacobian_loop(E, r, pot, m):
+	"""Previous implementation (load.f_jacobien): one trapezoid and one Python loop on the table per energy.
+	Kept as the reference of :func:`benchmark`.
+	"""
+	trapz = getattr(np, "trapezoid", None) or np.trapz
+	JAC   = []
+	for nbE in E[:]:
+		tmp = nbE - m*pot
+		i = 0
+		for j in tmp:
+			i += 1
+			if j < 0.0:
+				break
+		tmp_psi = (4.0 * np.pi)**(2.0) * m * (r[0:i-1])**(2.0) * np.sqrt( 2.0*m * tmp[0:i-1])
+		JAC.append(trapz(tmp_psi, x=r[0:i-1]))
+
+	return np.array(JAC)
+
+def benchmark(sizes=((100, 100), (100, 1000), (1000, 1000), (1000, 10000)), m=1., out=print):
+	"""Time :func:`jacobian` against the per-energy loop, for (number of energies, size of the table) in
+	sizes, on a Plummer potential.
+	"""
+	out("%8s %8s %12s %12s %10s %12s" % ("nE", "nr", "loop (s)", "vector (s)", "speedup", "max rel err"))
+	for nE, nr in sizes:
+		r   = np.linspace(0., 10., nr)
+		pot = -1. / np.sqrt(1. + r**2)
+		E   = np.linspace(m * pot[0], m * pot[-1], nE, endpoint=False)
+
+		t0  = time.time()
+		ref = _jacobian_loop(E, r, pot, m)
+		tl  = time.time() - t0
+
+		t0  = time.time()
+		res = jacobian(E, r, pot, m)
+		tv  = time.time() - t0
+
+		err = np.max(np.abs(res - ref) / np.where(ref > 0., ref, 1.))
+		out("%8d %8d %12.4f %12.4f %10.1f %12.2e" % (nE, nr, tl, tv, tl / max(tv, 1e-9), err))
+
+if __name__ == "__main__":
+	benchmark()
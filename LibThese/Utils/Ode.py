@@ -10,10 +10,14 @@ class Ode(object,metaclass=abc.ABCMeta):
 	"""Cette classe permet de gérer un Modèle de King Adimensionné,
 	et d'en tirer les différentes quantités intéressantes.
 	"""
-	def __init__(self, tmax=100, ti=0, dt=1e-4, N=None):
-		self.X0    = np.array([0.0, 0.0], dtype=np.float64)
-		self._tmax = tmax
-		self._ti   = ti
+	def __init__(self, tmax=100, ti=0, dt=1e-4, N=None, solver="odeint"):
+		self.X0     = np.array([0.0, 0.0], dtype=np.float64)
+		self._tmax  = tmax
+		self._ti    = ti
+		self.solver = solver
+		self.method = "DOP853"
+		self.rtol   = 1e-8
+		self.atol   = 1e-10
 		if N is None:
 			self._dt = dt
 			self._N  = (self._tmax - self._ti) / self._dt
@@ -60,10 +64,48 @@ class Ode(object,metaclass=abc.ABCMeta):
 	def Generate_x(self):
 		self.x                = np.arange(self._ti, self._tmax, self._dt)
 
+	def Events(self):
+		"""Fonctions d'événement (au sens de scipy.integrate.solve_ivp, f(t, X)) du solveur "ivp". Un événement
+		terminal arrête l'intégration : aucun par défaut.
+		"""
+		return []
+
+	def ivp_func(self, t, X):
+		"""Second membre pour solve_ivp (ordre des arguments inversé par rapport à func).
+		Peut être surchargée pour prolonger func au-delà d'un événement terminal, où solve_ivp peut l'évaluer.
+		"""
+		return self.func(X, t)
+
 	def Solve(self):
 		"""Résout l'équation différentielle définie par la fonction "func".
 		Le résultat est placé dans l'attribut X, l'axe "temporelle" dans x.
+
+		Avec solver = "odeint", l'intégration est faite sur toute la grille x. Avec solver = "ivp", solve_ivp
+		(méthode method, pas adaptatif) intègre jusqu'à tmax ou jusqu'au premier événement terminal (cf. Events),
+		dont la position est placée dans x_trunc (None si tmax est atteint), et la sortie dense donne X sur la grille x
+		tronquée.
+		La solution continue est gardée dans sol, le nombre d'évaluations de func dans nfev.
 		"""
 		self.Generate_x()
-		self.X, self.infodict = ig.odeint(self.func, self.X0, self.x, full_output=True, rtol=1e-8)
+		if self.solver == "odeint":
+			self.X, self.infodict = ig.odeint(self.func, self.X0, self.x, full_output=True, rtol=1e-8)
+			self.nfev    = self.infodict["nfe"][-1]
+			self.x_trunc = None
+			return
+
+		if self.solver != "ivp":
+			raise ValueError("Unknown solver " + str(self.solver) + ", use odeint or ivp")
+
+		events   = self.Events()
+		self.sol = ig.solve_ivp(self.ivp_func, (self._ti, self._tmax), self.X0, method=self.method,
+						dense_output=True, events=events or None, rtol=self.rtol, atol=self.atol)
+		if self.sol.status == -1:
+			raise ValueError("Integration failed: " + self.sol.message)
+
+		self.nfev     = self.sol.nfev
+		# status == 1 : arrêt sur un événement terminal (quelle que soit sa place dans la liste), au dernier point de sol.t
+		self.x_trunc  = self.sol.t[-1] if self.sol.status == 1 else None
+		self.x        = self.x[ self.x <= self.sol.t[-1] ]
+		self.X        = self.sol.sol(self.x).T
+		self.infodict = dict(nfev=self.sol.nfev, message=self.sol.message)
 
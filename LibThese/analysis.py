@@ -0,0 +1,211 @@
+# -*- coding:Utf8 -*-
+
+"""
+Analyse d'un snapshot sans le programme externe Verif.
+
+Calcule dans le processus, à partir des positions, vitesses et masses, les tableaux que lisait exec.DataAnalysis.launch
+dans Masse.dat, Densite.dat, Potentiel-tc.dat, Distribution.dat et Energie.dat, avec les mêmes colonnes :
+
+	>>> Mass, Dens, Pot, Distrib, Energie = launch("snap_010", G=1., rsoft=0.01, nbbin=100)
+
+Les profils radiaux sont construits avec un seul indice de bin par particule (cf. Utils.Binned) et des np.bincount,
+le potentiel avec le code en arbre (Gadget.TreeCode) pour opang > 0, sinon à partir du profil de masse sphérique (tri en
+rayon et sommes cumulées).
+"""
+
+import numpy as np
+
+from collections         import namedtuple
+
+from .Utils              import Binned as bn
+from .Utils              import Derived as dv
+from .Gadget             import Center as ce
+from .Gadget             import TreeCode as tc
+from .Gadget.load_gadget import read_snapshot
+from .dir.rw             import File
+
+__all__ = [
+	"Profiles",
+	"spherical_potential",
+	"profiles",
+	"read",
+	"launch",
+]
+
+Profiles = namedtuple("Profiles", ("Mass", "Dens", "Pot", "Distrib", "Energie"))
+Profiles.__doc__ = """Résultats de l'analyse, dans l'ordre des sorties de Verif :
+
+	Mass    :: (r, M(<= r)) aux rangs 0, N/nbbin, ..., N-1 des particules triées en rayon (Mass[0,1] est la masse d'une particule).
+	Dens    :: (r, rho, T, beta, log10 r, rho), les 4 premières colonnes sur nbbin bins linéaires en rayon, les 2 dernières
+	           sur nbbin bins logarithmiques. T = <v^2>/3, beta = 1 - <v_t^2>/(2 <v_r^2>).
+	Pot     :: (r, potentiel par unité de masse) aux mêmes rangs que Mass, trié en rayon.
+	Distrib :: (E, dN/dE, N) sur nbbin bins en énergie E = m (v^2/2 + potentiel).
+	Energie :: (r, Ep, Ec, Et) sommés dans les bins linéaires en rayon de Dens (Ep = m potentiel / 2, de sorte que
+	           la somme de la colonne soit l'énergie potentielle totale).
+"""
+
+def spherical_potential(r, mass, G=6.67e-11, rsoft=0.0):
+	"""Potentiel par unité de masse de chaque particule dans le profil de masse sphérique des autres :
+		phi_i = -G ( M(< r_i) / s_i + sum_{r_j > r_i} m_j / s_j ),   s = sqrt(r^2 + rsoft^2).
+
+	r     :: rayon de chaque particule.
+	mass  :: masse de chaque particule (scalaire ou tableau).
+
+	Valeur de retour :
+		np.array du potentiel, dans l'ordre de r.
+	"""
+	r     = np.asarray(r, dtype=np.float64)
+	order = np.argsort(r, kind="stable")
+	m     = np.broadcast_to(np.asarray(mass, dtype=np.float64), r.shape)[order]
+	s     = np.sqrt(r[order]**2 + rsoft**2)
+
+	inner = np.cumsum(m) - m
+	outer = np.cumsum((m / s)[::-1])[::-1] - m / s
+
+	with np.errstate(divide="ignore", invalid="ignore"):
+		phi = -G * (np.where(s > 0., inner / s, 0.) + outer)
+
+	res        = np.empty_like(phi)
+	res[order] = phi
+	return res
+
+def _ranks(n, nbbin):
+	return np.unique(np.linspace(0, n - 1, nbbin).astype(np.int64))
+
+def profiles(pos, vel, mass, G=6.67e-11, Rmax=-1.0, rsoft=0.0, opang=0.0, nbbin=100, pot=None):
+	"""Profils de masse, densité, température, anisotropie, potentiel et distribution en énergie de particules
+	déjà centrées en position et en vitesse.
+
+	Paramètres obligatoires :
+	pos, vel :: positions et vitesses, de forme (N, 3).
+	mass     :: masse de chaque particule (scalaire ou tableau).
+
+	Paramètres optionnels :
+	G        = 6.67e-11 :: constante de la gravitation dans le système d'unité des particules.
+	Rmax     = -1.0     :: rayon au-delà duquel les particules sont ignorées (toutes si négatif).
+	rsoft    = 0.0      :: paramètre de lissage du potentiel.
+	opang    = 0.0      :: angle d'ouverture du code en arbre (cf. Gadget.TreeCode), potentiel du profil de masse
+	                       sphérique si nul.
+	nbbin    = 100      :: nombre de bins des profils.
+	pot      = None     :: potentiel par unité de masse de chaque particule, s'il est déjà connu.
+
+	Valeur de retour :
+		Profiles (Mass, Dens, Pot, Distrib, Energie).
+	"""
+	der  = dv.Derived(pos, vel)
+	r    = der.r.astype(np.float64)
+	m    = np.broadcast_to(np.asarray(mass, dtype=np.float64), r.shape)
+
+	if Rmax > 0.0:
+		ok             = r <= Rmax
+		r, m           = r[ok], m[ok]
+		v2, vr2        = der.v2[ok].astype(np.float64), der.vr[ok].astype(np.float64)**2
+		if pot is not None:
+			pot = np.asarray(pot)[ok]
+	else:
+		ok             = slice(None)
+		v2, vr2        = der.v2.astype(np.float64), der.vr.astype(np.float64)**2
+	vr2[ ~np.isfinite(vr2) ] = 0.0
+	vt2  = v2 - vr2
+
+	if pot is None and opang > 0.0:
+		pot = tc.potential(np.asarray(pos)[ok], m, G=G, rsoft=rsoft, opang=opang, acc=False)[0]
+	elif pot is None:
+		pot = spherical_potential(r, m, G=G, rsoft=rsoft)
+
+	# Profil de masse et potentiel, aux rangs des particules triées en rayon :
+	order = np.argsort(r, kind="stable")
+	rank  = _ranks(len(r), nbbin)
+	Mass  = np.column_stack((r[order][rank], np.cumsum(m[order])[rank]))
+	Pot   = np.column_stack((r[order][rank], pot[order][rank]))
+
+	# Bins linéaires en rayon :
+	edges  = np.linspace(0.0, r.max(), nbbin + 1)
+	lin, _ = bn.linear_index([ bn.bin_index(r, edges) ], (nbbin,))
+	count  = np.bincount(lin, minlength=nbbin)
+	mbin   = np.bincount(lin, weights=m, minlength=nbbin)
+	sv2    = np.bincount(lin, weights=v2, minlength=nbbin)
+	svr2   = np.bincount(lin, weights=vr2, minlength=nbbin)
+	svt2   = np.bincount(lin, weights=vt2, minlength=nbbin)
+	vol    = 4.0 / 3.0 * np.pi * np.diff(edges**3)
+
+	T      = np.zeros(nbbin)
+	beta   = np.zeros(nbbin)
+	np.divide(sv2, 3.0 * count, out=T, where=count > 0)
+	np.divide(svt2, 2.0 * svr2, out=beta, where=svr2 > 0)
+	beta   = np.where(svr2 > 0, 1.0 - beta, 0.0)
+
+	# Bins logarithmiques en rayon :
+	rpos   = r[r > 0.0]
+	ledges = np.logspace(np.log10(rpos.min()), np.log10(rpos.max()), nbbin + 1)
+	lmass  = bn.histogramdd((r,), (ledges,), weights=m)
+	lrho   = lmass / (4.0 / 3.0 * np.pi * np.diff(ledges**3))
+
+	centers = 0.5 * (edges[1:] + edges[:-1])
+	Dens    = np.column_stack((centers, mbin / vol, T, beta, 0.5 * np.log10(ledges[1:] * ledges[:-1]), lrho))
+
+	# Énergies :
+	ep      = 0.5 * m * pot
+	ec      = 0.5 * m * v2
+	E       = m * (0.5 * v2 + pot)
+	Energie = np.column_stack((
+				centers,
+				np.bincount(lin, weights=ep, minlength=nbbin),
+				np.bincount(lin, weights=ec, minlength=nbbin),
+				np.bincount(lin, weights=ep + ec, minlength=nbbin),
+	))
+
+	eedges  = bn.make_edges((E,), nbbin)[0]
+	N       = bn.histogramdd((E,), (eedges,))
+	Distrib = np.column_stack((0.5 * (eedges[1:] + eedges[:-1]), N / np.diff(eedges), N))
+
+	return Profiles(Mass, Dens, Pot, Distrib, Energie)
+
+def read(filename, types=None, center="density", nb_proc=4):
+	"""Lit les positions, vitesses et masses des particules de type types (toutes si None) du snapshot, centrées
+	en position et en vitesse avec la méthode center (cf. Gadget.Center, aucun centrage si None).
+
+	Lève ValueError si le snapshot ne contient aucune particule du type demandé.
+	"""
+	_, data = read_snapshot(filename, fields=("pos", "vel", "mass"), nb_proc=nb_proc)
+
+	sel  = range(6) if types is None else [types]
+	pos  = np.concatenate([ data["pos"][t] for t in sel ])
+	vel  = np.concatenate([ data["vel"][t] for t in sel ])
+	mass = np.concatenate([ data["mass"][t] for t in sel ])
+	del data
+
+	if len(pos) == 0:
+		raise ValueError("No particle of type " + str(types) + " in " + filename)
+
+	if center is not None:
+		cen, vcen = ce.find_center(pos, vel, mass, method=center, key=dv.particle_key(filename, ptype=types))
+		pos      -= cen.astype(pos.dtype)
+		vel      -= vcen.astype(vel.dtype)
+
+	return pos, vel, mass
+
+def launch(filename, G=6.67e-11, Rmax=2.92668e+17, rsoft=0.0790899, opang=0.0, nbbin=100, types=None, center="density", filetheo=None, nb_proc=4):
+	"""Remplace l'appel au programme Verif : lit le snapshot, le centre, et retourne les profils en mémoire (aucun fichier
+	temporaire, aucun processus lancé).
+
+	Paramètre obligatoire :
+	filename :: nom du snapshot (format 1, 2 ou HDF5, éventuellement splitté).
+
+	Paramètres optionnels :
+	G, Rmax, rsoft, opang, nbbin :: cf. profiles.
+	types    = None       :: type de particules à analyser (tous si None).
+	center   = "density"  :: méthode de centrage ("density" ou "shrink", cf. Gadget.Center), None pour ne pas centrer.
+	filetheo = None       :: fichier des données théoriques à lire en plus (format du programme de conditions initiales).
+	nb_proc  = 4          :: nombre de threads de lecture.
+
+	Valeur de retour :
+		(Mass, Dens, Pot, Distrib, Energie[, données théoriques]), comme exec.DataAnalysis.launch.
+	"""
+	pos, vel, mass = read(filename, types=types, center=center, nb_proc=nb_proc)
+
+	res = profiles(pos, vel, mass, G=G, Rmax=Rmax, rsoft=rsoft, opang=opang, nbbin=nbbin)
+
+	if filetheo:
+		return tuple(res) + (np.array(File.Read_File(filetheo), dtype=np.float64),)
+	return res
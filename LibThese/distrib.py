@@ -3,6 +3,7 @@
 
 import numpy as np
 from   .dir.rw                         import File
+from   .Utils                          import Jacobian as jb
 
 class KingParam:
 	"""Lit les paramètres du modèle de King dans un fichier de paramètre issu du générateur de condition initiale.
@@ -47,15 +48,7 @@ class Distribution:
 	def f_jacobien(self, Pot):
 		"""Calcule le jacobien permettant de passer de f(x, p) à f(E) à partir du potentiel issu de la simulation/du snapshot.
 		"""
-		from scipy.integrate import trapz, simps
-		JAC = []
-		for E in self.Distrib[:,0]:
-			tmp = E - self.King.m*Pot[:,1]
-			tmp = tmp[np.where(tmp > 0.0)]
-			tmp_psi = (4.0 * np.pi)**(2.0) * self.King.m * (Pot[0:len(tmp),0])**(2.0) * np.sqrt( 2.0*self.King.m * tmp)
-			JAC.append(trapz(tmp_psi, x=Pot[0:len(tmp),0]))
-
-		self.Jac = np.array(JAC)
+		self.Jac = jb.jacobian(self.Distrib[:,0], Pot[:,0], Pot[:,1], self.King.m)
 
 	def f_distribtheo(self):
 		"""Retourne la fonction de distribution du modèle de King, 1966. Se sert des paramètres donné dans le fichier fileparam.
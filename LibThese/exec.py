@@ -1,11 +1,14 @@
 # -*- encoding: utf-8 -*-
 
 import os
+import numpy                      as np
 import subprocess	          as sb
 import LibPerso.ListDir.directory as dir
 
 from   shlex		               import split
 from   .dir.rw			       import File
+from   .                               import analysis as an
+from   .Gadget                         import TreeCode as tc
 
 valexec = "valgrind --tool=memcheck --num-callers=40 --leak-check=full --track-origins=yes --show-reachable=yes ./../../Verif"
 
@@ -67,7 +70,7 @@ def exec_list(motif, G=6.67e-11, Rmax=2.92668e+17, rsoft=0.0790899, nbbin=100, v
 class DataAnalysis:
 	"""Exécute le programme d'analyse sur les données ainsi crée."""
 
-	def __init__(self, filename, G=6.67e-11, Rmax=2.92668e+17, rsoft=0.0790899, opang=0.0, nbbin=100, types=4, periodic=False, vexec="Verif", SeeErr = True, SeeOut = True, filetheo="King_dim.log", Other=""):
+	def __init__(self, filename, G=6.67e-11, Rmax=2.92668e+17, rsoft=0.0790899, opang=0.0, nbbin=100, types=4, periodic=False, vexec=None, SeeErr = True, SeeOut = True, filetheo="King_dim.log", Other=""):
 		self.filename = filename
 		self.G        = G
 		self.Rmax     = Rmax
@@ -82,7 +85,7 @@ class DataAnalysis:
 		self.filetheo = filetheo
 		self.Other    = Other
 
-	def launch(filename, G=6.67e-11, Rmax=2.92668e+17, rsoft=0.0790899, opang=0.0, nbbin=100, types=4, periodic=False, vexec="Verif", SeeErr = True, SeeOut = True, filetheo="King_dim.log", Other=""):
+	def launch(filename, G=6.67e-11, Rmax=2.92668e+17, rsoft=0.0790899, opang=0.0, nbbin=100, types=4, periodic=False, vexec=None, SeeErr = True, SeeOut = True, filetheo="King_dim.log", Other=""):
 		"""Lance le code. Retourne les résultats sous forme de np.array.
 
 		ATTENTION : Modification de l'interface du programme. La fonction peut arrêter de fonctionner à tout moment.
@@ -95,7 +98,9 @@ class DataAnalysis:
 		Rmax     = 2.92668e+17     :: Rayon au-delà duquel les particules sont ignorés.
 		rsoft    = 0.0790899       :: paramètre de lissage à utiliser lors du calcul du potentiel, en parsec.
 		nbbin    = 100             :: nombre de bin à utiliser pour les quantités nécessitant des histogrammes (fonction de distribution, densité, jacobien, ...).
-		vexec    = "./../../Verif" :: chemin vers l'exécutable du programme.
+		vexec    = None            :: chemin vers l'exécutable du programme, None pour l'analyse dans le processus (cf. analysis.launch,
+		                              qui ne lit que les particules de type types, sans fichier temporaire).
+		                              Le défaut était "Verif" : passer vexec="Verif" pour retrouver l'ancien comportement.
 		filetheo = "King_dim.log"  :: fichier contenant les données théoriques au format :., non chargé si 'None'.
 		SeeErr   = True		   :: Voir la sortie d'erreur.
 		SeeOut   = True            :: Voir la sortie standard.
@@ -111,6 +116,9 @@ class DataAnalysis:
 
 		print("G :: %g\nRmax :: %g\nSoftening :: %g\nNbBin :: %d\n"%(G, Rmax, rsoft, nbbin))
 
+		if vexec is None:
+			return tuple(an.launch(filename, G=G, Rmax=Rmax, rsoft=rsoft, opang=opang, nbbin=nbbin, types=types, filetheo=filetheo))
+
 		if SeeErr:
 			tmperr = None
 		else:
@@ -162,17 +170,29 @@ class DataAnalysis:
 					np.array(Energie, dtype=np.float64)
 				)
 
-def BruteForce(filename, G=6.67e-11, Rmax=2.92668e+17, rsoft=0.0790899, nbbin=100, vexec="./../../BruteForce"):
+def BruteForce(filename, G=6.67e-11, Rmax=2.92668e+17, rsoft=0.0790899, nbbin=100, vexec=None):
 	"""Lance le code. Retourne les résultats sous forme de np.array.
+
+	Avec vexec = None (défaut), le potentiel est calculé dans le processus par sommation directe (cf. Gadget.TreeCode.direct)
+	et retourné pour chaque particule, trié en rayon. Le défaut était "./../../BruteForce" : passer ce chemin pour retrouver
+	l'ancien comportement (programme externe, fichier Potentiel-bf.dat).
 	"""
 
 	print("G :: %g\nRmax :: %g\nSoftening :: %g\nNbBin :: %d\n"%(G, Rmax, rsoft, nbbin))
+	if vexec is None:
+		pos, _, mass = an.read(filename)
+		r            = np.sqrt(np.sum(pos.astype(np.float64)**2, axis=1))
+		if Rmax > 0.0:
+			pos, mass, r = pos[r <= Rmax], mass[r <= Rmax], r[r <= Rmax]
+		phi, _       = tc.direct(pos, mass, G=G, rsoft=rsoft, acc=False)
+		order        = np.argsort(r)
+		return np.column_stack((r[order], phi[order]))
+
 	os.system(vexec + " " + filename + " " + str(G) + " " + str(Rmax) + " " + str(rsoft) + " " + str(nbbin))
 
-	Potentiel = Read_File("Potentiel-bf.dat")
+	Potentiel = File.Read_File("Potentiel-bf.dat")
 
 	Potentiel.sort(key=lambda t: t[0])
 
 	return np.array(Potentiel, dtype=np.float64)
 
-
@@ -13,6 +13,9 @@ from   shlex		               import split
 from   numpy                           import pi
 from   matplotlib.backends.backend_pdf import PdfPages
 from   .dir.rw                         import File
+from   .Utils                          import Binned as bn
+from   .Utils                          import Jacobian as jb
+from   .                               import analysis as an
 
 """
 Module de gestion des données de simulation.
@@ -79,19 +82,7 @@ def f_jacobien(E, Pot, m):
 	Valeur de retour :
 	np.array contenant le jacobien, de même taille que E.
 	"""
-	from scipy.integrate import trapz
-	JAC = []
-	for nbE in E[:]:
-		tmp = nbE - m*Pot[:,1]
-		i = 0
-		for j in tmp:
-			i += 1
-			if j < 0.0:
-				break
-		tmp_psi = (4.0 * np.pi)**(2.0) * m * (Pot[0:i-1,0])**(2.0) * np.sqrt( 2.0*m * tmp[0:i-1])
-		JAC.append(trapz(tmp_psi, x=Pot[0:i-1,0]))
-
-	return np.array(JAC)
+	return jb.jacobian(E, Pot[:,0], Pot[:,1], m)
 
 def plotDistrib(Distrib, Pot, m, prefix="", fileparam="ci_param.dat", suppose = False, info=""):
 	"""Calcul la distribution d'énergie théorique et la distribution de la simulation,
@@ -469,6 +460,9 @@ def PlotCarte(name="Particule-it.dat", Part=None, prefix="", pp=None, save=False
 
 	#FieldRange = [[center - BoxSize/2.0, center + BoxSize/2.0], [center - BoxSize/2.0, center + BoxSize/2.0]]
 
+	# Les trois plans en une passe, les indices des bins n'étant calculés qu'une fois par axe :
+	hists = bn.projections(Part[:, 0:3], bins=nbbin)
+
 	Carte1 = plt.figure(prefix + "Carte xOy")
 	axCar1 = Carte1.add_subplot(111)
 
@@ -476,7 +470,7 @@ def PlotCarte(name="Particule-it.dat", Part=None, prefix="", pp=None, save=False
 	axCar1.set_xlabel(r'$x$ en $m$')
 	axCar1.set_ylabel(r'$y$ en $m$')
 
-	hist, X, Y = np.histogram2d(Part[:,0], Part[:,1], bins=nbbin)#, range=FieldRange)
+	hist, X, Y = hists[(0, 1)]
 
 	axCar1.axis([np.min(Part[:,0]), np.max(Part[:,0]), np.min(Part[:,1]), np.max(Part[:,1])])
 	tmp = axCar1.pcolor(X, Y, hist.T)
@@ -505,7 +499,7 @@ def PlotCarte(name="Particule-it.dat", Part=None, prefix="", pp=None, save=False
 	axCar2.set_xlabel(r'$x$ en $m$')
 	axCar2.set_ylabel(r'$z$ en $m$')
 
-	hist, X, Y = np.histogram2d(Part[:,0], Part[:,2], bins=nbbin)#, range=FieldRange)
+	hist, X, Y = hists[(0, 2)]
 
 	axCar2.axis([np.min(Part[:,0]), np.max(Part[:,0]), np.min(Part[:,2]), np.max(Part[:,2])])
 	tmp = axCar2.pcolor(X, Y, hist.T)
@@ -535,7 +529,7 @@ def PlotCarte(name="Particule-it.dat", Part=None, prefix="", pp=None, save=False
 	axCar3.set_xlabel(r'$y$ en $m$')
 	axCar3.set_ylabel(r'$z$ en $m$')
 
-	hist, X, Y = np.histogram2d(Part[:,1], Part[:,2], bins=nbbin)#, range=FieldRange)
+	hist, X, Y = hists[(1, 2)]
 
 	axCar3.axis([np.min(Part[:,1]), np.max(Part[:,1]), np.min(Part[:,2]), np.max(Part[:,2])])
 	tmp = axCar3.pcolor(X, Y, hist.T)
@@ -635,12 +629,13 @@ def SuperposDensity(list_file, title, xlim=[0.07, 7], ylim=None, Other=""):
 	title            :: Titre du graphique.
 	xlim = [0.07, 7] :: Borne du graphique en x.
 	ylim = None      :: Borne du graphique en y. Utilise par défaut les maximum et minimum sur toutes les courbes
-	Other = ""       :: Paramètres en plus à passer au programme de Vérification.
+	Other = ""       :: Paramètres en plus qui étaient passés au programme de Vérification (ignorés, l'analyse est faite par analysis.launch).
 	"""
 	m = []
 	r = []
 	for fich in list_file:
-		tmp1, tmp2, _, _, _ = launch(fich, rsoft=0.0, opang=0.5, filetheo=None, Rmax=-1.0, vexec="/home/plum/Documents/These/src/VerificationTree/Verif", Other=Other)
+		# Seules les deux premières colonnes servent : opang=0.0, le potentiel du profil de masse évite le code en arbre.
+		tmp1, tmp2, _, _, _ = an.launch(fich, rsoft=0.0, opang=0.0, filetheo=None, Rmax=-1.0)
 		m.append(tmp1)
 		r.append(tmp2)
 
@@ -9,11 +9,15 @@ import argparse as ap
 from glob import glob
 from os import path as p
 from LibThese import Data as d
+from LibThese.Utils import Derived as dv
+from LibThese.Gadget import Center as ce
 from InitialCond import Gadget as g
 
 
 class Analyse(object):
-    def __init__(self, hdf, gadget, RSelect=10., substract=True):
+    def __init__(self, hdf, gadget, RSelect=10., substract=True, center=None):
+        self._der = None
+
         # We are getting the information about the density center:
         hdf5 = d.Data(hdf)
 
@@ -36,9 +40,13 @@ class Analyse(object):
         vel = gadget.Part.NumpyVelocities.copy()
         ide = gadget.Part.NumpyIdentities
 
-        tmp_r = np.sum(pos**2, axis=1)
-        id_p_sort1 = np.argsort(tmp_r)
-        id_p_sort1 = id_p_sort1[ tmp_r[id_p_sort1] <= RSelect ** 2. ]
+        if center in ce.methods:
+            # Native center instead of the one of Verif stored in the hdf5 file:
+            p_cg, v_cg = ce.find_center(pos, vel, method=center, key=dv.snapshot_key(_name))
+            logging.debug("Center of %s (%s): %s %s" % (_name, center, p_cg, v_cg))
+
+        # Sélection en rayon sans trier tous les rayons (l'ordre est refait par identité ensuite) :
+        id_p_sort1 = np.flatnonzero( dv.Derived(pos).r2 <= RSelect ** 2. )
 
         pos = pos[id_p_sort1]
         vel = vel[id_p_sort1]
@@ -66,14 +74,21 @@ class Analyse(object):
         gadget.Part.Release()
         del gadget, hdf5
 
+    @property
+    def derived(self):
+        # r, v et v_r calculés une seule fois (cf. LibThese.Utils.Derived) :
+        if self._der is None:
+            self._der = dv.Derived(self._p, self._v)
+        return self._der
+
     def get_r2(self):
-        return np.sum(self.pos[:]**2, axis=1)
+        return self.derived.r2
 
     def get_v2(self):
-        return np.sum(self.vel[:]**2, axis=1)
+        return self.derived.v2
 
     def get_vr(self):
-        return np.sum(self.pos * self.vel, axis=1) / np.sqrt( self.get_r2() )
+        return self.derived.vr
 
     @property
     def time(self):
@@ -85,6 +100,7 @@ class Analyse(object):
     @pos.setter
     def pos(self, val):
         self._p = val
+        self._der = None
 
     @property
     def vel(self):
@@ -92,10 +108,13 @@ class Analyse(object):
     @vel.setter
     def vel(self, val):
         self._v = val
+        self._der = None
 
 
 class Object(object):
     def __init__(self, file, center, time=None, ids=None, substract=True):
+        self._der = None
+
         p_cg = center[:3]
         v_cg = center[3:]
 
@@ -119,14 +138,21 @@ class Object(object):
         gadget.Part.Release()
         del gadget
 
+    @property
+    def derived(self):
+        # r, v et v_r calculés une seule fois (cf. LibThese.Utils.Derived) :
+        if self._der is None:
+            self._der = dv.Derived(self._p, self._v)
+        return self._der
+
     def get_r2(self):
-        return np.sum(self.pos[:]**2, axis=1)
+        return self.derived.r2
 
     def get_v2(self):
-        return np.sum(self.vel[:]**2, axis=1)
+        return self.derived.v2
 
     def get_vr(self):
-        return np.sum(self.pos * self.vel, axis=1) / np.sqrt( self.get_r2() )
+        return self.derived.vr
 
     @property
     def time(self):
@@ -138,6 +164,7 @@ class Object(object):
     @pos.setter
     def pos(self, val):
         self._p = val
+        self._der = None
 
     @property
     def vel(self):
@@ -145,6 +172,7 @@ class Object(object):
     @vel.setter
     def vel(self, val):
         self._v = val
+        self._der = None
 
 
 def CreateArgument():
@@ -184,6 +212,13 @@ def CreateArgument():
             help="Substract density center information."
     )
 
+    parser.add_argument(
+            "--center",
+            choices=ce.methods,
+            default=None,
+            help="Compute the center natively (shrinking sphere or density weighted) instead of reading it from the HDF5 file."
+    )
+
     parser.add_argument(
             "--log",
             type=str,
@@ -237,7 +272,7 @@ if __name__ == '__main__':
     centers = GatherData(args.hdf5, *args.Gadget)
 
     for f in args.Gadget:
-        calc = Analyse(args.hdf5, f, RSelect=args.RSelect) #, substract=args.not_remove_dc)
+        calc = Analyse(args.hdf5, f, RSelect=args.RSelect, center=args.center) #, substract=args.not_remove_dc)
         v_r2 = calc.get_vr() ** 2
         v_t2 = calc.get_v2() - v_r2
 
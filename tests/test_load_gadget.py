@@ -0,0 +1,86 @@
+# -*- coding:Utf8 -*-
+
+"""Lecture par type de particule d'un snapshot Gadget (format 1) dont certains types sont vides."""
+
+import numpy as np
+import pytest
+
+from LibThese.Gadget import load_gadget as lg
+
+NPART = (0, 10, 0, 0, 4, 0)
+
+def _record(f, data):
+	raw = np.ascontiguousarray(data).tobytes()
+	np.array([len(raw)], dtype=np.int32).tofile(f)
+	f.write(raw)
+	np.array([len(raw)], dtype=np.int32).tofile(f)
+
+def _write(name, npart, nall=None, numfiles=1, massarr=(0., 1., 0., 0., 1., 0.), seed=0, u=None):
+	N   = sum(npart)
+	rng = np.random.default_rng(seed)
+
+	head = np.zeros(1, dtype=lg.header_dtype)
+	head["head"]     = head["tail"] = 256
+	head["Npart"]    = npart
+	head["Nall"]     = npart if nall is None else nall
+	head["Massarr"]  = massarr
+	head["NumFiles"] = numfiles
+
+	pos  = rng.normal(size=(N, 3)).astype(np.float32)
+	vel  = rng.normal(size=(N, 3)).astype(np.float32)
+	ids  = np.arange(1, N + 1, dtype=np.int32)
+
+	with open(name, "wb") as f:
+		f.write(head.tobytes())
+		for data in (pos, vel, ids) + (() if u is None else (u,)):
+			_record(f, data)
+
+	return pos, vel, ids
+
+@pytest.fixture
+def snapshot(tmp_path):
+	name = str(tmp_path / "snap_000")
+	return (name,) + _write(name, NPART)
+
+@pytest.mark.parametrize("reader", [lg.ReadGadget, lg.MapGadget])
+@pytest.mark.parametrize("ptype", [ t for t, n in enumerate(NPART) if n == 0 ])
+def test_absent_type(snapshot, reader, ptype):
+	name = snapshot[0]
+	rdg  = reader(name, ptype=ptype, cache_index=False)
+
+	# ReadGadget renvoie des tableaux à plat, comme pour le fichier entier.
+	assert np.reshape(rdg.get_positions(), (-1, 3)).shape == (0, 3)
+	assert np.reshape(rdg.get_velocities(), (-1, 3)).shape == (0, 3)
+	assert rdg.get_identities().shape == (0,)
+
+def test_present_type(snapshot):
+	name, pos, vel, ids = snapshot
+	rdg = lg.ReadGadget(name, ptype=4, cache_index=False)
+
+	assert np.array_equal(np.reshape(rdg.get_positions(), (-1, 3)), pos[10:])
+	assert np.array_equal(np.reshape(rdg.get_velocities(), (-1, 3)), vel[10:])
+	assert np.array_equal(rdg.get_identities(), ids[10:])
+
+@pytest.mark.parametrize("reader", [lg.ReadGadget, lg.MapGadget])
+@pytest.mark.parametrize("ptype", [1, 4])
+def test_constant_mass_without_block(snapshot, reader, ptype):
+	# Massarr[ptype] != 0 et pas de bloc de masse, header pas encore lu :
+	rdg  = reader(snapshot[0], ptype=ptype, cache_index=False)
+	mass = rdg.get_masses()
+
+	assert mass.shape == (NPART[ptype],)
+	assert np.all(mass == 1.)
+
+def test_split_gas_only_block(tmp_path):
+	# "u" n'existe que pour le gaz : les autres types doivent être vides, pas de la mémoire non initialisée.
+	name  = str(tmp_path / "snap_001")
+	npart = [(3, 5, 0, 0, 0, 0), (2, 4, 0, 0, 0, 0)]
+	nall  = np.sum(npart, axis=0)
+	u     = [ np.arange(n[0], dtype=np.float32) + 10. * i for i, n in enumerate(npart) ]
+	for i, n in enumerate(npart):
+		_write(name + ".%d" % i, n, nall=nall, numfiles=2, massarr=(1.,) * 6, seed=i, u=u[i])
+
+	_, data = lg.read_snapshot(name, fields=("u",), nb_proc=2)
+
+	assert np.array_equal(data["u"][0], np.concatenate(u))
+	assert all( len(data["u"][t]) == 0 for t in range(1, 6) )